@@ -0,0 +1,149 @@
+# bench_callback_latency.py
+"""
+按钮点击延迟对比：置顶/通知作者在点击路径上同步等待 vs 交给后台任务池
+
+使用模拟的 Bot (每次 API 调用固定延迟)，在临时目录的数据库上对一批帖子各点一次赞，
+每次点击都让帖子跨过自动置顶门槛，因此都会触发"置顶 + 通知作者"两次 API 调用。
+
+用法: python bench_callback_latency.py [--posts 50] [--latency-ms 80]
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import tempfile
+import time
+from types import SimpleNamespace
+
+# 导入 config 需要这些环境变量，基准测试不会真正连接 Telegram
+for _key, _value in {
+    "TOKEN": "0:bench", "ADMIN_GROUP_ID": "-1", "CHANNEL_ID": "-1001",
+    "CHANNEL_USERNAME": "bench", "DISCUSSION_GROUP_ID": "-2", "BOT_USERNAME": "bench_bot",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+import handlers.channel_interact as channel_interact
+from handlers.callback_router import CallbackAction, Kind, encode_callback
+from handlers.channel_interact import HOT_POST_LIKES, handle_channel_interaction
+from services.background import background_tasks
+from services.edit_coalescer import edit_coalescer
+from services.write_queue import toggle_writer
+from storage import storage, ToggleIntent
+
+
+class FakeBot:
+    """每个 API 调用都 sleep 固定延迟，并记录调用次数"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.calls = {}
+
+    async def _call(self, method: str):
+        self.calls[method] = self.calls.get(method, 0) + 1
+        await asyncio.sleep(self.latency)
+
+    async def edit_message_caption(self, **kwargs):
+        await self._call("edit_message_caption")
+
+    async def pin_chat_message(self, **kwargs):
+        await self._call("pin_chat_message")
+
+    async def send_message(self, **kwargs):
+        await self._call("send_message")
+
+    async def get_chat(self, chat_id):
+        await self._call("get_chat")
+        return SimpleNamespace(full_name=f"用户{chat_id}", username=None)
+
+
+class InlineRunner:
+    """模拟改动前的行为：副作用在点击处理器里直接 await"""
+
+    def __init__(self):
+        self.factories = []
+
+    def spawn(self, name, factory, key=None):
+        self.factories.append(factory)
+        return True
+
+
+def make_update(bot: FakeBot, message_id: int, user_id: int):
+    async def answer(*args, **kwargs):
+        await bot._call("answer_callback_query")
+
+    query = SimpleNamespace(
+        data=encode_callback(Kind.LIKE, message_id),
+        answer=answer,
+        from_user=SimpleNamespace(id=user_id, full_name=f"用户{user_id}"),
+        message=SimpleNamespace(message_id=message_id, caption_html="帖子", reply_markup=None),
+    )
+    return SimpleNamespace(callback_query=query)
+
+
+async def seed(first_message_id: int, posts: int) -> None:
+    """每个帖子预先点到门槛减一，下一次点赞就会触发置顶"""
+    for message_id in range(first_message_id, first_message_id + posts):
+        await storage.add_submission(1, "作者", message_id, f"帖子 {message_id}")
+        await storage.apply_toggles([
+            ToggleIntent("react", message_id, 10_000 + i, 1, "") for i in range(HOT_POST_LIKES - 1)
+        ])
+
+
+async def run_mode(bot: FakeBot, first_message_id: int, posts: int, inline: bool) -> list:
+    context = SimpleNamespace(bot=bot)
+    runner = InlineRunner()
+    channel_interact.background_tasks = runner if inline else background_tasks
+    latencies = []
+    try:
+        for message_id in range(first_message_id, first_message_id + posts):
+            update = make_update(bot, message_id, 99)
+            start = time.perf_counter()
+            await handle_channel_interaction(update, context, CallbackAction(Kind.LIKE, (message_id,)))
+            while runner.factories:
+                await runner.factories.pop()()
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        channel_interact.background_tasks = background_tasks
+    return latencies
+
+
+def summarize(name: str, latencies: list) -> None:
+    ordered = sorted(latencies)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{name:<12} n={len(ordered):<4} p50={statistics.median(ordered):7.1f}ms  "
+          f"p95={p95:7.1f}ms  max={ordered[-1]:7.1f}ms")
+
+
+async def main(posts: int, latency_ms: float) -> None:
+    workdir = tempfile.mkdtemp(prefix="bench_callback_")
+    os.chdir(workdir)  # DB_NAME 是相对路径，数据库建在临时目录里
+    await storage.open()
+    await storage.migrate()
+    toggle_writer.start()
+    bot = FakeBot(latency_ms / 1000)
+    try:
+        await seed(1, posts)
+        await seed(1 + posts, posts)
+
+        inline = await run_mode(bot, 1, posts, inline=True)
+        background = await run_mode(bot, 1 + posts, posts, inline=False)
+        await background_tasks.stop()
+        await edit_coalescer.flush()
+    finally:
+        await toggle_writer.stop()
+        await storage.close()
+
+    print(f"模拟 API 延迟 {latency_ms:.0f}ms，{posts} 次触发置顶的点赞")
+    summarize("同步等待", inline)
+    summarize("后台任务池", background)
+    print(f"API 调用: {bot.calls}")
+    print(f"数据库: {os.path.join(workdir, 'submissions.db')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=80)
+    args = parser.parse_args()
+    asyncio.run(main(args.posts, args.latency_ms))
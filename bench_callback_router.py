@@ -0,0 +1,178 @@
+# bench_callback_router.py
+"""
+按钮回调分发开销对比：逐个正则匹配的 CallbackQueryHandler + split 解析 vs 统一路由 + 紧凑编码
+
+不连接 Telegram、不执行业务处理器，只测量"找到处理器并解析出参数"这一段：
+对一批随机生成的按钮点击 (频道点赞/踩/收藏/评论区、审核通过/拒绝、私聊翻页)，
+分别用改动前的处理器列表和 CallbackRouter 生成的处理器找到第一个匹配的处理器并解析参数。
+
+用法: python bench_callback_router.py [--updates 20000] [--posts 500] [--rounds 5]
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+
+from telegram import Update
+from telegram.ext import CallbackQueryHandler
+
+# 导入 handlers 需要这些环境变量，基准测试不会真正连接 Telegram
+for _key, _value in {
+    "TOKEN": "0:bench", "ADMIN_GROUP_ID": "-1", "CHANNEL_ID": "-1001",
+    "CHANNEL_USERNAME": "bench", "DISCUSSION_GROUP_ID": "-2", "BOT_USERNAME": "bench_bot",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+from handlers.callback_router import CHANNEL_KINDS, CallbackRouter, Kind, decode_callback, encode_callback
+
+
+async def _noop(update, context, action=None):
+    return None
+
+
+def legacy_handlers():
+    """改动前 main.py 中的注册顺序 (私聊按钮取 CHOOSING/BROWSING 状态，按钮在顶层处理器之前检查)"""
+    return [
+        CallbackQueryHandler(_noop, pattern='^submit_post$'),
+        CallbackQueryHandler(_noop, pattern='^my_posts_page:'),
+        CallbackQueryHandler(_noop, pattern='^my_collections_page:'),
+        CallbackQueryHandler(_noop, pattern='^back_to_main$'),
+        CallbackQueryHandler(_noop, pattern='^approve:'),
+        CallbackQueryHandler(_noop, pattern='^decline:'),
+        CallbackQueryHandler(_noop, pattern='^(react|collect|comment)'),
+    ]
+
+
+def legacy_parse(data: str):
+    """改动前各处理器里的 split 解析"""
+    parts = data.split(':')
+    if parts[0] in ('approve', 'decline'):
+        return (int(parts[1]), int(parts[2]))
+    if parts[0].endswith('_page'):
+        if len(parts) < 5:
+            return (int(parts[1]),)
+        return (int(parts[1]), parts[2], int(parts[3]), int(parts[4]))
+    if parts[0] in ('react', 'comment'):
+        return (parts[1],)
+    return (parts[0],)
+
+
+def router_handlers():
+    router = CallbackRouter()
+    for kind in Kind:
+        router.route(kind, _noop)
+    return [
+        router.handler(Kind.SUBMIT_POST, Kind.MY_POSTS_PAGE, Kind.MY_COLLECTIONS_PAGE, Kind.BACK_TO_MAIN),
+        router.handler(Kind.APPROVE, Kind.DECLINE, *CHANNEL_KINDS),
+    ]
+
+
+def synthetic_clicks(count: int, posts: int, seed: int):
+    """返回 (旧格式, 紧凑格式) 两组相同动作的点击；帖子热度近似 Zipf 分布，大部分点击落在频道"""
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, posts + 1)]
+    post_ids = [10_000 + i for i in range(posts)]
+    legacy, compact = [], []
+    for _ in range(count):
+        roll = rng.random()
+        message_id = rng.choices(post_ids, weights)[0]
+        if roll < 0.55:
+            kind = rng.choice([Kind.LIKE, Kind.LIKE, Kind.LIKE, Kind.DISLIKE])
+            data = f"react:{'like' if kind == Kind.LIKE else 'dislike'}:{message_id}"
+            fields = (message_id,)
+        elif roll < 0.65:
+            kind, data, fields = Kind.COLLECT, f"collect:{message_id}", (message_id,)
+        elif roll < 0.8:
+            sub = rng.choice(["show", "refresh", "hide"])
+            kind = {"show": Kind.COMMENT_SHOW, "refresh": Kind.COMMENT_REFRESH, "hide": Kind.COMMENT_HIDE}[sub]
+            data, fields = f"comment:{sub}:{message_id}", (message_id,)
+        elif roll < 0.85:
+            kind = rng.choice([Kind.APPROVE, Kind.DECLINE])
+            user_id, submission_id = rng.randint(10 ** 8, 8 * 10 ** 9), rng.randint(1, 10 ** 6)
+            data, fields = f"{kind.name.lower()}:{user_id}:{submission_id}", (user_id, submission_id)
+        else:
+            kind = rng.choice([Kind.MY_POSTS_PAGE, Kind.MY_COLLECTIONS_PAGE, Kind.BACK_TO_MAIN])
+            if kind == Kind.BACK_TO_MAIN:
+                data, fields = "back_to_main", ()
+            else:
+                page, direction = rng.randint(2, 40), rng.choice("np")
+                ts, row_id = rng.randint(1_600_000_000, 1_800_000_000), rng.randint(1, 10 ** 7)
+                prefix = "my_posts_page" if kind == Kind.MY_POSTS_PAGE else "my_collections_page"
+                data = f"{prefix}:{page}:{direction}:{ts}:{row_id}"
+                fields = (page, 1 if direction == 'p' else 0, ts, row_id)
+        legacy.append(data)
+        compact.append(encode_callback(kind, *fields))
+    return legacy, compact
+
+
+def to_updates(datas):
+    user = {"id": 7, "is_bot": False, "first_name": "u7"}
+    return [
+        Update.de_json({
+            "update_id": i,
+            "callback_query": {"id": str(i), "from": user, "chat_instance": "1", "data": data},
+        }, None)
+        for i, data in enumerate(datas)
+    ]
+
+
+def run_legacy(handlers, updates) -> float:
+    start = time.perf_counter()
+    for update in updates:
+        for handler in handlers:
+            if handler.check_update(update):
+                legacy_parse(update.callback_query.data)
+                break
+    return time.perf_counter() - start
+
+
+def run_router(handlers, updates, cached: bool) -> float:
+    if not cached:
+        decode_callback.cache_clear()
+    start = time.perf_counter()
+    for update in updates:
+        for handler in handlers:
+            if handler.check_update(update):
+                decode_callback(update.callback_query.data)
+                break
+    return time.perf_counter() - start
+
+
+def report(name: str, seconds: list, count: int, baseline: float = 0.0) -> float:
+    best = min(seconds)
+    per_update = best / count * 1e6
+    speedup = f"  ({baseline / per_update:.2f}x)" if baseline else ""
+    print(f"{name:<20} {per_update:7.2f} µs/更新  (中位数 {statistics.median(seconds) / count * 1e6:7.2f}){speedup}")
+    return per_update
+
+
+def main(count: int, posts: int, rounds: int) -> None:
+    legacy_data, compact_data = synthetic_clicks(count, posts, seed=19)
+    legacy_updates, compact_updates = to_updates(legacy_data), to_updates(compact_data)
+    old, new = legacy_handlers(), router_handlers()
+
+    results = {
+        "正则 + split": [run_legacy(old, legacy_updates) for _ in range(rounds)],
+        "路由 + 旧格式": [run_router(new, legacy_updates, cached=True) for _ in range(rounds)],
+        "路由 + 紧凑格式": [run_router(new, compact_updates, cached=True) for _ in range(rounds)],
+        "路由 + 紧凑 (冷缓存)": [run_router(new, compact_updates, cached=False) for _ in range(rounds)],
+    }
+
+    print(f"{count} 次点击，{posts} 个帖子，取 {rounds} 轮中最快的一轮")
+    baseline = 0.0
+    for name, seconds in results.items():
+        per_update = report(name, seconds, count, baseline)
+        baseline = baseline or per_update
+    print(f"callback_data 平均长度: 旧格式 {statistics.mean(map(len, legacy_data)):.1f} 字节，"
+          f"紧凑格式 {statistics.mean(map(len, compact_data)):.1f} 字节")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--updates", type=int, default=20000)
+    parser.add_argument("--posts", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+    main(args.updates, args.posts, args.rounds)
@@ -0,0 +1,634 @@
+# bench_dataset.py
+"""
+大数据量下的 SQL 基准：合成数据集生成器 + 逐条语句的延迟和执行计划
+
+线上的 reactions / comments 已经有数百万行，小库上看不出来的索引问题和排序开销只有在这种规模下才会出现。
+
+generate  在迁移后的 schema 中填入分布接近线上的数据：
+          - 帖子热度服从 Zipf 分布 (少数热帖拿走大部分点赞、评论和收藏)
+          - 投稿人和互动用户的活跃度都是重尾分布 (Pareto)，少数人发了大部分帖子
+          - 帖子时间跨越多年，频道越来越活跃；互动集中在发帖后的几小时内，也有很久以后的长尾
+          - post_stats、users、通知发件箱 (大部分已发送，少量待发送/失败) 和置顶记录与之一致
+          批量写入前先删除索引，写完再重建；默认不执行 ANALYZE (线上库也没有 sqlite_stat1)
+
+run       对 storage/sqlite.py 和 post_stats.py 中的每一条 SQL 常量，按线上的访问分布抽取参数
+          (热帖被点得更多、发帖多的人翻页更多) 执行若干次，报告 p50/p95/p99/最大延迟、返回行数和执行计划；
+          另外用最坏情况的参数 (最热的帖子、发帖最多的人) 单独测一次。
+          写语句在事务中执行后回滚，数据集保持不变。新增的 SQL 常量没有登记测试用例时会列出来。
+
+延迟用同步的 sqlite3 模块测量 (连接参数与线上一致)，只包含 SQL 本身，不含 aiosqlite 的线程切换。
+
+用法: python bench_dataset.py generate [--db bench_dataset.db] [--scale 1.0] [--years 3] [--zipf 1.0]
+                                       [--seed 22] [--analyze]
+      python bench_dataset.py run [--db bench_dataset.db] [--samples 300] [--only 名称片段]
+                                  [--output bench_dataset.json] [--baseline old.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from collections import Counter
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+# 导入 config 需要这些环境变量，基准测试不会连接 Telegram
+for _key, _value in {
+    "TOKEN": "123456:bench", "ADMIN_GROUP_ID": "-1002", "CHANNEL_ID": "-1001",
+    "CHANNEL_USERNAME": "bench", "DISCUSSION_GROUP_ID": "-1003", "BOT_USERNAME": "bench_bot",
+}.items():
+    os.environ.setdefault(_key, _value)
+
+import post_stats
+import storage.sqlite as sqlite_storage
+from config import DB_CACHE_SIZE_KB, DB_MMAP_SIZE
+from migrations import plan_problems, run_migrations
+from storage.sqlite import MAX_CURSOR_TS, DatabasePool
+
+# scale = 1.0 时各表的目标行数
+BASE_ROWS = {
+    "users": 200_000,
+    "submissions": 60_000,
+    "reactions": 3_000_000,
+    "comments": 1_000_000,
+    "collections": 400_000,
+}
+# 发过帖子的用户比例
+POSTER_SHARE = 0.15
+# 点赞占全部 reactions 的比例
+LIKE_SHARE = 0.85
+# 写入通知发件箱的互动比例 (其余是自己的帖子或发件箱上线前的互动)
+NOTIFY_SHARE = 0.3
+# 最近这么多秒内的通知仍是待发送
+PENDING_WINDOW = 600
+
+_BATCH = 100_000
+_TEXT_POOL = "".join(chr(0x4E00 + (i * 7919) % 20000) for i in range(8192)) + " 今天天气不错，来分享一下。" * 64
+_NAMES = ["小明", "Alice", "阿强", "Bob", "小红", "Carol", "老王", "Dave", "小李", "Eve"]
+
+
+class Population:
+    """按权重抽样的 ID 集合 (预先计算累积权重，random.choices 用二分查找抽样)"""
+
+    def __init__(self, ids: list, weights: list):
+        self.ids = ids
+        self.cum_weights = list(itertools.accumulate(weights))
+
+    def sample(self, rng: random.Random, k: int) -> list:
+        return rng.choices(self.ids, cum_weights=self.cum_weights, k=k)
+
+    def one(self, rng: random.Random):
+        return rng.choices(self.ids, cum_weights=self.cum_weights)[0]
+
+
+def sql_time(ts: int) -> str:
+    """与 CURRENT_TIMESTAMP 相同的 UTC 文本格式"""
+    return time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(ts))
+
+
+def random_text(rng: random.Random, mu: float, sigma: float, cap: int) -> str:
+    length = max(1, min(cap, int(rng.lognormvariate(mu, sigma))))
+    start = rng.randrange(len(_TEXT_POOL) - length) if length < len(_TEXT_POOL) else 0
+    return _TEXT_POOL[start:start + length]
+
+
+def display_name(user_id: int) -> str:
+    return f"{_NAMES[user_id % len(_NAMES)]}{user_id % 1000}"
+
+
+def interactions(rng: random.Random, target: int, posts: Population, users: Population,
+                 post_ts: List[int], end: int, unique: bool) -> List[tuple]:
+    """
+    生成 (帖子序号, 用户 ID, 时间戳)，按时间排序 (与自增 ID 的顺序一致)
+    unique=True 时同一用户对同一帖子只保留一条 (reactions / collections 的唯一约束)；
+    热帖的互动用户有限，达到上限后多抽的样本直接丢弃
+    """
+    rows, seen, attempts = [], set(), 0
+    while len(rows) < target and attempts < target * 3:
+        k = min(_BATCH, target - len(rows))
+        attempts += k
+        for post, user in zip(posts.sample(rng, k), users.sample(rng, k)):
+            if unique:
+                key = (post << 34) | user
+                if key in seen:
+                    continue
+                seen.add(key)
+            # 大部分互动在发帖后几小时内，长尾延续到很久以后
+            ts = min(end, post_ts[post] + int(rng.paretovariate(1.2) * 300))
+            rows.append((post, user, ts))
+    rows.sort(key=lambda row: row[2])
+    return rows
+
+
+def _insert(conn: sqlite3.Connection, sql: str, rows) -> None:
+    iterator = iter(rows)
+    while True:
+        batch = list(itertools.islice(iterator, _BATCH))
+        if not batch:
+            return
+        conn.executemany(sql, batch)
+
+
+async def _migrate(path: str) -> int:
+    pool = DatabasePool(path, reader_count=1)
+    await pool.open()
+    try:
+        return await run_migrations(pool)
+    finally:
+        await pool.close()
+
+
+def generate(args: argparse.Namespace) -> None:
+    if os.path.exists(args.db):
+        sys.exit(f"❌ {args.db} 已存在，请先删除或换一个路径")
+    started = time.perf_counter()
+    rng = random.Random(args.seed)
+    target = {table: max(10, int(rows * args.scale)) for table, rows in BASE_ROWS.items()}
+    end = int(time.time())
+    begin = end - int(args.years * 365 * 86400)
+
+    version = asyncio.run(_migrate(args.db))
+    print(f"schema 版本 v{version}，目标行数: {target}")
+
+    # 用户：活跃度为重尾分布，其中一部分发过帖子 (发帖量同样是重尾分布)
+    user_ids = rng.sample(range(10 ** 8, 8 * 10 ** 9), target["users"])
+    users = Population(user_ids, [rng.paretovariate(1.2) for _ in user_ids])
+    poster_ids = user_ids[:max(1, int(len(user_ids) * POSTER_SHARE))]
+    posters = Population(poster_ids, [rng.paretovariate(1.1) for _ in poster_ids])
+
+    # 帖子：频道越来越活跃 (发帖密度随时间线性增长)，热度排名随机分配后按 Zipf 取权重
+    post_count = target["submissions"]
+    post_ts = sorted(begin + int((end - begin) * rng.random() ** 0.5) for _ in range(post_count))
+    message_ids = [1000 + i for i in range(post_count)]
+    authors = posters.sample(rng, post_count)
+    ranks = list(range(1, post_count + 1))
+    rng.shuffle(ranks)
+    posts = Population(list(range(post_count)), [rank ** -args.zipf for rank in ranks])
+
+    reactions = interactions(rng, target["reactions"], posts, users, post_ts, end, unique=True)
+    comments = interactions(rng, target["comments"], posts, users, post_ts, end, unique=False)
+    collections = interactions(rng, target["collections"], posts, users, post_ts, end, unique=True)
+    reaction_types = [1 if rng.random() < LIKE_SHARE else -1 for _ in reactions]
+    print(f"数据生成完成 ({time.perf_counter() - started:.1f}s)，开始写入")
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute(f"PRAGMA cache_size = -{max(DB_CACHE_SIZE_KB, 200_000)}")
+    # 先删索引，批量写入后再重建 (比逐行维护索引快得多)
+    indexes = conn.execute(
+        "SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL"
+    ).fetchall()
+    conn.execute("BEGIN")
+    for name, _ in indexes:
+        conn.execute(f"DROP INDEX {name}")
+
+    _insert(conn, sqlite_storage.SQL_UPSERT_USER, (
+        (user_id, f"u{user_id}" if rng.random() < 0.7 else None, display_name(user_id),
+         sql_time(rng.randint(begin, end)))
+        for user_id in user_ids
+    ))
+    _insert(conn, "INSERT INTO submissions (user_id, user_name, channel_message_id, content_text, timestamp) "
+                  "VALUES (?, ?, ?, ?, ?)", (
+        (authors[i], display_name(authors[i]), message_ids[i], random_text(rng, 4.5, 0.8, 4000), sql_time(post_ts[i]))
+        for i in range(post_count)
+    ))
+    _insert(conn, "INSERT INTO reactions (channel_message_id, user_id, reaction_type, timestamp) VALUES (?, ?, ?, ?)", (
+        (message_ids[post], user, reaction_type, sql_time(ts))
+        for (post, user, ts), reaction_type in zip(reactions, reaction_types)
+    ))
+    _insert(conn, "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text, timestamp) "
+                  "VALUES (?, ?, ?, ?, ?)", (
+        (message_ids[post], user, display_name(user), random_text(rng, 3.0, 0.9, 500), sql_time(ts))
+        for post, user, ts in comments
+    ))
+    _insert(conn, "INSERT INTO collections (channel_message_id, user_id, timestamp) VALUES (?, ?, ?)", (
+        (message_ids[post], user, sql_time(ts)) for post, user, ts in collections
+    ))
+
+    # post_stats 与原始表一致
+    likes, dislikes = Counter(), Counter()
+    for (post, _, _), reaction_type in zip(reactions, reaction_types):
+        (likes if reaction_type == 1 else dislikes)[post] += 1
+    collected = Counter(post for post, _, _ in collections)
+    commented = Counter(post for post, _, _ in comments)
+    _insert(conn, "INSERT INTO post_stats (channel_message_id, likes, dislikes, collections, comments) "
+                  "VALUES (?, ?, ?, ?, ?)", (
+        (message_ids[i], likes[i], dislikes[i], collected[i], commented[i]) for i in range(post_count)
+    ))
+
+    # 通知发件箱：别人帖子上的一部分赞/收藏/评论；最近的仍待发送，少量失败
+    outbox = {}
+    sources = (
+        ("like", ((post, user, ts) for (post, user, ts), value in zip(reactions, reaction_types) if value == 1)),
+        ("collect", iter(collections)),
+        ("comment", iter(comments)),
+    )
+    for notification_type, rows in sources:
+        for post, user, ts in rows:
+            if user != authors[post] and rng.random() < NOTIFY_SHARE:
+                outbox[(message_ids[post], user, notification_type)] = (authors[post], ts)
+    _insert(conn, '''
+        INSERT INTO notifications (channel_message_id, user_id, notification_type, timestamp, recipient_id, payload,
+                                   status, attempts, next_attempt_at, last_error, delivered_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (message_id, user, notification_type, sql_time(ts), recipient,
+         json.dumps({"actor_name": display_name(user)}, ensure_ascii=False),
+         *(("pending", 0, ts, None, None) if ts > end - PENDING_WINDOW else
+           ("failed", 5, ts, "Forbidden: bot was blocked by the user", None) if rng.random() < 0.005 else
+           ("delivered", 1, ts, None, ts + 2)))
+        for (message_id, user, notification_type), (recipient, ts) in sorted(outbox.items(), key=lambda item: item[1][1])
+    ))
+
+    # 置顶：点赞最多的 0.5% 帖子
+    top = sorted(range(post_count), key=lambda i: likes[i], reverse=True)[:max(1, post_count // 200)]
+    _insert(conn, "INSERT INTO pinned_posts (channel_message_id, pinned_at, like_count_at_pin) VALUES (?, ?, ?)", (
+        (message_ids[i], sql_time(min(end, post_ts[i] + 86400)), likes[i]) for i in sorted(top)
+    ))
+
+    print(f"重建 {len(indexes)} 个索引")
+    for _, sql in indexes:
+        conn.execute(sql)
+    conn.execute("COMMIT")
+    if args.analyze:
+        conn.execute("ANALYZE")
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+    for table in ("users", "submissions", "reactions", "comments", "collections", "notifications", "pinned_posts"):
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"  {table:<14} {count:>10,} 行")
+    conn.close()
+    size = os.path.getsize(args.db) / 1024 / 1024
+    print(f"✅ 已生成 {args.db} ({size:.0f} MB，{time.perf_counter() - started:.1f}s)")
+
+
+# --- 查询基准 ---
+
+class Case(NamedTuple):
+    name: str                                  # 调用方.用途
+    constant: str                              # 对应的 SQL 常量名
+    sql: str
+    params: Callable[[random.Random, bool], tuple]  # (rng, 是否取最坏情况) -> 参数
+    write: bool = False
+
+
+class Context:
+    """从数据集中读出的参数来源：按线上访问分布抽样，hot=True 时返回最坏情况"""
+
+    def __init__(self, conn: sqlite3.Connection, rng: random.Random):
+        self.conn = conn
+        self.now = int(time.time())
+        rows = conn.execute(
+            "SELECT channel_message_id, likes + dislikes + collections + comments + 1 FROM post_stats"
+        ).fetchall()
+        self.posts = Population([row[0] for row in rows], [row[1] for row in rows])
+        self.hot_post = max(rows, key=lambda row: row[1])[0]
+        self.next_message_id = conn.execute("SELECT MAX(channel_message_id) FROM submissions").fetchone()[0] + 1
+
+        rows = conn.execute("SELECT user_id, COUNT(*) FROM submissions GROUP BY user_id").fetchall()
+        self.poster_counts = dict(rows)
+        self.posters = Population([row[0] for row in rows], [row[1] for row in rows])
+        self.top_poster = max(rows, key=lambda row: row[1])[0]
+        rows = conn.execute("SELECT user_id, COUNT(*) FROM collections GROUP BY user_id").fetchall()
+        self.collector_counts = dict(rows)
+        self.collectors = Population([row[0] for row in rows], [row[1] for row in rows])
+        self.top_collector = max(rows, key=lambda row: row[1])[0]
+
+        # 按随机 ID 抽样已有的行 (用于切换、删除等需要命中已有数据的语句)
+        self.reactions = self._sample_rows(rng, "reactions", "channel_message_id, user_id")
+        self.collections = self._sample_rows(rng, "collections", "channel_message_id, user_id")
+        self.comments = self._sample_rows(rng, "comments", "id, channel_message_id, user_id")
+        self.hot_comment = conn.execute(
+            "SELECT id, channel_message_id, user_id FROM comments WHERE channel_message_id = ? LIMIT 1",
+            (self.hot_post,)
+        ).fetchone()
+        self.hot_commenter = conn.execute(
+            "SELECT user_id FROM comments WHERE channel_message_id = ? GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1",
+            (self.hot_post,)
+        ).fetchone()[0]
+        self.users = [row[1] for row in self.reactions]
+        self.pending = conn.execute(
+            "SELECT id, next_attempt_at FROM notifications WHERE status = 'pending' LIMIT 1000"
+        ).fetchall() or [(0, 0)]
+
+    def _sample_rows(self, rng: random.Random, table: str, columns: str, count: int = 2000) -> list:
+        max_id = self.conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0
+        rows = []
+        for row_id in rng.sample(range(1, max_id + 1), min(count, max_id)):
+            row = self.conn.execute(f"SELECT {columns} FROM {table} WHERE id = ?", (row_id,)).fetchone()
+            if row:
+                rows.append(row)
+        return rows
+
+    def post(self, rng: random.Random, hot: bool) -> int:
+        return self.hot_post if hot else self.posts.one(rng)
+
+    def user(self, rng: random.Random) -> int:
+        return rng.choice(self.users)
+
+    def existing(self, rng: random.Random, table: str, hot: bool) -> tuple:
+        """已有的 (channel_message_id, user_id)；hot=True 时取最热帖子上的一行"""
+        if hot:
+            return self.conn.execute(
+                f"SELECT channel_message_id, user_id FROM {table} WHERE channel_message_id = ? LIMIT 1",
+                (self.hot_post,)
+            ).fetchone()
+        return rng.choice(self.reactions if table == "reactions" else self.collections)
+
+    def comment(self, rng: random.Random, hot: bool) -> tuple:
+        return self.hot_comment if hot else rng.choice(self.comments)
+
+    def cursor(self, rng: random.Random, table: str, user_id: int, count: int, newer: bool) -> tuple:
+        """翻页游标：一半是第一页，其余取该用户列表中随机一行的 (timestamp, id)"""
+        if not newer and (count <= 1 or rng.random() < 0.5):
+            return (MAX_CURSOR_TS, 0)
+        row = self.conn.execute(
+            f"SELECT CAST(strftime('%s', timestamp) AS INTEGER), id FROM {table} WHERE user_id = ? "
+            f"ORDER BY timestamp DESC, id DESC LIMIT 1 OFFSET ?",
+            (user_id, rng.randrange(count))
+        ).fetchone()
+        return row or (MAX_CURSOR_TS, 0)
+
+    def poster(self, rng: random.Random, hot: bool) -> int:
+        return self.top_poster if hot else self.posters.one(rng)
+
+    def collector(self, rng: random.Random, hot: bool) -> int:
+        return self.top_collector if hot else self.collectors.one(rng)
+
+
+def build_cases(ctx: Context) -> List[Case]:
+    s = sqlite_storage
+    page_sql = {
+        (sql_name, newer): getattr(s, sql_name).format(cmp=">" if newer else "<", order="ASC" if newer else "DESC")
+        for sql_name in ("SQL_PAGE_USER_SUBMISSIONS", "SQL_PAGE_USER_COLLECTIONS") for newer in (False, True)
+    }
+
+    def page(sql_name: str, table: str, pick: Callable, counts: dict, newer: bool):
+        def params(rng, hot):
+            user_id = pick(rng, hot)
+            return (user_id, *ctx.cursor(rng, table, user_id, counts.get(user_id, 0), newer), 11)
+        return Case(f"{'navigate_my_posts' if table == 'submissions' else 'show_my_collections'}."
+                    f"{'prev' if newer else 'page'}", sql_name, page_sql[(sql_name, newer)], params)
+
+    def new_user(rng, hot):
+        # 没有互动过的用户 (插入不会违反唯一约束)
+        return 10 ** 10 + rng.randrange(10 ** 6)
+
+    def toggle(rng, hot):
+        return ctx.existing(rng, "reactions", hot)
+
+    def collect(rng, hot):
+        return ctx.existing(rng, "collections", hot)
+
+    def due(rng, hot):
+        return rng.choice(ctx.pending)
+
+    return [
+        # 投稿与审核
+        Case("get_submission", "SQL_GET_SUBMISSION", s.SQL_GET_SUBMISSION, lambda rng, hot: (ctx.post(rng, hot),)),
+        Case("add_submission", "SQL_ADD_SUBMISSION", s.SQL_ADD_SUBMISSION,
+             lambda rng, hot: (ctx.poster(rng, hot), "bench", ctx.next_message_id, "新投稿"), write=True),
+        Case("add_submission.seed_stats", "SQL_SEED_POST_STATS", s.SQL_SEED_POST_STATS,
+             lambda rng, hot: (ctx.next_message_id,), write=True),
+        # 我的朋友圈 / 我的收藏
+        Case("navigate_my_posts.count", "SQL_COUNT_USER_SUBMISSIONS", s.SQL_COUNT_USER_SUBMISSIONS,
+             lambda rng, hot: (ctx.poster(rng, hot),)),
+        page("SQL_PAGE_USER_SUBMISSIONS", "submissions", ctx.poster, ctx.poster_counts, newer=False),
+        page("SQL_PAGE_USER_SUBMISSIONS", "submissions", ctx.poster, ctx.poster_counts, newer=True),
+        Case("show_my_collections.count", "SQL_COUNT_USER_COLLECTIONS", s.SQL_COUNT_USER_COLLECTIONS,
+             lambda rng, hot: (ctx.collector(rng, hot),)),
+        page("SQL_PAGE_USER_COLLECTIONS", "collections", ctx.collector, ctx.collector_counts, newer=False),
+        page("SQL_PAGE_USER_COLLECTIONS", "collections", ctx.collector, ctx.collector_counts, newer=True),
+        # 点赞/踩/收藏切换
+        Case("toggle.get_reaction", "SQL_GET_REACTION", s.SQL_GET_REACTION,
+             lambda rng, hot: (ctx.post(rng, hot), ctx.user(rng))),
+        Case("toggle.insert_reaction", "SQL_INSERT_REACTION", s.SQL_INSERT_REACTION,
+             lambda rng, hot: (ctx.post(rng, hot), new_user(rng, hot), 1), write=True),
+        Case("toggle.delete_reaction", "SQL_DELETE_REACTION", s.SQL_DELETE_REACTION, toggle, write=True),
+        Case("toggle.update_reaction", "SQL_UPDATE_REACTION", s.SQL_UPDATE_REACTION,
+             lambda rng, hot: (-1, *toggle(rng, hot)), write=True),
+        Case("toggle.get_collection", "SQL_GET_COLLECTION", s.SQL_GET_COLLECTION,
+             lambda rng, hot: (ctx.post(rng, hot), ctx.user(rng))),
+        Case("toggle.delete_collection", "SQL_DELETE_COLLECTION", s.SQL_DELETE_COLLECTION, collect, write=True),
+        Case("toggle.insert_collection", "SQL_INSERT_COLLECTION", s.SQL_INSERT_COLLECTION,
+             lambda rng, hot: (ctx.post(rng, hot), new_user(rng, hot)), write=True),
+        Case("toggle.bump_post_stats", "SQL_BUMP_POST_STATS", post_stats.SQL_BUMP_POST_STATS,
+             lambda rng, hot: (ctx.post(rng, hot), 1, 0, 0, 0), write=True),
+        Case("get_all_counts", "SQL_GET_POST_STATS", s.SQL_GET_POST_STATS, lambda rng, hot: (ctx.post(rng, hot),)),
+        # 评论
+        Case("add_comment", "SQL_ADD_COMMENT", s.SQL_ADD_COMMENT,
+             lambda rng, hot: (ctx.post(rng, hot), ctx.user(rng), "bench", "评论内容"), write=True),
+        Case("build_comment_section.preview", "SQL_COMMENT_PREVIEW", s.SQL_COMMENT_PREVIEW,
+             lambda rng, hot: (ctx.post(rng, hot), 5)),
+        Case("build_comment_section.count", "SQL_COUNT_COMMENTS", s.SQL_COUNT_COMMENTS,
+             lambda rng, hot: (ctx.post(rng, hot),)),
+        Case("show_delete_comment_menu.mine", "SQL_USER_COMMENTS", s.SQL_USER_COMMENTS,
+             lambda rng, hot: (ctx.hot_post, ctx.hot_commenter) if hot else ctx.comment(rng, hot)[1:]),
+        Case("show_delete_comment_menu.others", "SQL_OTHER_COMMENTS", s.SQL_OTHER_COMMENTS,
+             lambda rng, hot: (ctx.hot_post, ctx.hot_commenter) if hot else ctx.comment(rng, hot)[1:]),
+        Case("delete_comment.lookup", "SQL_COMMENT_FOR_DELETE", s.SQL_COMMENT_FOR_DELETE,
+             lambda rng, hot: (ctx.comment(rng, hot)[0],)),
+        Case("delete_comment.post", "SQL_COMMENT_POST", s.SQL_COMMENT_POST,
+             lambda rng, hot: (ctx.comment(rng, hot)[0],)),
+        Case("delete_comment", "SQL_DELETE_COMMENT", s.SQL_DELETE_COMMENT,
+             lambda rng, hot: (ctx.comment(rng, hot)[0],), write=True),
+        # 通知发件箱
+        Case("notification_outbox.enqueue", "SQL_ENQUEUE_NOTIFICATION", s.SQL_ENQUEUE_NOTIFICATION,
+             lambda rng, hot: (lambda post, user: (post, user, "comment", "{}", ctx.now, post, user))(
+                 ctx.post(rng, hot), ctx.user(rng)), write=True),
+        Case("notification_outbox.due", "SQL_DUE_NOTIFICATIONS", s.SQL_DUE_NOTIFICATIONS,
+             lambda rng, hot: (ctx.now, 50)),
+        Case("notification_outbox.lease", "SQL_LEASE_NOTIFICATION", s.SQL_LEASE_NOTIFICATION,
+             lambda rng, hot: (ctx.now + 60, due(rng, hot)[0]), write=True),
+        Case("notification_outbox.complete", "SQL_COMPLETE_NOTIFICATION", s.SQL_COMPLETE_NOTIFICATION,
+             lambda rng, hot: (lambda row: (ctx.now, row[0], row[1]))(due(rng, hot)), write=True),
+        Case("notification_outbox.fail", "SQL_FAIL_NOTIFICATION", s.SQL_FAIL_NOTIFICATION,
+             lambda rng, hot: (lambda row: ("Timed out", "pending", ctx.now + 30, row[0], row[1]))(due(rng, hot)),
+             write=True),
+        # 置顶
+        Case("check_pin.is_pinned", "SQL_IS_PINNED", s.SQL_IS_PINNED, lambda rng, hot: (ctx.post(rng, hot),)),
+        Case("check_pin.record", "SQL_RECORD_PIN", s.SQL_RECORD_PIN,
+             lambda rng, hot: (ctx.post(rng, hot), 100), write=True),
+        # 用户目录
+        Case("user_directory.upsert", "SQL_UPSERT_USER", s.SQL_UPSERT_USER,
+             lambda rng, hot: (ctx.user(rng), "bench", "Bench User", sql_time(ctx.now)), write=True),
+        Case("user_directory.get", "SQL_GET_USER", s.SQL_GET_USER, lambda rng, hot: (ctx.user(rng),)),
+        # 启动时预热帖子缓存
+        Case("post_cache.recent_posts", "SQL_RECENT_POSTS", s.SQL_RECENT_POSTS, lambda rng, hot: (200,)),
+        Case("post_cache.reactions", "SQL_POST_REACTIONS", s.SQL_POST_REACTIONS, lambda rng, hot: (ctx.post(rng, hot),)),
+        Case("post_cache.collectors", "SQL_POST_COLLECTORS", s.SQL_POST_COLLECTORS,
+             lambda rng, hot: (ctx.post(rng, hot),)),
+    ]
+
+
+def uncovered(cases: List[Case]) -> List[str]:
+    """没有测试用例的 SQL 常量 (新增语句时在 build_cases 里登记)"""
+    constants = {name for name in vars(sqlite_storage) if name.startswith("SQL_")}
+    constants |= {name for name in vars(post_stats) if name.startswith("SQL_")}
+    return sorted(constants - {case.constant for case in cases})
+
+
+def percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def execute(conn: sqlite3.Connection, case: Case, params: tuple) -> tuple:
+    """执行一次并返回 (秒, 行数)；写语句在事务中执行后回滚"""
+    if case.write:
+        conn.execute("BEGIN")
+    try:
+        started = time.perf_counter()
+        cursor = conn.execute(case.sql, params)
+        rows = len(cursor.fetchall()) if cursor.description else max(cursor.rowcount, 0)
+        elapsed = time.perf_counter() - started
+    finally:
+        if case.write:
+            conn.execute("ROLLBACK")
+    return elapsed, rows
+
+
+def measure(conn: sqlite3.Connection, case: Case, rng: random.Random, samples: int) -> dict:
+    for _ in range(min(20, samples)):
+        execute(conn, case, case.params(rng, False))
+    timings, rows = [], []
+    for _ in range(samples):
+        elapsed, count = execute(conn, case, case.params(rng, False))
+        timings.append(elapsed)
+        rows.append(count)
+    hot_params = case.params(rng, True)
+    hot = sorted(execute(conn, case, hot_params)[0] for _ in range(max(5, samples // 20)))
+    hot_rows = execute(conn, case, hot_params)[1]
+
+    plan = [row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {case.sql}", hot_params).fetchall()]
+    timings.sort()
+    return {
+        "constant": case.constant,
+        "write": case.write,
+        "p50_us": percentile(timings, 0.5) * 1e6,
+        "p95_us": percentile(timings, 0.95) * 1e6,
+        "p99_us": percentile(timings, 0.99) * 1e6,
+        "max_us": timings[-1] * 1e6,
+        "rows_avg": sum(rows) / len(rows),
+        "hot_p50_us": percentile(hot, 0.5) * 1e6,
+        "hot_rows": hot_rows,
+        "plan": plan,
+        "problems": plan_problems(plan),
+    }
+
+
+def dataset_info(conn: sqlite3.Connection, path: str) -> dict:
+    info = {"size_mb": round(os.path.getsize(path) / 1024 / 1024, 1)}
+    for table in ("submissions", "reactions", "comments", "collections", "notifications", "users"):
+        info[table] = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+    info["analyzed"] = conn.execute(
+        "SELECT COUNT(*) FROM sqlite_master WHERE name = 'sqlite_stat1'"
+    ).fetchone()[0] == 1
+    return info
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, dict], baseline: Optional[dict]) -> None:
+    old = (baseline or {}).get("queries", {})
+    print(f"\n{'查询':<34}{'p50':>9}{'p95':>9}{'p99':>9}{'最大':>10}{'行数':>8}{'最坏p50':>10}{'最坏行数':>9}"
+          f"{'  对比p95' if baseline else ''}  (µs)")
+    for name, result in results.items():
+        change = ""
+        if name in old and old[name]["p95_us"]:
+            change = f"  {(result['p95_us'] / old[name]['p95_us'] - 1) * 100:+6.0f}%"
+        print(f"{name:<34}{result['p50_us']:9.1f}{result['p95_us']:9.1f}{result['p99_us']:9.1f}"
+              f"{result['max_us']:10.1f}{result['rows_avg']:8.1f}{result['hot_p50_us']:10.1f}"
+              f"{result['hot_rows']:9d}{change}")
+        if result["plan"]:
+            marker = "⚠️ " if result["problems"] else "   "
+            print(f"  {marker}{' / '.join(result['plan'])}")
+
+
+def run(args: argparse.Namespace) -> int:
+    if not os.path.exists(args.db):
+        sys.exit(f"❌ {args.db} 不存在，请先运行: python bench_dataset.py generate --db {args.db}")
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    # 与 DatabasePool 的连接参数一致
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+    conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+    rng = random.Random(args.seed)
+    info = dataset_info(conn, args.db)
+    print(f"数据集 {args.db}: {info}")
+    ctx = Context(conn, rng)
+    cases = build_cases(ctx)
+    missing = uncovered(cases)
+    if args.only:
+        cases = [case for case in cases if args.only in case.name]
+
+    results = {}
+    for case in cases:
+        results[case.name] = measure(conn, case, rng, args.samples)
+    conn.close()
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "config": {"samples": args.samples, "seed": args.seed},
+        "dataset": info,
+        "queries": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    flagged = [name for name, result in results.items() if result["problems"]]
+    if flagged:
+        print(f"\n⚠️ 执行计划中有全表扫描或临时排序: {', '.join(flagged)}")
+    if missing:
+        print(f"\n❌ 以下 SQL 常量没有测试用例，请在 build_cases 中登记: {', '.join(missing)}")
+    print(f"\n结果已写入 {args.output}")
+    return 1 if missing else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    gen = commands.add_parser("generate", help="生成合成数据集")
+    gen.add_argument("--db", default="bench_dataset.db")
+    gen.add_argument("--scale", type=float, default=1.0, help="各表行数的倍数 (1.0 约为 300 万条 reactions)")
+    gen.add_argument("--years", type=float, default=3, help="帖子时间跨越的年数")
+    gen.add_argument("--zipf", type=float, default=1.0, help="帖子热度的 Zipf 指数")
+    gen.add_argument("--seed", type=int, default=22)
+    gen.add_argument("--analyze", action="store_true", help="生成后执行 ANALYZE")
+
+    bench = commands.add_parser("run", help="逐条执行 SQL 并报告延迟和执行计划")
+    bench.add_argument("--db", default="bench_dataset.db")
+    bench.add_argument("--samples", type=int, default=300, help="每条语句的执行次数")
+    bench.add_argument("--only", help="只测名称包含该片段的语句")
+    bench.add_argument("--seed", type=int, default=22)
+    bench.add_argument("--output", default="bench_dataset.json")
+    bench.add_argument("--baseline", help="对比的基线结果 JSON")
+
+    args = parser.parse_args()
+    if args.command == "generate":
+        generate(args)
+    else:
+        sys.exit(run(args))
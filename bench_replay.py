@@ -0,0 +1,494 @@
+# bench_replay.py
+"""
+回放式吞吐量基准：模拟的 Telegram API + 合成的更新 + 真实的 Application
+
+- FakeTelegramRequest 替换 PTB 的 HTTP 层：按 API 方法记录调用次数，每次调用 sleep 一段模拟延迟，
+  返回结构合理的结果 (发送/编辑返回消息，getChat 返回用户资料，copyMessage 返回新消息 ID)
+- 场景生成器：单帖点击风暴、分散在上千个帖子上的点击、评论高峰、翻页浏览"我的朋友圈"、审核通过
+- 运行器：用 main.build_application() 构建与线上相同的 Application (同样的处理器、并发处理器和持久化)，
+  像 Application 一样把每个更新交给 update_processor。每个场景完整走一遍
+  initialize -> post_init -> start -> stop -> post_stop -> shutdown -> post_shutdown，
+  关闭时才发出的合并编辑、汇总通知和批量写入也计入该场景
+
+每个场景输出 updates/sec、p50/p95/p99 延迟、每个更新的数据库查询数和 API 调用数，结果写入 JSON，
+用 --baseline 指定另一次运行的 JSON 即可对比两次提交。
+
+默认关闭出站限速 (测量机器人自身的处理能力)；--telegram-limits 使用配置中的生产限速。
+
+用法: python bench_replay.py [--scale 1.0] [--latency-ms 50] [--jitter-ms 20] [--clients 64]
+                             [--scenarios storm,spread,comments,paging,approvals]
+                             [--output bench_replay.json] [--baseline old.json]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+from collections import Counter
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+# 导入 config 需要这些环境变量，基准测试不会真正连接 Telegram
+for _key, _value in {
+    "TOKEN": "123456:bench", "ADMIN_GROUP_ID": "-1002", "CHANNEL_ID": "-1001",
+    "CHANNEL_USERNAME": "bench", "DISCUSSION_GROUP_ID": "-1003", "BOT_USERNAME": "bench_bot",
+}.items():
+    os.environ.setdefault(_key, _value)
+os.environ["DB_BACKEND"] = "sqlite"  # 数据库建在临时目录里
+os.environ.setdefault("METRICS_PORT", "0")  # 每个场景都会重启 Application，不开抓取端点
+if "--telegram-limits" not in sys.argv:
+    for _key in ("OUTBOUND_GLOBAL_RATE", "OUTBOUND_PRIVATE_RATE", "OUTBOUND_GROUP_PER_MINUTE",
+                 "OUTBOUND_GROUP_EDIT_PER_MINUTE"):
+        os.environ.setdefault(_key, "1000000")
+
+from telegram import Update
+from telegram.request import BaseRequest, RequestData
+from telegram.warnings import PTBUserWarning
+
+import main as bot_main
+from config import ADMIN_GROUP_ID, BOT_USERNAME, CHANNEL_ID, TOKEN
+from handlers.callback_router import CallbackAction, Kind, decode_callback, encode_callback
+from services.persistence import SqlitePersistence
+from storage import storage
+
+Step = Union[Update, Callable[[], Optional[Update]]]
+Session = List[Step]
+
+BOT_ID = int(TOKEN.split(":", 1)[0])
+
+
+class FakeTelegramRequest(BaseRequest):
+    """代替 HTTP 客户端的 Telegram API：记录调用、模拟延迟、返回合成的结果"""
+
+    def __init__(self, latency: float, jitter: float, seed: int):
+        self.latency = latency
+        self.jitter = jitter
+        self._rng = random.Random(seed)
+        self._message_ids = itertools.count(50_000_000)
+        self.calls: Counter = Counter()
+        # 私聊中最后一次发送/编辑的带按钮消息: chat_id -> (message_id, reply_markup)
+        self.last_markup: Dict[int, Tuple[int, dict]] = {}
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls[endpoint] += 1
+        delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return 200, json.dumps({"ok": True, "result": self._result(endpoint, params)}).encode()
+
+    @staticmethod
+    def _chat(chat_id: int) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"用户{chat_id}", "username": f"user{chat_id}"}
+        chat_type = "channel" if str(chat_id) == str(CHANNEL_ID) else "supergroup"
+        return {"id": chat_id, "type": chat_type, "title": "bench", "username": "bench"}
+
+    def _message(self, params: dict, message_id: Optional[int] = None) -> dict:
+        chat_id = int(params["chat_id"])
+        message_id = message_id if message_id is not None else next(self._message_ids)
+        message = {"message_id": message_id, "date": int(time.time()), "chat": self._chat(chat_id)}
+        for key in ("text", "caption", "reply_markup"):
+            if key in params:
+                message[key] = params[key]
+        if chat_id > 0 and "reply_markup" in params:
+            self.last_markup[chat_id] = (message_id, params["reply_markup"])
+        return message
+
+    def _result(self, endpoint: str, params: dict) -> object:
+        if endpoint == "getMe":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "bench", "username": BOT_USERNAME,
+                    "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+        if endpoint == "getChat":
+            return {**self._chat(int(params["chat_id"])), "accent_color_id": 0, "max_reaction_count": 11}
+        if endpoint == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if endpoint.startswith("send"):
+            return self._message(params)
+        if endpoint.startswith("editMessage"):
+            if "inline_message_id" in params:
+                return True
+            return self._message(params, int(params["message_id"]))
+        return True
+
+
+class QueryCounter:
+    """sqlite3 跟踪回调：统计执行的 SQL 语句 (不计事务控制、PRAGMA 和触发器内的语句)"""
+
+    _SKIP = ("BEGIN", "COMMIT", "ROLLBACK", "PRAGMA", "SAVEPOINT", "RELEASE", "--")
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, sql: str) -> None:
+        if not sql.lstrip().upper().startswith(self._SKIP):
+            self.count += 1
+
+
+# --- 合成更新 ---
+
+class UpdateFactory:
+    def __init__(self, bot):
+        self.bot = bot
+        self._ids = itertools.count(1)
+
+    @staticmethod
+    def _user(user_id: int) -> dict:
+        return {"id": user_id, "is_bot": False, "first_name": f"用户{user_id}", "username": f"user{user_id}"}
+
+    def _update(self, payload: dict) -> Update:
+        return Update.de_json({"update_id": next(self._ids), **payload}, self.bot)
+
+    def _callback(self, user_id: int, data: str, message: dict) -> Update:
+        return self._update({"callback_query": {
+            "id": str(next(self._ids)), "from": self._user(user_id), "chat_instance": "bench",
+            "data": data, "message": message,
+        }})
+
+    def channel_click(self, message_id: int, user_id: int, kind: Kind) -> Update:
+        return self._callback(user_id, encode_callback(kind, message_id), {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": int(CHANNEL_ID), "type": "channel", "title": "bench"},
+            "caption": f"帖子 {message_id}",
+        })
+
+    def admin_click(self, admin_id: int, message_id: int, data: str, caption: str) -> Update:
+        return self._callback(admin_id, data, {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": ADMIN_GROUP_ID, "type": "supergroup", "title": "审核群"},
+            "caption": caption,
+        })
+
+    def private_click(self, user_id: int, message_id: int, data: str) -> Update:
+        return self._callback(user_id, data, {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"用户{user_id}"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "bench"},
+            "text": "菜单",
+        })
+
+    def private_text(self, user_id: int, text: str) -> Update:
+        message = {
+            "message_id": next(self._ids), "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private", "first_name": f"用户{user_id}"},
+            "from": self._user(user_id), "text": text,
+        }
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return self._update({"message": message})
+
+
+def click_button(factory: UpdateFactory, fake: FakeTelegramRequest, user_id: int,
+                 wanted: Callable[[CallbackAction], bool]) -> Callable[[], Optional[Update]]:
+    """延迟生成的步骤：在用户最后收到的按钮中点击符合条件的一个，没有时结束会话"""
+    def step() -> Optional[Update]:
+        last = fake.last_markup.get(user_id)
+        if last is None:
+            return None
+        message_id, markup = last
+        for row in markup.get("inline_keyboard", []):
+            for button in row:
+                action = decode_callback(button.get("callback_data"))
+                if action is not None and wanted(action):
+                    return factory.private_click(user_id, message_id, button["callback_data"])
+        return None
+    return step
+
+
+# --- 数据与场景 ---
+
+class Dataset:
+    def __init__(self, scale: float, seed: int):
+        self.rng = random.Random(seed)
+        self.posts = max(100, int(3000 * scale))
+        self.post_ids = list(range(1, self.posts + 1))
+        # 帖子热度近似 Zipf：越新的帖子越热
+        self.post_weights = [1 / rank ** 1.1 for rank in range(self.posts, 0, -1)]
+        self.hot_post = self.posts
+        self.paging_users = [800_000 + i for i in range(max(10, int(100 * scale)))]
+        self.paging_posts = 35
+
+    def pick_post(self, rng: random.Random) -> int:
+        return rng.choices(self.post_ids, self.post_weights)[0]
+
+    async def seed(self) -> None:
+        """发帖人按重尾分布 (少数人发了大部分帖子)；翻页用户各有 paging_posts 个帖子"""
+        posters = [1_000 + i for i in range(max(20, self.posts // 10))]
+        for message_id in self.post_ids:
+            author = posters[min(len(posters) - 1, int(self.rng.paretovariate(1.2)) - 1)]
+            await storage.add_submission(author, f"用户{author}", message_id, f"帖子 {message_id} " + "内容" * 20)
+        message_id = 10_000_000
+        for user_id in self.paging_users:
+            for _ in range(self.paging_posts):
+                message_id += 1
+                await storage.add_submission(user_id, f"用户{user_id}", message_id, f"翻页测试 {message_id}")
+
+
+def scenario_storm(data: Dataset, factory: UpdateFactory, fake: FakeTelegramRequest,
+                   rng: random.Random, scale: float) -> List[Session]:
+    """同一帖子上的点击风暴：不同用户的赞/踩/收藏"""
+    kinds = [Kind.LIKE] * 7 + [Kind.COLLECT] * 2 + [Kind.DISLIKE]
+    return [[factory.channel_click(data.hot_post, 100_000 + i, rng.choice(kinds))]
+            for i in range(int(2000 * scale))]
+
+
+def scenario_spread(data: Dataset, factory: UpdateFactory, fake: FakeTelegramRequest,
+                    rng: random.Random, scale: float) -> List[Session]:
+    """分散在所有帖子上的点击 (含展开/收起评论区)"""
+    kinds = [Kind.LIKE] * 6 + [Kind.COLLECT, Kind.DISLIKE, Kind.COMMENT_SHOW, Kind.COMMENT_HIDE]
+    return [[factory.channel_click(data.pick_post(rng), rng.randint(100_000, 150_000), rng.choice(kinds))]
+            for _ in range(int(3000 * scale))]
+
+
+def scenario_comments(data: Dataset, factory: UpdateFactory, fake: FakeTelegramRequest,
+                      rng: random.Random, scale: float) -> List[Session]:
+    """评论高峰：深度链接进入评论模式，再发送评论内容；集中在最热的几十个帖子上"""
+    hot = data.post_ids[-30:]
+    sessions = []
+    for i in range(int(300 * scale)):
+        user_id = 200_000 + i
+        message_id = rng.choice(hot)
+        sessions.append([
+            factory.private_text(user_id, f"/start comment_{message_id}"),
+            factory.private_text(user_id, f"评论 {i}: " + "不错" * rng.randint(1, 30)),
+        ])
+    return sessions
+
+
+def scenario_paging(data: Dataset, factory: UpdateFactory, fake: FakeTelegramRequest,
+                    rng: random.Random, scale: float) -> List[Session]:
+    """打开主菜单 -> 我的朋友圈 -> 一直点"下一页"到最后一页"""
+    sessions = []
+    for user_id in data.paging_users:
+        steps: Session = [
+            factory.private_text(user_id, "/start"),
+            click_button(factory, fake, user_id, lambda action: action.kind == Kind.MY_POSTS_PAGE),
+        ]
+        for _ in range(data.paging_posts // 10 + 1):
+            steps.append(click_button(
+                factory, fake, user_id,
+                lambda action: action.kind == Kind.MY_POSTS_PAGE and len(action.fields) == 4 and action.field(1) == 0,
+            ))
+        sessions.append(steps)
+    return sessions
+
+
+def scenario_approvals(data: Dataset, factory: UpdateFactory, fake: FakeTelegramRequest,
+                       rng: random.Random, scale: float) -> List[Session]:
+    """审核群中逐条点击"通过"：复制到频道、写入数据库、编辑频道和审核群消息、通知投稿人"""
+    sessions = []
+    for i in range(int(100 * scale)):
+        submitter = 300_000 + i
+        data_ = encode_callback(Kind.APPROVE, submitter, 1_000 + i)
+        caption = f"📨 新投稿 from 用户{submitter}\n\n投稿内容 {i} " + "文字" * 30
+        sessions.append([factory.admin_click(7, 60_000_000 + i, data_, caption)])
+    return sessions
+
+
+SCENARIOS = {
+    "storm": scenario_storm,
+    "spread": scenario_spread,
+    "comments": scenario_comments,
+    "paging": scenario_paging,
+    "approvals": scenario_approvals,
+}
+
+
+# --- 运行 ---
+
+def percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+async def run_scenario(name: str, data: Dataset, args: argparse.Namespace) -> dict:
+    fake = FakeTelegramRequest(args.latency_ms / 1000, args.jitter_ms / 1000, args.seed)
+    application = bot_main.build_application(fake)
+    errors: List[BaseException] = []
+
+    async def on_error(update: object, context) -> None:
+        errors.append(context.error)
+
+    application.add_error_handler(on_error)
+
+    await application.initialize()
+    await application.post_init(application)
+    queries = QueryCounter()
+    await storage.pool.set_trace_callback(queries)
+    if isinstance(application.persistence, SqlitePersistence):
+        await application.persistence.pool.set_trace_callback(queries)
+    await application.start()
+
+    factory = UpdateFactory(application.bot)
+    sessions = SCENARIOS[name](data, factory, fake, random.Random(f"{args.seed}:{name}"), args.scale)
+    fake.calls.clear()
+    queries.count = 0
+
+    processor = application.update_processor
+    clients = asyncio.Semaphore(args.clients)
+    latencies: List[float] = []
+
+    async def run_session(steps: Session) -> None:
+        async with clients:
+            for step in steps:
+                update = step() if callable(step) else step
+                if update is None:
+                    return
+                started = time.perf_counter()
+                # 与 Application 的更新循环相同的调用方式
+                await processor.process_update(update, application.process_update(update))
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(steps) for steps in sessions))
+    elapsed = time.perf_counter() - started
+
+    await application.stop()
+    await application.post_stop(application)
+    await application.shutdown()
+    await application.post_shutdown(application)
+
+    ordered = sorted(latencies)
+    count = len(ordered)
+    api_calls = sum(fake.calls.values())
+    return {
+        "updates": count,
+        "sessions": len(sessions),
+        "seconds": round(elapsed, 4),
+        "updates_per_sec": round(count / elapsed, 2) if elapsed else 0.0,
+        "latency_ms": {
+            "p50": round(percentile(ordered, 0.50) * 1000, 3),
+            "p95": round(percentile(ordered, 0.95) * 1000, 3),
+            "p99": round(percentile(ordered, 0.99) * 1000, 3),
+            "max": round(ordered[-1] * 1000, 3) if ordered else 0.0,
+        },
+        "db_queries_per_update": round(queries.count / count, 3) if count else 0.0,
+        "api_calls_per_update": round(api_calls / count, 3) if count else 0.0,
+        "api_calls": dict(sorted(fake.calls.items())),
+        "errors": len(errors),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results: Dict[str, dict], baseline: Optional[dict]) -> None:
+    print(f"{'场景':<10} {'更新数':>6} {'updates/s':>10} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} "
+          f"{'DB/更新':>8} {'API/更新':>8} {'错误':>4}")
+    for name, r in results.items():
+        latency = r["latency_ms"]
+        print(f"{name:<10} {r['updates']:>6} {r['updates_per_sec']:>10.1f} {latency['p50']:>8.1f} "
+              f"{latency['p95']:>8.1f} {latency['p99']:>8.1f} {r['db_queries_per_update']:>8.2f} "
+              f"{r['api_calls_per_update']:>8.2f} {r['errors']:>4}")
+
+    if not baseline:
+        return
+    print(f"\n与基线 {baseline.get('commit') or '?'} 对比 (正数表示增加):")
+    for name, r in results.items():
+        old = baseline.get("scenarios", {}).get(name)
+        if not old:
+            continue
+
+        def change(new: float, before: float) -> str:
+            return f"{(new - before) / before * 100:+6.1f}%" if before else "   n/a"
+
+        print(f"{name:<10} updates/s {change(r['updates_per_sec'], old['updates_per_sec'])}  "
+              f"p95 {change(r['latency_ms']['p95'], old['latency_ms']['p95'])}  "
+              f"DB/更新 {change(r['db_queries_per_update'], old['db_queries_per_update'])}  "
+              f"API/更新 {change(r['api_calls_per_update'], old['api_calls_per_update'])}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    names = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        raise SystemExit(f"未知场景: {unknown}，可选 {list(SCENARIOS)}")
+
+    output = os.path.abspath(args.output)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    workdir = tempfile.mkdtemp(prefix="bench_replay_")
+    os.chdir(workdir)  # DB_NAME 和 PERSISTENCE_DB 是相对路径，数据库建在临时目录里
+
+    data = Dataset(args.scale, args.seed)
+    await storage.open()
+    await storage.migrate()
+    seeding = time.perf_counter()
+    await data.seed()
+    await storage.close()
+    print(f"已生成 {data.posts} 个帖子 + {len(data.paging_users)} 个翻页用户 "
+          f"({time.perf_counter() - seeding:.1f}s)，数据库: {workdir}")
+
+    results = {}
+    for name in names:
+        results[name] = await run_scenario(name, data, args)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "config": {
+            "scale": args.scale,
+            "latency_ms": args.latency_ms,
+            "jitter_ms": args.jitter_ms,
+            "clients": args.clients,
+            "seed": args.seed,
+            "telegram_limits": args.telegram_limits,
+        },
+        "scenarios": results,
+    }
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print_results(results, baseline)
+    print(f"\n结果已写入 {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scale", type=float, default=1.0, help="各场景的更新数量倍数")
+    parser.add_argument("--latency-ms", type=float, default=50, help="每次 API 调用的模拟延迟")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="额外的随机延迟上限")
+    parser.add_argument("--clients", type=int, default=64, help="同时进行的会话数")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=21)
+    parser.add_argument("--telegram-limits", action="store_true", help="使用配置中的出站限速")
+    parser.add_argument("--output", default="bench_replay.json")
+    parser.add_argument("--baseline", help="对比的基线结果 JSON")
+    parser.add_argument("--verbose", action="store_true", help="显示机器人的 INFO 日志")
+    args = parser.parse_args()
+    if not args.verbose:
+        # 调试处理器会为每条私聊文本打 WARNING，默认只显示错误
+        logging.getLogger().setLevel(logging.ERROR)
+        warnings.filterwarnings("ignore", category=PTBUserWarning)
+    asyncio.run(main(args))
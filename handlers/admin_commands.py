@@ -0,0 +1,33 @@
+# handlers/admin_commands.py
+
+import logging
+from telegram import Update
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from config import SLOW_QUERY_TOP_N
+from services.outbound import Priority, outbound
+from services.slow_queries import slow_queries
+
+logger = logging.getLogger(__name__)
+
+
+async def show_slow_queries(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """
+    管理群命令 /slowqueries [条数|reset]：显示最慢语句的汇总表 (含执行计划)，reset 清空重新统计
+    """
+    message = update.effective_message
+    args = context.args or []
+
+    if args and args[0].lower() == "reset":
+        slow_queries.reset()
+        logger.info(f"🐢 慢查询汇总已被 {update.effective_user.id} 清空")
+        text = "🐢 慢查询汇总已清空，重新开始统计。"
+    else:
+        limit = int(args[0]) if args and args[0].isdigit() else SLOW_QUERY_TOP_N
+        text = slow_queries.report(max(1, min(limit, 50)))
+
+    await outbound.submit(
+        message.chat_id, Priority.REPLY, message.reply_text,
+        text, parse_mode=ParseMode.HTML
+    )
@@ -1,28 +1,32 @@
 # handlers/approval.py
 
-import aiosqlite
 import logging
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes
 
-from config import CHANNEL_ID, DB_NAME, BOT_USERNAME
+from config import CHANNEL_ID
+from handlers.callback_router import CallbackAction
+from handlers.channel_interact import build_footer, build_main_keyboard
+from handlers.pagination import count_cache
+from services.outbound import Priority, outbound
+from services.profile_cache import profile_cache
+from storage import storage
 
 logger = logging.getLogger(__name__)
 
 
-async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> None:
     """处理审核群的"通过"按钮 (V10.4)"""
     query = update.callback_query
     await query.answer()
 
-    action, user_id_str, message_id_str = query.data.split(':')
-    user_id = int(user_id_str)
-    message_id = int(message_id_str)
+    user_id, message_id = action.fields[:2]
     
     try:
         # 1. 复制消息到频道
-        sent_message = await context.bot.copy_message(
+        sent_message = await outbound.submit(
+            CHANNEL_ID, Priority.REPLY, context.bot.copy_message,
             chat_id=CHANNEL_ID,
             from_chat_id=user_id,
             message_id=message_id
@@ -43,48 +47,23 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
                 content_to_save = caption_parts[1]
                 original_caption = caption_parts[1]
         
-        # 3. 获取投稿者信息并构建页脚
-        try:
-            submitter = await context.bot.get_chat(user_id)
-            author_username = submitter.username or ""
-            author_name = submitter.full_name or "匿名用户"
-        except:
-            author_username = ""
-            author_name = "匿名用户"
+        # 3. 获取投稿者信息并构建页脚 (走资料缓存，同一用户的并发查询只请求一次)
+        submitter = await profile_cache.get(context.bot, user_id)
+        author_username = submitter.username if submitter else ""
+        author_name = (submitter.full_name if submitter else "") or "匿名用户"
         
-        # 构建页脚链接
-        if author_username:
-            author_link = f'👤 作者: <a href="https://t.me/{author_username}">{author_name}</a>'
-        else:
-            author_link = f'👤 作者: <a href="tg://user?id={user_id}">{author_name}</a>'
-        
-        my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
-        footer = f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
-        
-        full_caption = (original_caption or "") + footer
+        full_caption = (original_caption or "") + build_footer(user_id, author_name, author_username)
         
         # 4. 保存到数据库（只保存原始内容）
-        async with aiosqlite.connect(DB_NAME) as db:
-            await db.execute(
-                "INSERT INTO submissions (user_id, user_name, channel_message_id, content_text) VALUES (?, ?, ?, ?)",
-                (user_id, author_name, msg_id, content_to_save)
-            )
-            await db.commit()
+        await storage.add_submission(user_id, author_name, msg_id, content_to_save)
+        count_cache.invalidate('submissions', user_id)
         
         # 5. 编辑频道消息，添加互动按钮（两行布局）
-        keyboard = [
-            [
-                InlineKeyboardButton(f"👍 赞 0", callback_data=f"react:like:{msg_id}"),
-                InlineKeyboardButton(f"👎 踩 0", callback_data=f"react:dislike:{msg_id}"),
-                InlineKeyboardButton(f"⭐ 收藏 0", callback_data=f"collect:{msg_id}"),
-            ],
-            [
-                InlineKeyboardButton("💬 评论 0", callback_data=f"comment:show:{msg_id}"),
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(keyboard)
+        reply_markup = build_main_keyboard(msg_id, {"likes": 0, "dislikes": 0, "collections": 0, "comments": 0})
 
-        await context.bot.edit_message_caption(
+        await outbound.submit(
+            CHANNEL_ID, Priority.EDIT, context.bot.edit_message_caption,
+            lane=msg_id,
             chat_id=CHANNEL_ID,
             message_id=msg_id,
             caption=full_caption,
@@ -94,31 +73,35 @@ async def handle_approval(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
 
         # 6. 更新审核群消息
         original_admin_caption = admin_message.caption or ""
-        await query.edit_message_caption(
+        await outbound.submit(
+            query.message.chat_id, Priority.EDIT, query.edit_message_caption,
             caption=f"✅ 已通过 by {query.from_user.first_name}\n\n{original_admin_caption}",
             parse_mode=ParseMode.HTML
         )
         
         # 7. 通知投稿者
-        await context.bot.send_message(chat_id=user_id, text="🎉 恭喜！您的投稿已被采纳发布。")
+        await outbound.submit(user_id, Priority.NOTIFICATION, context.bot.send_message, chat_id=user_id, text="🎉 恭喜！您的投稿已被采纳发布。")
         
     except Exception as e:
         logger.error(f"审核通过失败: {e}")
-        await query.edit_message_caption(caption=f"❌ 发布失败: {e}", parse_mode=ParseMode.HTML)
+        await outbound.submit(
+            query.message.chat_id, Priority.EDIT, query.edit_message_caption,
+            caption=f"❌ 发布失败: {e}", parse_mode=ParseMode.HTML
+        )
 
 
-async def handle_rejection(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+async def handle_rejection(update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> None:
     """处理审核群的"拒绝"按钮"""
     query = update.callback_query
     await query.answer()
 
-    action, user_id_str, message_id_str = query.data.split(':')
-    user_id = int(user_id_str)
+    user_id = action.fields[0]
 
     original_caption = query.message.caption or ""
-    await query.edit_message_caption(
+    await outbound.submit(
+        query.message.chat_id, Priority.EDIT, query.edit_message_caption,
         caption=f"❌ 已拒绝 by {query.from_user.first_name}\n\n{original_caption}",
         parse_mode=ParseMode.HTML
     )
     
-    await context.bot.send_message(chat_id=user_id, text="很抱歉，您的投稿未通过审核。")
\ No newline at end of file
+    await outbound.submit(user_id, Priority.NOTIFICATION, context.bot.send_message, chat_id=user_id, text="很抱歉，您的投稿未通过审核。")
\ No newline at end of file
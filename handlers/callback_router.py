@@ -0,0 +1,186 @@
+# handlers/callback_router.py
+
+import base64
+import logging
+import time
+from enum import IntEnum
+from functools import lru_cache
+from typing import Awaitable, Callable, Dict, NamedTuple, Optional, Tuple
+
+from telegram import Update
+from telegram.constants import InlineKeyboardButtonLimit
+from telegram.ext import CallbackQueryHandler, ContextTypes
+
+from services.metrics import metrics
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+class Kind(IntEnum):
+    """按钮动作类型 (编码为 callback_data 的第一个字节，只能追加，不能改已有的值)"""
+    SUBMIT_POST = 1
+    BACK_TO_MAIN = 2
+    MY_POSTS_PAGE = 3         # 字段: 页码[, 方向 (0 下一页 / 1 上一页), 游标时间戳, 游标行 ID]
+    MY_COLLECTIONS_PAGE = 4   # 字段同上
+    APPROVE = 5               # 字段: 投稿人 ID, 投稿消息 ID
+    DECLINE = 6               # 字段同上
+    LIKE = 7                  # 字段: 频道消息 ID (以下同)
+    DISLIKE = 8
+    COLLECT = 9
+    COMMENT_SHOW = 10
+    COMMENT_REFRESH = 11
+    COMMENT_HIDE = 12
+
+
+# 频道帖子上的按钮
+CHANNEL_KINDS = (Kind.LIKE, Kind.DISLIKE, Kind.COLLECT, Kind.COMMENT_SHOW, Kind.COMMENT_REFRESH, Kind.COMMENT_HIDE)
+
+
+class CallbackAction(NamedTuple):
+    kind: Kind
+    fields: Tuple[int, ...] = ()
+
+    def field(self, index: int, default: int = 0) -> int:
+        """读取第 index 个字段，旧数据没有该字段时返回 default"""
+        return self.fields[index] if index < len(self.fields) else default
+
+
+# --- 紧凑编码 ---
+# "~" + base64url(类型字节 + 每个字段的 zigzag varint)，不带填充。
+# 解码时忽略多出的字段、缺少的字段由 field() 取默认值，因此以后可以给动作追加字段；
+# 64 字节上限下，去掉前缀后最多 47 个原始字节 (如 4 个 64 位 ID 也只占约 41 字节)。
+
+_COMPACT_PREFIX = "~"
+
+
+def _write_varint(value: int, out: bytearray) -> None:
+    value = (value << 1) ^ (value >> 63)  # zigzag：负数也用短编码
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return
+
+
+def _read_varints(data: bytes, start: int) -> Tuple[int, ...]:
+    fields = []
+    value = shift = 0
+    for byte in data[start:]:
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if not byte & 0x80:
+            fields.append((value >> 1) ^ -(value & 1))
+            value = shift = 0
+    if shift:
+        raise ValueError("varint 不完整")
+    return tuple(fields)
+
+
+def encode_callback(kind: Kind, *fields: int) -> str:
+    """把动作编码为 callback_data"""
+    raw = bytearray((kind,))
+    for value in fields:
+        _write_varint(value, raw)
+    data = _COMPACT_PREFIX + base64.urlsafe_b64encode(bytes(raw)).rstrip(b"=").decode("ascii")
+    if len(data) > InlineKeyboardButtonLimit.MAX_CALLBACK_DATA:
+        raise ValueError(f"callback_data 超过 {InlineKeyboardButtonLimit.MAX_CALLBACK_DATA} 字节: {kind.name} {fields}")
+    return data
+
+
+# --- 旧格式 (已发布的帖子和旧消息上的按钮仍然是这种格式) ---
+
+def _legacy_page(kind: Kind, parts) -> CallbackAction:
+    # 页码[:方向:时间戳:行ID]，方向 'n' 下一页 / 'p' 上一页
+    if len(parts) < 4:
+        return CallbackAction(kind, (int(parts[0]),))
+    return CallbackAction(kind, (int(parts[0]), 1 if parts[1] == 'p' else 0, int(parts[2]), int(parts[3])))
+
+
+def _legacy_comment(parts) -> CallbackAction:
+    # comment:show/refresh/其他:帖子ID，其他子动作一律视为收起
+    kind = {"show": Kind.COMMENT_SHOW, "refresh": Kind.COMMENT_REFRESH}.get(parts[0], Kind.COMMENT_HIDE)
+    return CallbackAction(kind, tuple(int(part) for part in parts[1:2]))
+
+
+_LEGACY_PARSERS: Dict[str, Callable[[list], CallbackAction]] = {
+    "submit_post": lambda parts: CallbackAction(Kind.SUBMIT_POST),
+    "back_to_main": lambda parts: CallbackAction(Kind.BACK_TO_MAIN),
+    "my_posts_page": lambda parts: _legacy_page(Kind.MY_POSTS_PAGE, parts),
+    "my_collections_page": lambda parts: _legacy_page(Kind.MY_COLLECTIONS_PAGE, parts),
+    "approve": lambda parts: CallbackAction(Kind.APPROVE, (int(parts[0]), int(parts[1]))),
+    "decline": lambda parts: CallbackAction(Kind.DECLINE, (int(parts[0]), int(parts[1]))),
+    "react": lambda parts: CallbackAction(Kind.LIKE if parts[0] == 'like' else Kind.DISLIKE, (int(parts[1]),)),
+    "collect": lambda parts: CallbackAction(Kind.COLLECT, (int(parts[0]),)),
+    "comment": _legacy_comment,
+}
+
+
+@lru_cache(maxsize=4096)
+def decode_callback(data: Optional[str]) -> Optional[CallbackAction]:
+    """解析 callback_data (紧凑格式或旧格式)，无法识别时返回 None；结果按字符串缓存"""
+    if not data:
+        return None
+    try:
+        if data.startswith(_COMPACT_PREFIX):
+            payload = data[len(_COMPACT_PREFIX):]
+            raw = base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4))
+            return CallbackAction(Kind(raw[0]), _read_varints(raw, 1))
+
+        name, _, rest = data.partition(':')
+        parser = _LEGACY_PARSERS.get(name)
+        return parser(rest.split(':') if rest else []) if parser else None
+    except (ValueError, IndexError):
+        return None
+
+
+RouteFn = Callable[[Update, ContextTypes.DEFAULT_TYPE, CallbackAction], Awaitable[object]]
+
+
+class CallbackRouter:
+    """
+    所有按钮回调的统一入口：callback_data 只解析一次，按动作类型查表分发
+
+    路由函数的签名为 (update, context, action)，返回值原样交给 PTB
+    (在 ConversationHandler 中即下一个状态)。handler(*kinds) 生成只接受这些类型的
+    CallbackQueryHandler，用于顶层或 ConversationHandler 的各个状态。
+    """
+
+    def __init__(self):
+        self._routes: Dict[Kind, RouteFn] = {}
+
+    def route(self, kind: Kind, fn: RouteFn) -> None:
+        self._routes[kind] = fn
+
+    def handler(self, *kinds: Kind) -> CallbackQueryHandler:
+        accepted = frozenset(kinds)
+        missing = accepted - self._routes.keys()
+        if missing:
+            raise ValueError(f"以下按钮类型没有注册路由: {sorted(kind.name for kind in missing)}")
+
+        def matches(data: object) -> bool:
+            action = decode_callback(data) if isinstance(data, str) else None
+            return action is not None and action.kind in accepted
+
+        return CallbackQueryHandler(self.dispatch, pattern=matches)
+
+    async def dispatch(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        with tracer.span("callback.decode"):
+            action = decode_callback(update.callback_query.data)
+            route = self._routes[action.kind]
+        label = action.kind.name.lower()
+        started = time.perf_counter()
+        failed = True
+        try:
+            with tracer.span(f"handler.{label}", fields=action.fields):
+                result = await route(update, context, action)
+            failed = False
+            return result
+        finally:
+            metrics.observe_handler(label, time.perf_counter() - started, failed)
+
+
+router = CallbackRouter()
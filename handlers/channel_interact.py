@@ -1,175 +1,225 @@
 # handlers/channel_interact.py
 
-import aiosqlite
 import logging
-from typing import Tuple, Dict
+from collections import OrderedDict
+from typing import Tuple, Dict, Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
-from telegram.constants import ParseMode
+from telegram.constants import MessageLimit, ParseMode
 from telegram.ext import ContextTypes
 from telegram.error import TelegramError
 
-from config import DB_NAME, BOT_USERNAME, CHANNEL_USERNAME, CHANNEL_ID
+from config import BOT_USERNAME, CHANNEL_USERNAME, CHANNEL_ID, COMMENT_REFRESH_DELAY
+from handlers.callback_router import CallbackAction, Kind, encode_callback
+from handlers.pagination import count_cache
+from services.background import background_tasks
+from services.comment_preview import COMMENT_SECTION_HEADER, comment_previews, visible_length
+from services.edit_coalescer import edit_coalescer
+from services.notification_outbox import notification_outbox
+from services.outbound import Priority, outbound
+from services.post_cache import post_cache
+from services.profile_cache import profile_cache
+from services.tracing import traced
+from services.write_queue import toggle_writer
+from storage import ToggleIntent
 
 logger = logging.getLogger(__name__)
 
+# 自动置顶的点赞门槛
+HOT_POST_LIKES = 100
 
+# 每个帖子最近一次渲染时是否展开了评论区，评论变化后按同样的形态刷新 (最多记住的帖子数)
+_COMMENT_VIEW_SIZE = 4096
+_comment_view: "OrderedDict[int, bool]" = OrderedDict()
+
+
+@traced("check_and_pin_if_hot")
 async def check_and_pin_if_hot(context: ContextTypes.DEFAULT_TYPE, message_id: int, like_count: int):
     """检查点赞数，如果达到100自动置顶 (V10.4)"""
-    if like_count < 100:
+    if like_count < HOT_POST_LIKES:
         return
     
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 检查是否已经记录过置顶
-        cursor = await db.execute(
-            "SELECT id FROM pinned_posts WHERE channel_message_id = ?",
-            (message_id,)
+    # 检查是否已经记录过置顶
+    if await post_cache.is_pinned(message_id):
+        return  # 已经置顶过了
+    
+    try:
+        # 置顶消息
+        await outbound.submit(
+            CHANNEL_ID, Priority.NOTIFICATION, context.bot.pin_chat_message,
+            chat_id=CHANNEL_ID,
+            message_id=message_id,
+            disable_notification=True
         )
-        already_pinned = await cursor.fetchone()
         
-        if already_pinned:
-            return  # 已经置顶过了
+        # 记录到数据库
+        await post_cache.record_pin(message_id, like_count)
         
-        try:
-            # 置顶消息
-            await context.bot.pin_chat_message(
-                chat_id=CHANNEL_ID,
-                message_id=message_id,
-                disable_notification=True
-            )
-            
-            # 记录到数据库
-            await db.execute(
-                "INSERT INTO pinned_posts (channel_message_id, like_count_at_pin) VALUES (?, ?)",
-                (message_id, like_count)
-            )
-            await db.commit()
+        logger.info(f"🔥 帖子 {message_id} 达到 {like_count} 赞，已自动置顶！")
+        
+        # 通知作者
+        post_info = await post_cache.get_submission(message_id)
+        
+        if post_info:
+            author_id, content_text = post_info.user_id, post_info.content_text
+            post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
             
-            logger.info(f"🔥 帖子 {message_id} 达到 {like_count} 赞，已自动置顶！")
+            preview_text = (content_text or "你的作品")[:30]
+            preview_text = preview_text.replace('<', '&lt;').replace('>', '&gt;')
+            if len(content_text or "") > 30:
+                preview_text += "..."
             
-            # 通知作者
-            cursor = await db.execute(
-                "SELECT user_id, content_text FROM submissions WHERE channel_message_id = ?",
-                (message_id,)
+            notification = (
+                f"🔥 <b>恭喜！你的作品火了！</b>\n\n"
+                f"你的作品 <a href='{post_url}'>{preview_text}</a> 获得了 <b>{like_count}</b> 个赞！\n\n"
+                f"✨ 已被自动置顶到频道顶部，更多人会看到你的精彩内容！"
             )
-            post_info = await cursor.fetchone()
             
-            if post_info:
-                author_id, content_text = post_info
-                post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
-                
-                preview_text = (content_text or "你的作品")[:30]
-                preview_text = preview_text.replace('<', '&lt;').replace('>', '&gt;')
-                if len(content_text or "") > 30:
-                    preview_text += "..."
-                
-                notification = (
-                    f"🔥 <b>恭喜！你的作品火了！</b>\n\n"
-                    f"你的作品 <a href='{post_url}'>{preview_text}</a> 获得了 <b>{like_count}</b> 个赞！\n\n"
-                    f"✨ 已被自动置顶到频道顶部，更多人会看到你的精彩内容！"
+            try:
+                await outbound.submit(
+                    author_id, Priority.NOTIFICATION, context.bot.send_message,
+                    chat_id=author_id,
+                    text=notification,
+                    parse_mode=ParseMode.HTML
                 )
+            except TelegramError as e:
+                logger.warning(f"发送置顶通知失败: {e}")
                 
-                try:
-                    await context.bot.send_message(
-                        chat_id=author_id,
-                        text=notification,
-                        parse_mode=ParseMode.HTML
-                    )
-                except TelegramError as e:
-                    logger.warning(f"发送置顶通知失败: {e}")
-                    
-        except TelegramError as e:
-            logger.error(f"置顶消息失败: {e}")
-
-
-async def get_all_counts(db, message_id: int) -> Dict[str, int]:
-    """查询并返回一个帖子的所有计数"""
-    cursor = await db.execute("SELECT reaction_type, COUNT(*) FROM reactions WHERE channel_message_id = ? GROUP BY reaction_type", (message_id,))
-    counts = dict(await cursor.fetchall())
-    like_count = counts.get(1, 0)
-    dislike_count = counts.get(-1, 0)
-    
-    cursor = await db.execute("SELECT COUNT(*) FROM collections WHERE channel_message_id = ?", (message_id,))
-    collection_count = (await cursor.fetchone() or [0])[0]
-    
-    cursor = await db.execute("SELECT COUNT(*) FROM comments WHERE channel_message_id = ?", (message_id,))
-    comment_count = (await cursor.fetchone() or [0])[0]
-    
-    return {
-        "likes": like_count,
-        "dislikes": dislike_count,
-        "comments": comment_count,
-        "collections": collection_count,
-    }
-
-
-async def build_comment_section(db, message_id: int) -> Tuple[str, int]:
-    """从数据库构建评论区文本"""
-    cursor = await db.execute(
-        "SELECT user_id, user_name, comment_text FROM comments WHERE channel_message_id = ? ORDER BY timestamp ASC LIMIT 5",
-        (message_id,)
-    )
-    comments = await cursor.fetchall()
-    
-    cursor = await db.execute("SELECT COUNT(*) FROM comments WHERE channel_message_id = ?", (message_id,))
-    total_comments = (await cursor.fetchone() or [0])[0]
+    except TelegramError as e:
+        logger.error(f"置顶消息失败: {e}")
 
-    if not comments:
-        return ("\n\n--- 评论区 ---\n✨ 暂无评论，快来抢沙发吧！", 0)
-    
-    comment_text = f"\n\n--- 评论区 ({total_comments}条) ---\n"
-    
-    for idx, (uid, uname, text) in enumerate(comments, 1):
-        safe_user_name = uname.replace('<', '&lt;').replace('>', '&gt;')
-        safe_text = text.replace('<', '&lt;').replace('>', '&gt;')
-        comment_text += f'{idx}. <a href="tg://user?id={uid}">{safe_user_name}</a>: {safe_text}\n'
-    
-    if total_comments > 5:
-        comment_text += "...\n"
-        
-    return (comment_text, total_comments)
 
+@traced("get_all_counts")
+async def get_all_counts(message_id: int) -> Dict[str, int]:
+    """查询并返回一个帖子的所有计数 (读取 post_stats 计数表)"""
+    return await post_cache.get_post_stats(message_id)
 
-async def send_notification(context: ContextTypes.DEFAULT_TYPE, author_id: int, actor_id: int, actor_name: str, 
-                            message_id: int, content_preview: str, action_type: str):
-    """发送互动通知给作者"""
-    # 不要给自己发通知
-    if author_id == actor_id:
-        return
+
+async def build_comment_section(message_id: int, budget: int = MessageLimit.CAPTION_LENGTH) -> Tuple[str, int]:
+    """构建评论区文本 (可见长度不超过 budget)，评论没有变化时直接使用缓存的渲染结果"""
+    return await comment_previews.get(message_id, budget)
+
+
+def build_footer(author_id: int, author_name: str, author_username: str) -> str:
+    """帖子页脚：作者链接 + 机器人入口"""
+    if author_username:
+        author_link = f'👤 作者: <a href="https://t.me/{author_username}">{author_name}</a>'
+    else:
+        author_link = f'👤 作者: <a href="tg://user?id={author_id}">{author_name}</a>'
     
-    # 生成作品链接
-    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
+    my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
+    return f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
+
+
+async def build_base_caption(context: ContextTypes.DEFAULT_TYPE, message_id: int, fallback_caption: str) -> Tuple[str, Optional[int], str]:
+    """重建帖子正文 + 页脚，返回 (base_caption, author_id, content_text)"""
+    # 获取原始内容和作者信息
+    db_row = await post_cache.get_submission(message_id)
+        
+    if not db_row:
+        return (fallback_caption.split(COMMENT_SECTION_HEADER)[0], None, "")
+
+    content_text, author_id, author_name = db_row.content_text, db_row.user_id, db_row.user_name
     
-    # 生成行为者链接
-    actor_link = f'<a href="tg://user?id={actor_id}">{actor_name}</a>'
+    # 重建页脚 (作者资料来自缓存/用户目录，过期时在后台刷新；投稿时的名字只作兜底)
+    profile = await profile_cache.get(context.bot, author_id)
+    author_username = profile.username if profile else ""
+    author_name = (profile.full_name if profile else "") or author_name
     
-    # 生成作品预览链接
-    preview_text = content_preview[:30] + "..." if len(content_preview) > 30 else content_preview
-    preview_text = preview_text.replace('<', '&lt;').replace('>', '&gt;')
-    post_link = f'<a href="{post_url}">{preview_text}</a>'
+    return ((content_text or "") + build_footer(author_id, author_name, author_username), author_id, content_text)
+
+
+def build_main_keyboard(message_id: int, counts: Dict[str, int]) -> InlineKeyboardMarkup:
+    """主按钮栏 (两行布局)"""
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton(f"👍 赞 {counts['likes']}", callback_data=encode_callback(Kind.LIKE, message_id)),
+            InlineKeyboardButton(f"👎 踩 {counts['dislikes']}", callback_data=encode_callback(Kind.DISLIKE, message_id)),
+            InlineKeyboardButton(f"⭐ 收藏 {counts['collections']}", callback_data=encode_callback(Kind.COLLECT, message_id)),
+        ],
+        [
+            InlineKeyboardButton(f"💬 评论 {counts['comments']}", callback_data=encode_callback(Kind.COMMENT_SHOW, message_id)),
+        ]
+    ])
+
+
+def build_comment_keyboard(message_id: int) -> InlineKeyboardMarkup:
+    """评论区展开后的按钮栏"""
+    add_comment_link = f"https://t.me/{BOT_USERNAME}?start=comment_{message_id}"
+    manage_comment_link = f"https://t.me/{BOT_USERNAME}?start=manage_comments_{message_id}"
     
-    # 根据不同的动作类型生成消息
-    if action_type == "like":
-        message = f"👍 {actor_link} 赞了你的作品 {post_link}"
-    elif action_type == "collect":
-        message = f"⭐ {actor_link} 收藏了你的作品 {post_link}"
-    elif action_type == "comment":
-        message = f"💬 {actor_link} 评论了你的作品 {post_link}"
-    else:
+    return InlineKeyboardMarkup([
+        [
+            InlineKeyboardButton("✍️ 发表评论", url=add_comment_link),
+            InlineKeyboardButton("🗑️ 删除评论", url=manage_comment_link),
+            InlineKeyboardButton("🔄 刷新", callback_data=encode_callback(Kind.COMMENT_REFRESH, message_id)),
+        ],
+        [
+            InlineKeyboardButton("⬆️ 收起", callback_data=encode_callback(Kind.COMMENT_HIDE, message_id)),
+        ]
+    ])
+
+
+async def render_post(context: ContextTypes.DEFAULT_TYPE, message_id: int, show_comments: bool,
+                      fallback_caption: str = "") -> Tuple[str, InlineKeyboardMarkup]:
+    """按数据库中的最新状态渲染频道消息的 caption 和按钮"""
+    base_caption, _, _ = await build_base_caption(context, message_id, fallback_caption)
+
+    if show_comments:
+        # 评论区只能使用正文之外剩余的 caption 长度
+        budget = MessageLimit.CAPTION_LENGTH - visible_length(base_caption)
+        comment_section, _ = await build_comment_section(message_id, budget)
+        return (base_caption + comment_section, build_comment_keyboard(message_id))
+
+    counts = await get_all_counts(message_id)
+
+    # 达到置顶门槛的帖子在内容前添加火标识
+    if counts['likes'] >= HOT_POST_LIKES and not base_caption.startswith("🔥"):
+        base_caption = "🔥 " + base_caption
+
+    return (base_caption, build_main_keyboard(message_id, counts))
+
+
+def schedule_post_render(context: ContextTypes.DEFAULT_TYPE, message_id: int, show_comments: bool,
+                         current_message=None, delay: float = 0.0) -> None:
+    """登记一次频道消息重绘，由 edit_coalescer 合并后发送"""
+    fallback_caption = ""
+    current = None
+    if current_message is not None:
+        fallback_caption = current_message.caption_html or ""
+        current = (current_message.caption_html, current_message.reply_markup)
+
+    _comment_view[message_id] = show_comments
+    _comment_view.move_to_end(message_id)
+    while len(_comment_view) > _COMMENT_VIEW_SIZE:
+        _comment_view.popitem(last=False)
+
+    async def render():
+        return await render_post(context, message_id, show_comments, fallback_caption)
+
+    edit_coalescer.schedule(context.bot, message_id, render, current=current, delay=delay)
+
+
+async def schedule_comment_refresh(context: ContextTypes.DEFAULT_TYPE, message_id: int) -> None:
+    """
+    评论新增/删除后刷新频道消息 (评论数按钮或展开的评论区)：延迟 COMMENT_REFRESH_DELAY 秒，
+    期间同一帖子的多条评论只产生一次编辑
+    """
+    # 没有投稿记录时无法重建正文，不刷新 (避免把 caption 清空)
+    if await post_cache.get_submission(message_id) is None:
         return
-    
-    try:
-        await context.bot.send_message(
-            chat_id=author_id,
-            text=message,
-            parse_mode=ParseMode.HTML,
-            disable_web_page_preview=False
-        )
-        logger.info(f"通知已发送：{action_type} by {actor_id} to author {author_id}")
-    except TelegramError as e:
-        logger.warning(f"发送通知失败: {e}")
+    schedule_post_render(context, message_id, show_comments=_comment_view.get(message_id, False),
+                         delay=COMMENT_REFRESH_DELAY)
+
 
+# 按钮类型 -> (切换动作, 反应值)
+_TOGGLES = {
+    Kind.LIKE: ('react', 1),
+    Kind.DISLIKE: ('react', -1),
+    Kind.COLLECT: ('collect', 0),
+}
 
-async def handle_channel_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+
+async def handle_channel_interaction(update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> None:
     """处理频道内的所有按钮点击 (V10.4)"""
     query = update.callback_query
     await query.answer()
@@ -177,151 +227,38 @@ async def handle_channel_interaction(update: Update, context: ContextTypes.DEFAU
     user_name = query.from_user.full_name
     message_id = query.message.message_id
     
-    callback_data = query.data.split(':')
-    action = callback_data[0]
-
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 获取原始内容和作者信息
-        cursor = await db.execute(
-            "SELECT content_text, user_id, user_name FROM submissions WHERE channel_message_id = ?",
-            (message_id,)
-        )
-        db_row = await cursor.fetchone()
-        
-        if db_row:
-            content_text, author_id, author_name = db_row
-            
-            # 重建页脚
-            try:
-                author_chat = await context.bot.get_chat(author_id)
-                author_username = author_chat.username or ""
-            except:
-                author_username = ""
-            
-            if author_username:
-                author_link = f'👤 作者: <a href="https://t.me/{author_username}">{author_name}</a>'
-            else:
-                author_link = f'👤 作者: <a href="tg://user?id={author_id}">{author_name}</a>'
-            
-            my_link = f'<a href="https://t.me/{BOT_USERNAME}?start=main">📱 我的</a>'
-            footer = f"\n\n━━━━━━━━━━━━━━\n{author_link}  |  {my_link}"
-            
-            base_caption = (content_text or "") + footer
-        else:
-            current_caption = query.message.caption_html or ""
-            base_caption = current_caption.split("\n\n--- 评论区 ---")[0]
-            author_id = None
-            content_text = ""
-
-        # 动作分支 1: 展开/刷新评论区
-        if action == 'comment' and callback_data[1] in ['show', 'refresh']:
-            comment_section, _ = await build_comment_section(db, message_id)
-            new_caption = base_caption + comment_section
-            
-            # 构建按钮
-            add_comment_link = f"https://t.me/{BOT_USERNAME}?start=comment_{message_id}"
-            manage_comment_link = f"https://t.me/{BOT_USERNAME}?start=manage_comments_{message_id}"
-            
-            comment_keyboard = [
-                [
-                    InlineKeyboardButton("✍️ 发表评论", url=add_comment_link),
-                    InlineKeyboardButton("🗑️ 删除评论", url=manage_comment_link),
-                    InlineKeyboardButton("🔄 刷新", callback_data=f"comment:refresh:{message_id}"),
-                ],
-                [
-                    InlineKeyboardButton("⬆️ 收起", callback_data=f"comment:hide:{message_id}"),
-                ]
-            ]
-            
-            reply_markup = InlineKeyboardMarkup(comment_keyboard)
-            
-            if new_caption != query.message.caption_html or reply_markup != query.message.reply_markup:
-                try:
-                    await query.edit_message_caption(
-                        caption=new_caption,
-                        parse_mode=ParseMode.HTML,
-                        reply_markup=reply_markup
-                    )
-                except Exception as e:
-                    logger.warning(f"展开/刷新评论区失败: {e}")
-            return
-
-        # 动作分支 2: 处理点赞、收藏、或收起评论
-        notification_type = None
-        should_check_pin = False
-        
-        if action == 'react':
-            reaction_type = callback_data[1]
-            reaction_value = 1 if reaction_type == 'like' else -1
-            
-            cursor = await db.execute("SELECT reaction_type FROM reactions WHERE channel_message_id = ? AND user_id = ?", (message_id, user_id))
-            existing_reaction = await cursor.fetchone()
-            
-            if existing_reaction is None:
-                # 新增点赞/踩
-                await db.execute("INSERT INTO reactions (channel_message_id, user_id, reaction_type) VALUES (?, ?, ?)", (message_id, user_id, reaction_value))
-                if reaction_type == 'like':
-                    notification_type = "like"
-                    should_check_pin = True
-            elif existing_reaction[0] == reaction_value:
-                # 取消点赞/踩 - 不发通知
-                await db.execute("DELETE FROM reactions WHERE channel_message_id = ? AND user_id = ?", (message_id, user_id))
-            else:
-                # 从踩切换到赞，或从赞切换到踩
-                await db.execute("UPDATE reactions SET reaction_type = ? WHERE channel_message_id = ? AND user_id = ?", (reaction_value, message_id, user_id))
-                if reaction_type == 'like':
-                    notification_type = "like"
-                    should_check_pin = True
-        
-        elif action == 'collect':
-            cursor = await db.execute("SELECT id FROM collections WHERE channel_message_id = ? AND user_id = ?", (message_id, user_id))
-            is_collected = await cursor.fetchone()
-            
-            if is_collected:
-                await db.execute("DELETE FROM collections WHERE id = ?", (is_collected[0],))
-            else:
-                await db.execute("INSERT INTO collections (channel_message_id, user_id) VALUES (?, ?)", (message_id, user_id))
-                notification_type = "collect"
-        
-        await db.commit()
+    # 动作分支 1: 展开/刷新评论区
+    if action.kind in (Kind.COMMENT_SHOW, Kind.COMMENT_REFRESH):
+        schedule_post_render(context, message_id, show_comments=True, current_message=query.message)
+        return
 
-        # 发送通知
-        if notification_type and author_id:
-            await send_notification(
-                context, author_id, user_id, user_name, 
-                message_id, content_text, notification_type
-            )
+    # 动作分支 2: 收起评论区
+    if action.kind == Kind.COMMENT_HIDE:
+        schedule_post_render(context, message_id, show_comments=False, current_message=query.message)
+        return
 
-        # 重新计算所有计数
-        counts = await get_all_counts(db, message_id)
+    # 动作分支 3: 处理点赞、收藏 (交给单写者队列批量提交)
+    toggle_action, reaction_value = _TOGGLES[action.kind]
+    result = await toggle_writer.submit(ToggleIntent(toggle_action, message_id, user_id, reaction_value, user_name))
+    if action.kind == Kind.COLLECT:
+        count_cache.invalidate('collections', user_id)
+    counts = result.counts
+    notification_type = result.notification_type
+    should_check_pin = result.should_check_pin
 
-        # 检查是否需要置顶
-        if should_check_pin and counts['likes'] >= 100:
-            await check_and_pin_if_hot(context, message_id, counts['likes'])
-            
-            # 如果达到100赞，在内容前添加火标识
-            if not base_caption.startswith("🔥"):
-                base_caption = "🔥 " + base_caption
-
-        # 重绘主按钮栏
-        new_main_keyboard = [
-            [
-                InlineKeyboardButton(f"👍 赞 {counts['likes']}", callback_data=f"react:like:{message_id}"),
-                InlineKeyboardButton(f"👎 踩 {counts['dislikes']}", callback_data=f"react:dislike:{message_id}"),
-                InlineKeyboardButton(f"⭐ 收藏 {counts['collections']}", callback_data=f"collect:{message_id}"),
-            ],
-            [
-                InlineKeyboardButton(f"💬 评论 {counts['comments']}", callback_data=f"comment:show:{message_id}"),
-            ]
-        ]
-        reply_markup = InlineKeyboardMarkup(new_main_keyboard)
+    # 重绘主按钮栏 (合并短时间内的多次点击，只发送最新状态)
+    schedule_post_render(context, message_id, show_comments=False, current_message=query.message)
 
-        if base_caption != query.message.caption_html or reply_markup != query.message.reply_markup:
-            try:
-                await query.edit_message_caption(
-                    caption=base_caption,
-                    parse_mode=ParseMode.HTML,
-                    reply_markup=reply_markup
-                )
-            except Exception as e:
-                logger.warning(f"更新主按钮栏失败: {e}")
\ No newline at end of file
+    # 通知已在同一事务内写入发件箱，唤醒后台投递
+    if notification_type:
+        notification_outbox.wake()
+
+    # 检查是否需要置顶：置顶和通知作者放到后台执行，不阻塞本次点击
+    # (同一帖子同时只有一个检查；任务被丢弃时下一次点赞会重新检查)
+    if should_check_pin and counts['likes'] >= HOT_POST_LIKES:
+        like_count = counts['likes']
+        background_tasks.spawn(
+            f"pin:{message_id}",
+            lambda: check_and_pin_if_hot(context, message_id, like_count),
+            key=("pin", message_id)
+        )
@@ -1,12 +1,16 @@
 # handlers/comment_management.py
 
-import aiosqlite
 import logging
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes, ConversationHandler
 from telegram.constants import ParseMode
 
-from config import DB_NAME, CHANNEL_USERNAME, DELETING_COMMENT
+from config import CHANNEL_USERNAME, DELETING_COMMENT
+from handlers.channel_interact import schedule_comment_refresh
+from services.comment_preview import comment_previews
+from services.outbound import Priority, outbound
+from services.post_cache import post_cache
+from storage import storage
 
 logger = logging.getLogger(__name__)
 
@@ -25,51 +29,38 @@ async def show_delete_comment_menu(update: Update, context: ContextTypes.DEFAULT
         return ConversationHandler.END
     
     if not context.args or not context.args[0].startswith('manage_comments_'):
-        await message.reply_text("❌ 无效的请求。")
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, "❌ 无效的请求。")
         return ConversationHandler.END
     
     try:
         message_id = int(context.args[0].replace('manage_comments_', ''))
     except ValueError:
-        await message.reply_text("❌ 无效的帖子ID。")
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, "❌ 无效的帖子ID。")
         return ConversationHandler.END
     
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 检查帖子是否存在
-        cursor = await db.execute(
-            "SELECT user_id FROM submissions WHERE channel_message_id = ?",
-            (message_id,)
-        )
-        post_info = await cursor.fetchone()
-        
-        if not post_info:
-            await message.reply_text("❌ 帖子不存在。")
-            return ConversationHandler.END
-        
-        author_id = post_info[0]
-        is_author = (user_id == author_id)
-        
-        # 查询用户自己的评论
-        cursor = await db.execute(
-            "SELECT id, comment_text, timestamp FROM comments WHERE channel_message_id = ? AND user_id = ? ORDER BY timestamp DESC",
-            (message_id, user_id)
-        )
-        my_comments = await cursor.fetchall()
-        
-        # 如果是作者，查询其他人的评论
-        other_comments = []
-        if is_author:
-            cursor = await db.execute(
-                "SELECT id, user_id, user_name, comment_text, timestamp FROM comments WHERE channel_message_id = ? AND user_id != ? ORDER BY timestamp DESC",
-                (message_id, user_id)
-            )
-            other_comments = await cursor.fetchall()
+    # 检查帖子是否存在
+    post_info = await storage.get_submission(message_id)
+    
+    if not post_info:
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, "❌ 帖子不存在。")
+        return ConversationHandler.END
+    
+    author_id = post_info.user_id
+    is_author = (user_id == author_id)
+    
+    # 查询用户自己的评论
+    my_comments = await storage.list_user_comments(message_id, user_id)
+    
+    # 如果是作者，查询其他人的评论
+    other_comments = []
+    if is_author:
+        other_comments = await storage.list_other_comments(message_id, user_id)
     
     # 保存到 context
     context.user_data['delete_mode'] = {
         'message_id': message_id,
-        'my_comments': {str(idx): cid for idx, (cid, _, _) in enumerate(my_comments, 1)},
-        'other_comments': {str(idx): cid for idx, (cid, _, _, _, _) in enumerate(other_comments, 1)} if is_author else {},
+        'my_comments': {str(idx): comment.id for idx, comment in enumerate(my_comments, 1)},
+        'other_comments': {str(idx): comment.id for idx, comment in enumerate(other_comments, 1)} if is_author else {},
         'is_author': is_author
     }
     
@@ -79,7 +70,8 @@ async def show_delete_comment_menu(update: Update, context: ContextTypes.DEFAULT
     # 显示"你的评论"
     if my_comments:
         message_text += "📝 <b>你的评论：</b>\n"
-        for idx, (comment_id, text, timestamp) in enumerate(my_comments, 1):
+        for idx, comment in enumerate(my_comments, 1):
+            text = comment.comment_text
             preview = text[:80] + "..." if len(text) > 80 else text
             preview = preview.replace('<', '&lt;').replace('>', '&gt;')
             message_text += f"\n<b>{idx}.</b> {preview}\n"
@@ -93,10 +85,11 @@ async def show_delete_comment_menu(update: Update, context: ContextTypes.DEFAULT
             message_text += "👥 <b>其他人的评论：</b>\n"
             # V10.4.1 修复：其他人的评论编号从"你的评论数+1"开始
             start_num = len(my_comments) + 1
-            for idx, (comment_id, uid, uname, text, timestamp) in enumerate(other_comments, start_num):
+            for idx, comment in enumerate(other_comments, start_num):
+                text = comment.comment_text
                 preview = text[:80] + "..." if len(text) > 80 else text
                 preview = preview.replace('<', '&lt;').replace('>', '&gt;')
-                message_text += f"\n<b>{idx}.</b> <b>{uname}:</b> {preview}\n"
+                message_text += f"\n<b>{idx}.</b> <b>{comment.user_name}:</b> {preview}\n"
         else:
             message_text += "👥 <b>其他人的评论：</b> 暂无\n"
     
@@ -114,7 +107,8 @@ async def show_delete_comment_menu(update: Update, context: ContextTypes.DEFAULT
     keyboard = [[InlineKeyboardButton("↩️ 返回帖子", url=post_url)]]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
-    await update.message.reply_text(
+    await outbound.submit(
+        update.message.chat_id, Priority.REPLY, update.message.reply_text,
         message_text,
         parse_mode=ParseMode.HTML,
         reply_markup=reply_markup
@@ -127,7 +121,7 @@ async def handle_delete_comment_input(update: Update, context: ContextTypes.DEFA
     """处理用户输入的评论编号"""
     
     # ===== 强制调试：无论什么状态都先回复 =====
-    await update.message.reply_text(f"🔍 DEBUG: 收到消息 '{update.message.text}'")
+    await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, f"🔍 DEBUG: 收到消息 '{update.message.text}'")
     # ==========================================
     
     user_id = update.message.from_user.id
@@ -141,7 +135,8 @@ async def handle_delete_comment_input(update: Update, context: ContextTypes.DEFA
     delete_data = context.user_data.get('delete_mode')
     if not delete_data:
         logger.warning("❌ delete_mode 数据不存在！")
-        await update.message.reply_text(
+        await outbound.submit(
+            update.message.chat_id, Priority.REPLY, update.message.reply_text,
             "❌ 会话已过期或你没有通过正确的方式进入删除模式。\n\n"
             "正确步骤：\n"
             "1. 在频道点击 💬 评论\n"
@@ -158,7 +153,7 @@ async def handle_delete_comment_input(update: Update, context: ContextTypes.DEFA
     # 检查输入是否是数字
     if not text.isdigit():
         logger.warning(f"输入不是数字: {text}")
-        await update.message.reply_text("❌ 请发送评论编号（数字）。")
+        await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "❌ 请发送评论编号（数字）。")
         return DELETING_COMMENT
     
     # 检查编号是否存在
@@ -183,39 +178,40 @@ async def handle_delete_comment_input(update: Update, context: ContextTypes.DEFA
     if not comment_id:
         total_count = len(my_comments) + (len(other_comments) if is_author else 0)
         logger.warning(f"编号 {text} 不存在。我的评论: {my_comments.keys()}, 其他评论: {other_comments.keys()}")
-        await update.message.reply_text(
+        await outbound.submit(
+            update.message.chat_id, Priority.REPLY, update.message.reply_text,
             f"❌ 评论编号 {text} 不存在。\n"
             f"请发送 1-{total_count} 之间的数字。"
         )
         return DELETING_COMMENT
     
     # 删除评论
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 再次验证权限
-        cursor = await db.execute(
-            "SELECT c.user_id, c.comment_text, c.user_name, s.user_id FROM comments c JOIN submissions s ON c.channel_message_id = s.channel_message_id WHERE c.id = ?",
-            (comment_id,)
-        )
-        comment_info = await cursor.fetchone()
-        
-        if not comment_info:
-            await update.message.reply_text("❌ 评论不存在或已被删除。")
-            return ConversationHandler.END
-        
-        comment_user_id, comment_text, comment_user_name, post_author_id = comment_info
-        
-        # 检查权限
-        if user_id != comment_user_id and user_id != post_author_id:
-            await update.message.reply_text("❌ 你没有权限删除这条评论。")
-            return ConversationHandler.END
-        
-        # 删除评论
-        await db.execute("DELETE FROM comments WHERE id = ?", (comment_id,))
-        await db.commit()
+    # 再次验证权限
+    comment_info = await storage.get_comment_for_delete(comment_id)
+    
+    if not comment_info:
+        await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "❌ 评论不存在或已被删除。")
+        return ConversationHandler.END
+    
+    comment_user_id, comment_text, comment_user_name, post_author_id, comment_post_id = comment_info
+    
+    # 检查权限
+    if user_id != comment_user_id and user_id != post_author_id:
+        await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "❌ 你没有权限删除这条评论。")
+        return ConversationHandler.END
+    
+    # 删除评论 (与此同时被别人删掉时视为不存在)
+    if not await storage.delete_comment(comment_id):
+        await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "❌ 评论不存在或已被删除。")
+        return ConversationHandler.END
+    post_cache.note_comment(comment_post_id)
+    comment_previews.bump(comment_post_id)
+    await schedule_comment_refresh(context, comment_post_id)
     
     # 成功提示
     preview = comment_text[:50] + "..." if len(comment_text) > 50 else comment_text
-    await update.message.reply_text(
+    await outbound.submit(
+        update.message.chat_id, Priority.REPLY, update.message.reply_text,
         f"✅ 已删除{comment_owner}评论\n\n"
         f"内容：{preview}\n\n"
         f"继续发送编号可删除更多评论，或发送 /cancel 结束。"
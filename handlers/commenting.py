@@ -1,13 +1,16 @@
 # handlers/commenting.py
 
-import aiosqlite
 import logging
 from telegram import Update
 from telegram.ext import ContextTypes, ConversationHandler
-from telegram.constants import ParseMode
-from telegram.error import TelegramError
 
-from config import DB_NAME, COMMENTING, CHANNEL_USERNAME
+from config import COMMENTING
+from handlers.channel_interact import schedule_comment_refresh
+from services.comment_preview import comment_previews
+from services.notification_outbox import notification_outbox
+from services.outbound import Priority, outbound
+from services.post_cache import post_cache
+from storage import storage
 
 logger = logging.getLogger(__name__)
 
@@ -20,12 +23,13 @@ async def prompt_comment(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         message_id = context.user_data.pop('deep_link_message_id')
     
     if not message_id:
-        await context.bot.send_message(chat_id=user_id, text="❌ 错误的评论请求。")
+        await outbound.submit(user_id, Priority.REPLY, context.bot.send_message, chat_id=user_id, text="❌ 错误的评论请求。")
         return ConversationHandler.END
 
     context.user_data['commenting_on_message_id'] = message_id
     
-    await context.bot.send_message(
+    await outbound.submit(
+        user_id, Priority.REPLY, context.bot.send_message,
         chat_id=user_id,
         text="✍️ 您正在发表评论，请输入内容：\n\n(输入 /cancel 可随时取消)"
     )
@@ -40,54 +44,17 @@ async def handle_new_comment(update: Update, context: ContextTypes.DEFAULT_TYPE)
     message_id = context.user_data.get('commenting_on_message_id')
 
     if not message_id:
-        await update.message.reply_text("❌ 操作超时或出现错误，请回到频道重试。")
+        await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "❌ 操作超时或出现错误，请回到频道重试。")
         return ConversationHandler.END
 
-    async with aiosqlite.connect(DB_NAME) as db:
-        # 保存评论
-        await db.execute(
-            "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text) VALUES (?, ?, ?, ?)",
-            (message_id, user.id, user.full_name, comment_text)
-        )
-        await db.commit()
-        
-        # 获取作者信息并发送通知
-        cursor = await db.execute(
-            "SELECT user_id, content_text FROM submissions WHERE channel_message_id = ?",
-            (message_id,)
-        )
-        post_info = await cursor.fetchone()
+    # 保存评论 (给作者的通知在同一事务内写入发件箱，由后台投递)
+    await storage.add_comment(message_id, user.id, user.full_name, comment_text)
+    post_cache.note_comment(message_id)
+    comment_previews.bump(message_id)
+    notification_outbox.wake()
+    await schedule_comment_refresh(context, message_id)
 
-    await update.message.reply_text("✅ 评论成功！\n\n帖子的评论数将在下次有人互动时更新。")
-
-    # 发送通知给作者
-    if post_info:
-        author_id, content_text = post_info
-        
-        # 不给自己发通知
-        if author_id != user.id:
-            # 生成链接
-            post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
-            actor_link = f'<a href="tg://user?id={user.id}">{user.full_name}</a>'
-            
-            preview_text = (content_text or "你的作品")[:30]
-            preview_text = preview_text.replace('<', '&lt;').replace('>', '&gt;')
-            if len(content_text or "") > 30:
-                preview_text += "..."
-            post_link = f'<a href="{post_url}">{preview_text}</a>'
-            
-            notification_message = f"💬 {actor_link} 评论了你的作品 {post_link}\n\n评论内容：{comment_text[:50]}{'...' if len(comment_text) > 50 else ''}"
-            
-            try:
-                await context.bot.send_message(
-                    chat_id=author_id,
-                    text=notification_message,
-                    parse_mode=ParseMode.HTML,
-                    disable_web_page_preview=False
-                )
-                logger.info(f"评论通知已发送给作者 {author_id}")
-            except TelegramError as e:
-                logger.warning(f"发送评论通知失败: {e}")
+    await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "✅ 评论成功！\n\n频道中的评论数稍后会自动更新。")
 
     context.user_data.clear()
     return ConversationHandler.END
\ No newline at end of file
@@ -0,0 +1,174 @@
+# handlers/pagination.py
+
+import math
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, List, NamedTuple, Optional, Tuple
+
+from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.ext import ContextTypes
+
+from config import CHANNEL_USERNAME, PAGE_COUNT_CACHE_SIZE, PAGE_COUNT_CACHE_TTL
+from handlers.callback_router import CallbackAction, Kind, encode_callback
+from services.outbound import Priority, outbound
+from storage import PageRow
+
+# 第一页使用的"无穷大"游标：比任何真实记录都新 (9999-12-31 23:59:59 UTC)
+_FIRST_PAGE_CURSOR = (253402300799, 2 ** 62)
+
+
+class Cursor(NamedTuple):
+    direction: str  # 'n' 下一页 (更旧) / 'p' 上一页 (更新)
+    timestamp: int  # Unix 秒
+    row_id: int
+
+
+def encode_cursor(page: int, direction: str, timestamp: int, row_id: int) -> Tuple[int, int, int, int]:
+    """游标编码为 callback_data 字段: 页码, 方向 (0 下一页 / 1 上一页), 时间戳(秒), 行ID"""
+    return (page, 1 if direction == 'p' else 0, timestamp, row_id)
+
+
+def decode_cursor(fields: Tuple[int, ...]) -> Tuple[int, Optional[Cursor]]:
+    """解析翻页按钮的字段；只有页码时表示第一页"""
+    if len(fields) < 4:
+        return (1, None)
+    return (fields[0], Cursor('p' if fields[1] else 'n', fields[2], fields[3]))
+
+
+class _CountCache:
+    """按 (列表类型, 用户) 缓存总数，带 TTL，数据变化时主动失效"""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[str, int], Tuple[float, int]]" = OrderedDict()
+
+    def get(self, kind: str, user_id: int) -> Optional[int]:
+        entry = self._entries.get((kind, user_id))
+        if entry is None or entry[0] < time.monotonic():
+            return None
+        return entry[1]
+
+    def put(self, kind: str, user_id: int, count: int) -> None:
+        self._entries[(kind, user_id)] = (time.monotonic() + self.ttl, count)
+        self._entries.move_to_end((kind, user_id))
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, kind: str, user_id: int) -> None:
+        self._entries.pop((kind, user_id), None)
+
+
+count_cache = _CountCache(PAGE_COUNT_CACHE_SIZE, PAGE_COUNT_CACHE_TTL)
+
+
+class Paginator:
+    """
+    基于游标 (keyset) 的分页列表
+
+    callback_data 携带当前页第一条/最后一条记录的 (timestamp, id)，
+    翻页时用 (timestamp, id) 比较直接定位，不再使用 OFFSET；
+    总数来自 count_cache，只在缓存失效时执行一次 COUNT。
+
+    count 和 page 是存储层的方法 (如 storage.count_user_submissions /
+    storage.page_user_submissions)，page 的参数为
+    (user_id, cursor_ts, cursor_id, limit, newer)。
+    """
+
+    def __init__(self, route: Kind, kind: str, title: str, empty_text: str,
+                 count: Callable[[int], Awaitable[int]],
+                 page: Callable[[int, int, int, int, bool], Awaitable[List[PageRow]]],
+                 state: int, per_page: int = 10):
+        self.route = route
+        self.kind = kind
+        self.title = title
+        self.empty_text = empty_text
+        self.count = count
+        self.page = page
+        self.state = state
+        self.per_page = per_page
+
+    async def _total(self, user_id: int) -> int:
+        total = count_cache.get(self.kind, user_id)
+        if total is None:
+            total = await self.count(user_id)
+            count_cache.put(self.kind, user_id, total)
+        return total
+
+    async def _fetch(self, user_id: int, page: int, cursor: Optional[Cursor]) -> Tuple[List[PageRow], bool, bool]:
+        """读取一页，返回 (记录, 是否有下一页, 是否有上一页)"""
+        # 多取一条，用来判断当前方向上是否还有更多
+        if cursor is None or cursor.direction == 'n':
+            timestamp, row_id = (cursor.timestamp, cursor.row_id) if cursor else _FIRST_PAGE_CURSOR
+            rows = await self.page(user_id, timestamp, row_id, self.per_page + 1, False)
+            return (rows[:self.per_page], len(rows) > self.per_page, page > 1)
+
+        rows = await self.page(user_id, cursor.timestamp, cursor.row_id, self.per_page + 1, True)
+        return (list(reversed(rows[:self.per_page])), True, page > 1 and len(rows) > self.per_page)
+
+    async def show(self, update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> int:
+        query = update.callback_query
+        await query.answer()
+        user_id = query.from_user.id
+
+        target_page, cursor = decode_cursor(action.fields)
+
+        total_posts = await self._total(user_id)
+        posts, has_next, has_prev = [], False, False
+        if total_posts > 0:
+            posts, has_next, has_prev = await self._fetch(user_id, target_page, cursor)
+            if not posts and cursor is not None:
+                # 游标附近的数据已被删除，回到第一页
+                target_page = 1
+                posts, has_next, has_prev = await self._fetch(user_id, 1, None)
+
+        if not posts:
+            count_cache.invalidate(self.kind, user_id)
+            await outbound.submit(
+                query.message.chat_id, Priority.EDIT, query.edit_message_text,
+                self.empty_text,
+                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data=encode_callback(Kind.BACK_TO_MAIN))]])
+            )
+            return self.state
+
+        total_pages = max(math.ceil(total_posts / self.per_page), target_page + (1 if has_next else 0))
+        offset = (target_page - 1) * self.per_page
+
+        response_text = f"{self.title} (第 {target_page}/{total_pages} 页)：\n\n"
+        for i, (content, msg_id, _, _) in enumerate(posts):
+            post_text = (content or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
+            if len(post_text) > 20: 
+                post_text = post_text[:20] + "..."
+            
+            post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
+            response_text += f"{offset + i + 1}. <a href='{post_url}'>{post_text}</a>\n"
+
+        nav_buttons = []
+        if has_prev:
+            first = posts[0]
+            nav_buttons.append(InlineKeyboardButton(
+                "⬅️ 上一页",
+                callback_data=encode_callback(self.route, *encode_cursor(target_page - 1, 'p', first.cursor_ts, first.cursor_id))
+            ))
+        if has_next:
+            last = posts[-1]
+            nav_buttons.append(InlineKeyboardButton(
+                "下一页 ➡️",
+                callback_data=encode_callback(self.route, *encode_cursor(target_page + 1, 'n', last.cursor_ts, last.cursor_id))
+            ))
+        
+        keyboard = [
+            nav_buttons,
+            [InlineKeyboardButton("⬅️ 返回主菜单", callback_data=encode_callback(Kind.BACK_TO_MAIN))]
+        ]
+
+        await outbound.submit(
+            query.message.chat_id, Priority.EDIT, query.edit_message_text,
+            response_text,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode=ParseMode.HTML,
+            disable_web_page_preview=True
+        )
+        
+        return self.state
@@ -1,10 +1,13 @@
 # handlers/start_menu.py
 
 import logging
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
 
 from config import CHOOSING
+from handlers.callback_router import CallbackAction, Kind, encode_callback
+from services.outbound import Priority, outbound
 
 logger = logging.getLogger(__name__)
 
@@ -41,24 +44,26 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # 标准流程：显示主菜单
     keyboard = [
         [
-            InlineKeyboardButton("✍️ 发布朋友圈", callback_data='submit_post'),
-            InlineKeyboardButton("📒 我的朋友圈", callback_data='my_posts_page:1')
+            InlineKeyboardButton("✍️ 发布朋友圈", callback_data=encode_callback(Kind.SUBMIT_POST)),
+            InlineKeyboardButton("📒 我的朋友圈", callback_data=encode_callback(Kind.MY_POSTS_PAGE, 1))
         ],
         [
-            InlineKeyboardButton("⭐ 我的收藏", callback_data='my_collections_page:1')
+            InlineKeyboardButton("⭐ 我的收藏", callback_data=encode_callback(Kind.MY_COLLECTIONS_PAGE, 1))
         ],
     ]
     reply_markup = InlineKeyboardMarkup(keyboard)
     
     if update.callback_query:
-        await update.callback_query.edit_message_text("你好！请选择一个操作：", reply_markup=reply_markup)
+        query = update.callback_query
+        await outbound.submit(query.message.chat_id, Priority.EDIT, query.edit_message_text, "你好！请选择一个操作：", reply_markup=reply_markup)
     else:
-        await update.message.reply_text("你好！请选择一个操作：", reply_markup=reply_markup)
+        message = update.message
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, "你好！请选择一个操作：", reply_markup=reply_markup)
         
     return CHOOSING
 
 
-async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE):
+async def back_to_main(update: Update, context: ContextTypes.DEFAULT_TYPE, action: Optional[CallbackAction] = None):
     """处理"返回主菜单"的按钮点击"""
     if update.callback_query:
         await update.callback_query.answer()
@@ -1,7 +1,6 @@
 # handlers/submission.py
 
-import aiosqlite
-import math
+from typing import Optional
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, ConversationHandler
@@ -9,19 +8,22 @@ from telegram.ext import ContextTypes, ConversationHandler
 from config import (
     ADMIN_GROUP_ID, 
     GETTING_POST, 
-    DB_NAME, 
-    CHANNEL_USERNAME, 
-    CHOOSING, 
     BROWSING_POSTS, 
     BROWSING_COLLECTIONS
 )
+from handlers.callback_router import CallbackAction, Kind, encode_callback
+from handlers.pagination import Paginator
+from services.outbound import Priority, outbound
+from storage import storage
 
 
-async def prompt_submission(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def prompt_submission(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                            action: Optional[CallbackAction] = None) -> int:
     """提示用户发送要投稿的内容"""
     query = update.callback_query
     await query.answer()
-    await query.edit_message_text(
+    await outbound.submit(
+        query.message.chat_id, Priority.EDIT, query.edit_message_text,
         "好的，现在请发送您要分享的内容（文字、图片、视频等）。\n\n"
         "随时可以输入 /cancel 取消操作。"
     )
@@ -33,8 +35,8 @@ async def handle_new_post(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     message = update.message
     user = message.from_user
 
-    approve_callback_data = f"approve:{user.id}:{message.message_id}"
-    decline_callback_data = f"decline:{user.id}:{message.message_id}"
+    approve_callback_data = encode_callback(Kind.APPROVE, user.id, message.message_id)
+    decline_callback_data = encode_callback(Kind.DECLINE, user.id, message.message_id)
     keyboard = [[
         InlineKeyboardButton("✅ 通过", callback_data=approve_callback_data),
         InlineKeyboardButton("❌ 拒绝", callback_data=decline_callback_data),
@@ -43,7 +45,8 @@ async def handle_new_post(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     user_info = f"<b>投稿人:</b> {user.full_name} (@{user.username})\n<b>ID:</b> <code>{user.id}</code>"
 
     try:
-        await context.bot.copy_message(
+        await outbound.submit(
+            ADMIN_GROUP_ID, Priority.REPLY, context.bot.copy_message,
             chat_id=ADMIN_GROUP_ID,
             from_chat_id=user.id,
             message_id=message.id,
@@ -51,146 +54,45 @@ async def handle_new_post(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
             reply_markup=reply_markup,
             parse_mode=ParseMode.HTML
         )
-        await message.reply_text("✅ 您的投稿已成功提交审核。")
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, "✅ 您的投稿已成功提交审核。")
     except Exception as e:
-        await message.reply_text(f"❌ 抱歉，提交失败: {e}")
+        await outbound.submit(message.chat_id, Priority.REPLY, message.reply_text, f"❌ 抱歉，提交失败: {e}")
 
     return ConversationHandler.END
 
 
 async def cancel(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     """取消当前所有操作"""
-    await update.message.reply_text("操作已取消。")
+    await outbound.submit(update.message.chat_id, Priority.REPLY, update.message.reply_text, "操作已取消。")
     return ConversationHandler.END
 
 
-async def navigate_my_posts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """查询并展示"我的朋友圈"分页记录"""
-    query = update.callback_query
-    await query.answer()
-    user_id = query.from_user.id
+my_posts_paginator = Paginator(
+    route=Kind.MY_POSTS_PAGE,
+    kind='submissions',
+    title="您的朋友圈记录",
+    empty_text="您还没有发布过任何内容哦。",
+    count=storage.count_user_submissions,
+    page=storage.page_user_submissions,
+    state=BROWSING_POSTS,
+)
 
-    target_page = int(query.data.split(':')[1])
-    posts_per_page = 10
+my_collections_paginator = Paginator(
+    route=Kind.MY_COLLECTIONS_PAGE,
+    kind='collections',
+    title="您的收藏",
+    empty_text="您还没有任何收藏哦。",
+    count=storage.count_user_collections,
+    page=storage.page_user_collections,
+    state=BROWSING_COLLECTIONS,
+)
 
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM submissions WHERE user_id = ?", 
-            (user_id,)
-        )
-        total_posts = (await cursor.fetchone())[0]
-        
-        if total_posts == 0:
-            await query.edit_message_text(
-                "您还没有发布过任何内容哦。",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]])
-            )
-            return BROWSING_POSTS
-
-        total_pages = math.ceil(total_posts / posts_per_page)
-        offset = (target_page - 1) * posts_per_page
-        
-        cursor = await db.execute(
-            "SELECT content_text, timestamp, channel_message_id FROM submissions WHERE user_id = ? ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-            (user_id, posts_per_page, offset)
-        )
-        posts = await cursor.fetchall()
-
-    response_text = f"您的朋友圈记录 (第 {target_page}/{total_pages} 页)：\n\n"
-    for i, post in enumerate(posts):
-        content, timestamp, msg_id = post
-        post_text = (content or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
-        if len(post_text) > 20: 
-            post_text = post_text[:20] + "..."
-        
-        post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
-        response_text += f"{offset + i + 1}. <a href='{post_url}'>{post_text}</a>\n"
-
-    nav_buttons = []
-    if target_page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f'my_posts_page:{target_page - 1}'))
-    if target_page < total_pages:
-        nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f'my_posts_page:{target_page + 1}'))
-    
-    keyboard = [
-        nav_buttons,
-        [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
 
-    await query.edit_message_text(
-        response_text,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.HTML,
-        disable_web_page_preview=True
-    )
-    
-    return BROWSING_POSTS
+async def navigate_my_posts(update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> int:
+    """查询并展示"我的朋友圈"分页记录"""
+    return await my_posts_paginator.show(update, context, action)
 
 
-async def show_my_collections(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
+async def show_my_collections(update: Update, context: ContextTypes.DEFAULT_TYPE, action: CallbackAction) -> int:
     """查询并展示"我的收藏"分页记录"""
-    query = update.callback_query
-    await query.answer()
-    user_id = query.from_user.id
-
-    target_page = int(query.data.split(':')[1])
-    posts_per_page = 10
-
-    async with aiosqlite.connect(DB_NAME) as db:
-        cursor = await db.execute(
-            "SELECT COUNT(*) FROM collections WHERE user_id = ?", 
-            (user_id,)
-        )
-        total_posts = (await cursor.fetchone())[0]
-
-        if total_posts == 0:
-            await query.edit_message_text(
-                "您还没有任何收藏哦。",
-                reply_markup=InlineKeyboardMarkup([[InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]])
-            )
-            return BROWSING_COLLECTIONS
-
-        total_pages = math.ceil(total_posts / posts_per_page)
-        offset = (target_page - 1) * posts_per_page
-
-        cursor = await db.execute(
-            """
-            SELECT s.content_text, s.timestamp, s.channel_message_id
-            FROM collections c JOIN submissions s ON c.channel_message_id = s.channel_message_id
-            WHERE c.user_id = ? ORDER BY c.timestamp DESC LIMIT ? OFFSET ?
-            """,
-            (user_id, posts_per_page, offset)
-        )
-        posts = await cursor.fetchall()
-    
-    response_text = f"您的收藏 (第 {target_page}/{total_pages} 页)：\n\n"
-    for i, post in enumerate(posts):
-        content, timestamp, msg_id = post
-        post_text = (content or "[媒体文件]").strip().replace('<', '&lt;').replace('>', '&gt;')
-        if len(post_text) > 20: 
-            post_text = post_text[:20] + "..."
-        
-        post_url = f"https://t.me/{CHANNEL_USERNAME}/{msg_id}"
-        response_text += f"{offset + i + 1}. <a href='{post_url}'>{post_text}</a>\n"
-    
-    nav_buttons = []
-    if target_page > 1:
-        nav_buttons.append(InlineKeyboardButton("⬅️ 上一页", callback_data=f'my_collections_page:{target_page - 1}'))
-    if target_page < total_pages:
-        nav_buttons.append(InlineKeyboardButton("下一页 ➡️", callback_data=f'my_collections_page:{target_page + 1}'))
-    
-    keyboard = [
-        nav_buttons,
-        [InlineKeyboardButton("⬅️ 返回主菜单", callback_data='back_to_main')]
-    ]
-    reply_markup = InlineKeyboardMarkup(keyboard)
-    
-    await query.edit_message_text(
-        response_text,
-        reply_markup=reply_markup,
-        parse_mode=ParseMode.HTML,
-        disable_web_page_preview=True
-    )
-
-    return BROWSING_COLLECTIONS
\ No newline at end of file
+    return await my_collections_paginator.show(update, context, action)
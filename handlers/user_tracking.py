@@ -0,0 +1,17 @@
+# handlers/user_tracking.py
+
+from telegram import Update
+from telegram.ext import ContextTypes
+
+from services.profile_cache import profile_cache
+from services.user_directory import Profile, user_directory
+
+
+async def record_user(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    """记录每个更新的发送者 (group=-1，先于所有业务处理器执行)"""
+    user = update.effective_user
+    if user is None or user.is_bot:
+        return
+
+    user_directory.record(user)
+    profile_cache.put(user.id, Profile(user.username or "", user.full_name or ""))
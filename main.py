@@ -1,21 +1,29 @@
 # main.py
 
+import asyncio
 import logging
 import os
+from typing import Optional
 from telegram.ext import (
     Application,
     CommandHandler,
-    CallbackQueryHandler,
     MessageHandler,
     ConversationHandler,
+    TypeHandler,
     filters,
 )
-from telegram.request import HTTPXRequest
+from telegram.request import BaseRequest, HTTPXRequest
 from telegram import Update
 from telegram.ext import ContextTypes
 
 from config import (
     TOKEN, 
+    ADMIN_GROUP_ID,
+    BOT_MODE,
+    CHANNEL_ID,
+    CONCURRENT_UPDATES,
+    PERSISTENCE_DB,
+    PERSISTENCE_FLUSH_INTERVAL,
     CHOOSING, 
     GETTING_POST, 
     BROWSING_POSTS, 
@@ -23,7 +31,7 @@ from config import (
     COMMENTING,
     DELETING_COMMENT
 )
-from database import setup_database
+from database import setup_database, close_database
 from handlers.start_menu import start, back_to_main
 from handlers.submission import (
     prompt_submission, 
@@ -32,10 +40,25 @@ from handlers.submission import (
     show_my_collections, 
     cancel
 )
+from handlers.admin_commands import show_slow_queries
 from handlers.approval import handle_approval, handle_rejection
+from handlers.callback_router import CHANNEL_KINDS, Kind, router
 from handlers.channel_interact import handle_channel_interaction
 from handlers.commenting import prompt_comment, handle_new_comment
 from handlers.comment_management import show_delete_comment_menu, handle_delete_comment_input
+from handlers.user_tracking import record_user
+from services.background import background_tasks
+from services.edit_coalescer import edit_coalescer
+from services.metrics import InstrumentedRequest, metrics, start_metrics, stop_metrics
+from services.notification_outbox import notification_outbox
+from services.outbound import outbound
+from services.persistence import SqlitePersistence
+from services.post_cache import post_cache
+from services.tracing import tracer
+from services.update_processor import KeyedUpdateProcessor
+from services.user_directory import user_directory
+from services.webhook_server import run_webhook
+from services.write_queue import toggle_writer
 
 
 logging.basicConfig(
@@ -45,46 +68,109 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
-def main():
+def register_queue_gauges(application: Application) -> None:
+    """把各个后台队列的深度登记到指标 (抓取时读取)"""
+    processor = application.update_processor
+    metrics.gauge("update_queue", application.update_queue.qsize)
+    if isinstance(processor, KeyedUpdateProcessor):
+        metrics.gauge("update_processor", lambda: processor.stats()["queued"])
+    metrics.gauge("toggle_writer", toggle_writer.queue_depth)
+    for priority in ("edit", "reply", "notification"):
+        metrics.gauge(f"outbound_{priority}", lambda priority=priority: outbound.queue_depth()[priority])
+    metrics.gauge("background_tasks", background_tasks.pending)
+    metrics.gauge("notification_digest", notification_outbox.buffered)
+    metrics.gauge("channel_edits", edit_coalescer.pending)
+    metrics.gauge("outbound_channel_edits", lambda: outbound.chat_depth(CHANNEL_ID))
+
+
+async def post_init(application: Application) -> None:
+    """启动时初始化数据库并启动后台任务"""
+    await setup_database(application)
+    await post_cache.warm()
+    user_directory.start()
+    toggle_writer.start()
+    background_tasks.start()
+    outbound.start()
+    notification_outbox.start(application.bot)
+    register_queue_gauges(application)
+    await start_metrics()
+    if tracer.enabled:
+        logger.info(f"🔎 更新追踪已开启: 采样 {tracer.sample_rate:.1%}，写入 {tracer.path}")
+
+
+async def post_stop(application: Application) -> None:
     """
-    机器人主程序 (V10.4.1 - 完全修复版)
+    停止接收更新后 (Bot 仍可用)：写完所有排队的互动，等待后台副作用任务，发送待合并的编辑，
+    停止通知投递 (未送达的留在发件箱)，再发完出站队列中的消息
     """
+    await toggle_writer.stop()
+    await background_tasks.stop()
+    await edit_coalescer.flush()
+    await notification_outbox.stop()
+    await outbound.stop()
+
+
+async def post_shutdown(application: Application) -> None:
+    """写入用户目录缓冲，再关闭数据库，最后关闭指标端点和 trace 文件"""
+    await user_directory.stop()
+    await close_database(application)
+    await stop_metrics()
+    tracer.close()
+
+
+def build_application(request: Optional[BaseRequest] = None) -> Application:
+    """
+    构建 Application 并注册所有处理器 (不启动)
+
+    request 为 None 时使用 PTB 默认的 HTTP 客户端；基准测试传入模拟的 request。
+    API 调用 (getUpdates 长轮询除外) 都经过 InstrumentedRequest 记录耗时和错误。
+    """
+    if request is None:
+        # 与 ApplicationBuilder 默认创建的客户端相同
+        request = HTTPXRequest(connection_pool_size=256)
+    builder = Application.builder().token(TOKEN).request(InstrumentedRequest(request))
+
+    if BOT_MODE == 'webhook':
+        # webhook 模式由内置的 aiohttp 服务器接收更新，不需要 Updater
+        builder = builder.updater(None)
     
-    # 代理配置
-    USE_PROXY = False # 改为 False 如果不需要代理 True
-    PROXY_URL = "http://127.0.0.1:7890"
-    
-    # 构建 Application
-    builder = Application.builder().token(TOKEN)
-    
-    if USE_PROXY:
-        logger.info(f"🌐 使用代理: {PROXY_URL}")
-        request = HTTPXRequest(proxy=PROXY_URL)
-        builder = builder.request(request)
-    else:
-        logger.info("🌐 不使用代理")
+    # 并发处理更新：同一频道帖子 (或私聊中同一用户) 的更新按顺序处理，其余并行
+    builder = builder.concurrent_updates(KeyedUpdateProcessor(CONCURRENT_UPDATES))
+
+    # 对话状态和 user_data 持久化：重启后正在评论/删除评论的用户可以继续
+    if PERSISTENCE_DB:
+        builder = builder.persistence(SqlitePersistence(PERSISTENCE_DB, PERSISTENCE_FLUSH_INTERVAL))
     
-    application = builder.post_init(setup_database).build()
+    application = builder.post_init(post_init).post_stop(post_stop).post_shutdown(post_shutdown).build()
+
+    # 用户目录：记录每个更新的发送者 (group=-1，先于所有业务处理器)
+    application.add_handler(TypeHandler(Update, record_user), group=-1)
+
+    # 按钮回调路由：callback_data 只解析一次，按动作类型分发
+    router.route(Kind.SUBMIT_POST, prompt_submission)
+    router.route(Kind.MY_POSTS_PAGE, navigate_my_posts)
+    router.route(Kind.MY_COLLECTIONS_PAGE, show_my_collections)
+    router.route(Kind.BACK_TO_MAIN, back_to_main)
+    router.route(Kind.APPROVE, handle_approval)
+    router.route(Kind.DECLINE, handle_rejection)
+    for kind in CHANNEL_KINDS:
+        router.route(kind, handle_channel_interaction)
 
     # 主对话处理器
     conv_handler = ConversationHandler(
         entry_points=[CommandHandler("start", start)],
         states={
             CHOOSING: [
-                CallbackQueryHandler(prompt_submission, pattern='^submit_post$'),
-                CallbackQueryHandler(navigate_my_posts, pattern='^my_posts_page:'),
-                CallbackQueryHandler(show_my_collections, pattern='^my_collections_page:'),
+                router.handler(Kind.SUBMIT_POST, Kind.MY_POSTS_PAGE, Kind.MY_COLLECTIONS_PAGE),
             ],
             GETTING_POST: [
                 MessageHandler(filters.ChatType.PRIVATE & ~filters.COMMAND, handle_new_post),
             ],
             BROWSING_POSTS: [
-                CallbackQueryHandler(navigate_my_posts, pattern='^my_posts_page:'),
-                CallbackQueryHandler(back_to_main, pattern='^back_to_main$'),
+                router.handler(Kind.MY_POSTS_PAGE, Kind.BACK_TO_MAIN),
             ],
             BROWSING_COLLECTIONS: [
-                CallbackQueryHandler(show_my_collections, pattern='^my_collections_page:'),
-                CallbackQueryHandler(back_to_main, pattern='^back_to_main$'),
+                router.handler(Kind.MY_COLLECTIONS_PAGE, Kind.BACK_TO_MAIN),
             ],
             COMMENTING: [
                 MessageHandler(filters.TEXT & ~filters.COMMAND, handle_new_comment)
@@ -101,15 +187,15 @@ def main():
         per_chat=True,
         per_user=True,
         name="main_conversation",
+        persistent=bool(PERSISTENCE_DB),
     )
     
     logger.info(f"📋 注册对话处理器，DELETING_COMMENT={DELETING_COMMENT}")
     application.add_handler(conv_handler)
 
     # 其他处理器
-    application.add_handler(CallbackQueryHandler(handle_approval, pattern='^approve:'))
-    application.add_handler(CallbackQueryHandler(handle_rejection, pattern='^decline:'))
-    application.add_handler(CallbackQueryHandler(handle_channel_interaction, pattern='^(react|collect|comment)'))
+    application.add_handler(router.handler(Kind.APPROVE, Kind.DECLINE, *CHANNEL_KINDS))
+    application.add_handler(CommandHandler("slowqueries", show_slow_queries, filters=filters.Chat(ADMIN_GROUP_ID)))
     
     # 调试处理器：捕获所有未处理的私聊消息
     async def debug_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -118,12 +204,36 @@ def main():
             logger.warning(f"⚠️ user_data: {context.user_data}")
     
     application.add_handler(MessageHandler(filters.TEXT & filters.ChatType.PRIVATE, debug_handler), group=999)
+
+    return application
+
+
+def main():
+    """
+    机器人主程序 (V10.4.1 - 完全修复版)
+    """
     
+    # 代理配置
+    USE_PROXY = False # 改为 False 如果不需要代理 True
+    PROXY_URL = "http://127.0.0.1:7890"
+    
+    # 构建 Application
+    if USE_PROXY:
+        logger.info(f"🌐 使用代理: {PROXY_URL}")
+        request = HTTPXRequest(proxy=PROXY_URL)
+    else:
+        logger.info("🌐 不使用代理")
+        request = None
+    application = build_application(request)
+
     logger.info("🚀 机器人 V10.4.1 启动成功！")
     logger.info("✨ 功能：互动通知 + 文本删除评论 + 100赞自动置顶")
     
     try:
-        application.run_polling(drop_pending_updates=True)
+        if BOT_MODE == 'webhook':
+            asyncio.run(run_webhook(application))
+        else:
+            application.run_polling(drop_pending_updates=True)
     except Exception as e:
         logger.error(f"❌ 机器人运行错误: {e}")
 
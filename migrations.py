@@ -0,0 +1,230 @@
+# migrations.py
+
+import asyncio
+import logging
+import sys
+from typing import Dict, List, NamedTuple, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+
+# --- 迁移列表 (按版本号递增，只能追加，不能修改已发布的迁移) ---
+# 每个迁移在一个事务内执行，成功后把 PRAGMA user_version 设为对应版本号。
+# 所有语句都必须是幂等的 (IF NOT EXISTS 等)，以兼容迁移系统上线前已存在的数据库。
+MIGRATIONS: List[Migration] = [
+    Migration(1, "V10.4 基础表结构", (
+        # 主投稿表
+        '''
+        CREATE TABLE IF NOT EXISTS submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            user_id INTEGER NOT NULL,
+            user_name TEXT, 
+            channel_message_id INTEGER NOT NULL UNIQUE,
+            content_text TEXT, 
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 互动记录表
+        '''
+        CREATE TABLE IF NOT EXISTS reactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            channel_message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL, 
+            reaction_type INTEGER NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(channel_message_id, user_id)
+        )
+        ''',
+        # 收藏记录表
+        '''
+        CREATE TABLE IF NOT EXISTS collections (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, 
+            channel_message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL, 
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(channel_message_id, user_id)
+        )
+        ''',
+        # 评论表
+        '''
+        CREATE TABLE IF NOT EXISTS comments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            user_name TEXT NOT NULL,
+            comment_text TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        # 通知记录表
+        '''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_message_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            notification_type TEXT NOT NULL,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE(channel_message_id, user_id, notification_type)
+        )
+        ''',
+        # 置顶记录表
+        '''
+        CREATE TABLE IF NOT EXISTS pinned_posts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            channel_message_id INTEGER NOT NULL UNIQUE,
+            pinned_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            like_count_at_pin INTEGER
+        )
+        ''',
+    )),
+    Migration(2, "热点查询的复合索引", (
+        # 我的朋友圈: WHERE user_id = ? ORDER BY timestamp
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_ts ON submissions (user_id, timestamp)",
+        # 我的收藏: WHERE user_id = ? ORDER BY timestamp (覆盖 JOIN 所需的 channel_message_id)
+        "CREATE INDEX IF NOT EXISTS idx_collections_user_ts ON collections (user_id, timestamp, channel_message_id)",
+        # 评论区预览: WHERE channel_message_id = ? ORDER BY timestamp
+        "CREATE INDEX IF NOT EXISTS idx_comments_post_ts ON comments (channel_message_id, timestamp)",
+        # 删除评论菜单: WHERE channel_message_id = ? AND user_id = ? ORDER BY timestamp
+        "CREATE INDEX IF NOT EXISTS idx_comments_post_user_ts ON comments (channel_message_id, user_id, timestamp)",
+        # 计数: WHERE channel_message_id = ? GROUP BY reaction_type
+        "CREATE INDEX IF NOT EXISTS idx_reactions_post_type ON reactions (channel_message_id, reaction_type)",
+    )),
+    Migration(3, "每个帖子的计数表 post_stats", (
+        '''
+        CREATE TABLE IF NOT EXISTS post_stats (
+            channel_message_id INTEGER PRIMARY KEY,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0,
+            collections INTEGER NOT NULL DEFAULT 0,
+            comments INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        # 用原始表中的数据回填
+        '''
+        INSERT OR REPLACE INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+        SELECT ids.channel_message_id,
+               (SELECT COUNT(*) FROM reactions r WHERE r.channel_message_id = ids.channel_message_id AND r.reaction_type = 1),
+               (SELECT COUNT(*) FROM reactions r WHERE r.channel_message_id = ids.channel_message_id AND r.reaction_type = -1),
+               (SELECT COUNT(*) FROM collections c WHERE c.channel_message_id = ids.channel_message_id),
+               (SELECT COUNT(*) FROM comments m WHERE m.channel_message_id = ids.channel_message_id)
+        FROM (
+            SELECT channel_message_id FROM submissions
+            UNION SELECT channel_message_id FROM reactions
+            UNION SELECT channel_message_id FROM collections
+            UNION SELECT channel_message_id FROM comments
+        ) ids
+        ''',
+    )),
+    Migration(4, "用户目录表 users", (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            last_seen DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+    )),
+    Migration(5, "收藏列表按 (timestamp, id) 游标分页的覆盖索引", (
+        "DROP INDEX IF EXISTS idx_collections_user_ts",
+        "CREATE INDEX IF NOT EXISTS idx_collections_user_ts_id ON collections (user_id, timestamp, id, channel_message_id)",
+    )),
+    # ADD COLUMN 不能写成幂等语句；迁移系统上线前的数据库不会有这些列，可以安全执行
+    Migration(6, "notifications 表改为通知发件箱", (
+        "ALTER TABLE notifications ADD COLUMN recipient_id INTEGER",
+        "ALTER TABLE notifications ADD COLUMN payload TEXT",
+        "ALTER TABLE notifications ADD COLUMN status TEXT NOT NULL DEFAULT 'pending'",
+        "ALTER TABLE notifications ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN next_attempt_at INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN last_error TEXT",
+        "ALTER TABLE notifications ADD COLUMN delivered_at INTEGER",
+        # 已有的记录都是旧版本直接发送过的通知
+        "UPDATE notifications SET status = 'delivered'",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (next_attempt_at) WHERE status = 'pending'",
+    )),
+]
+
+
+async def get_schema_version(db) -> int:
+    cursor = await db.execute("PRAGMA user_version")
+    return (await cursor.fetchone())[0]
+
+
+async def run_migrations(pool) -> int:
+    """按顺序执行所有未应用的迁移，返回最终的 schema 版本"""
+    async with pool.write() as db:
+        current = await get_schema_version(db)
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+
+        async with pool.write() as db:
+            # 显式开启事务，保证 DDL 与版本号更新要么全部生效，要么全部回滚
+            await db.execute("BEGIN")
+            for statement in migration.statements:
+                await db.execute(statement)
+            await db.execute(f"PRAGMA user_version = {migration.version}")
+
+        current = migration.version
+        logger.info(f"🧱 已应用数据库迁移 v{migration.version}: {migration.description}")
+
+    return current
+
+
+def plan_problems(plan: List[str]) -> List[str]:
+    """从 EXPLAIN QUERY PLAN 的 detail 列中挑出全表/全索引扫描 (SCAN) 和临时排序 (USE TEMP B-TREE)"""
+    return [
+        detail for detail in plan
+        if (detail.startswith("SCAN") and detail != "SCAN CONSTANT ROW") or detail.startswith("USE TEMP B-TREE")
+    ]
+
+
+async def check_query_plans(db, queries: Dict[str, Tuple[str, tuple]]) -> List[str]:
+    """
+    对每个热点查询 (名称 -> (SQL, 示例参数)) 执行 EXPLAIN QUERY PLAN，
+    返回仍在全表/全索引扫描 (SCAN) 或需要临时排序 (USE TEMP B-TREE) 的查询
+    """
+    problems = []
+    for name, (sql, params) in queries.items():
+        cursor = await db.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        scans = plan_problems([row[3] for row in await cursor.fetchall()])
+        if scans:
+            problems.append(f"{name}: {'; '.join(scans)}")
+    return problems
+
+
+async def _main() -> int:
+    from storage import storage
+
+    await storage.open()
+    try:
+        version = await storage.migrate()
+        print(f"{storage.name} schema 版本: v{version}")
+        problems = await storage.check_query_plans()
+    finally:
+        await storage.close()
+
+    if problems:
+        print("❌ 以下热点查询仍在做全表扫描或临时排序:")
+        for problem in problems:
+            print(f"  - {problem}")
+        return 1
+
+    print("✅ 热点查询均已命中索引。")
+    return 0
+
+
+# 使用方法：
+# python migrations.py
+# 执行所有未应用的迁移，并检查热点查询的执行计划 (有全表扫描时退出码为 1)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
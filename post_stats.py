@@ -0,0 +1,118 @@
+# post_stats.py
+
+import asyncio
+import logging
+import sys
+from typing import Dict
+
+logger = logging.getLogger(__name__)
+
+
+# 从原始表重新聚合每个帖子的计数
+_FRESH_COUNTS_SQL = '''
+    SELECT ids.channel_message_id,
+           COALESCE(r.likes, 0), COALESCE(r.dislikes, 0),
+           COALESCE(c.n, 0), COALESCE(m.n, 0)
+    FROM (
+        SELECT channel_message_id FROM submissions
+        UNION SELECT channel_message_id FROM reactions
+        UNION SELECT channel_message_id FROM collections
+        UNION SELECT channel_message_id FROM comments
+    ) ids
+    LEFT JOIN (
+        SELECT channel_message_id,
+               SUM(reaction_type = 1) AS likes,
+               SUM(reaction_type = -1) AS dislikes
+        FROM reactions GROUP BY channel_message_id
+    ) r ON r.channel_message_id = ids.channel_message_id
+    LEFT JOIN (
+        SELECT channel_message_id, COUNT(*) AS n FROM collections GROUP BY channel_message_id
+    ) c ON c.channel_message_id = ids.channel_message_id
+    LEFT JOIN (
+        SELECT channel_message_id, COUNT(*) AS n FROM comments GROUP BY channel_message_id
+    ) m ON m.channel_message_id = ids.channel_message_id
+'''
+
+
+# 增量更新计数 (不存在的帖子先插入一行)
+SQL_BUMP_POST_STATS = '''
+    INSERT INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(channel_message_id) DO UPDATE SET
+        likes = likes + excluded.likes,
+        dislikes = dislikes + excluded.dislikes,
+        collections = collections + excluded.collections,
+        comments = comments + excluded.comments
+'''
+
+
+async def bump_post_stats(db, message_id: int, likes: int = 0, dislikes: int = 0,
+                          collections: int = 0, comments: int = 0) -> None:
+    """
+    增量更新一个帖子的计数 (必须在写连接的同一事务内调用)
+    """
+    await db.execute(SQL_BUMP_POST_STATS, (message_id, likes, dislikes, collections, comments))
+
+
+async def get_post_stats(db, message_id: int) -> Dict[str, int]:
+    """读取一个帖子的计数 (主键查找，只有一行)"""
+    cursor = await db.execute(
+        "SELECT likes, dislikes, collections, comments FROM post_stats WHERE channel_message_id = ?",
+        (message_id,)
+    )
+    row = await cursor.fetchone() or (0, 0, 0, 0)
+    return {
+        "likes": row[0],
+        "dislikes": row[1],
+        "collections": row[2],
+        "comments": row[3],
+    }
+
+
+async def reconcile_post_stats(db) -> int:
+    """
+    从原始表重新计算所有计数并覆盖 post_stats，返回存在偏差的帖子数
+    (必须在写连接上调用)
+    """
+    cursor = await db.execute(
+        f'''
+        WITH fresh (channel_message_id, likes, dislikes, collections, comments) AS ({_FRESH_COUNTS_SQL})
+        SELECT COUNT(*) FROM fresh
+        LEFT JOIN post_stats p ON p.channel_message_id = fresh.channel_message_id
+        WHERE p.channel_message_id IS NULL
+           OR p.likes != fresh.likes OR p.dislikes != fresh.dislikes
+           OR p.collections != fresh.collections OR p.comments != fresh.comments
+        '''
+    )
+    drifted = (await cursor.fetchone())[0]
+
+    await db.execute(
+        f'''
+        INSERT OR REPLACE INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+        {_FRESH_COUNTS_SQL}
+        '''
+    )
+    return drifted
+
+
+async def _main() -> int:
+    from storage import storage
+
+    await storage.open()
+    try:
+        await storage.migrate()
+        drifted = await storage.reconcile_post_stats()
+    finally:
+        await storage.close()
+
+    print(f"✅ post_stats 已重建，修正了 {drifted} 个帖子的计数。")
+    return 0
+
+
+# 使用方法：
+# python post_stats.py
+# 从 reactions / collections / comments 原始表重新计算 post_stats (一次性对账)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    sys.exit(asyncio.run(_main()))
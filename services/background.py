@@ -0,0 +1,100 @@
+# services/background.py
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Set
+
+from config import BACKGROUND_MAX_CONCURRENCY, BACKGROUND_MAX_PENDING
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+TaskFactory = Callable[[], Awaitable[None]]
+
+
+class BackgroundTasks:
+    """
+    有界的后台任务池，用于把置顶、通知这类副作用移出按钮点击的关键路径
+
+    - 同时最多运行 max_concurrency 个任务，排队加运行中最多 max_pending 个，
+      超出时丢弃新任务并记录 (调用方需保证副作用可以稍后重试，例如置顶在下一次点赞时会重新检查)
+    - 传入 key 时，同一 key 已在排队或运行就不再重复提交，避免并发的重复置顶
+    - 任务中的异常被捕获并记录，不会影响处理器，也不会变成"未取回的异常"警告
+    """
+
+    def __init__(self, max_concurrency: int, max_pending: int):
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._tasks: Set[asyncio.Task] = set()
+        self._keys: Dict[Hashable, asyncio.Task] = {}
+        self._closing = False
+        self.completed = 0
+        self.errors = 0
+        self.dropped = 0
+
+    def start(self) -> None:
+        """(重新) 开始接受任务；stop() 之后需要再次调用"""
+        self._closing = False
+
+    def spawn(self, name: str, factory: TaskFactory, key: Optional[Hashable] = None) -> bool:
+        """提交一个后台任务，返回是否被接受 (关闭中、重复或队列已满时返回 False)"""
+        if self._closing:
+            return False
+        if key is not None and key in self._keys:
+            return False
+        if len(self._tasks) >= self.max_pending:
+            self.dropped += 1
+            logger.warning(f"后台任务已满 ({self.max_pending})，丢弃任务: {name}")
+            return False
+
+        task = asyncio.create_task(self._run(name, factory), name=name)
+        self._tasks.add(task)
+        if key is not None:
+            self._keys[key] = task
+        task.add_done_callback(lambda t: self._done(t, key))
+        return True
+
+    async def _run(self, name: str, factory: TaskFactory) -> None:
+        async with self._semaphore:
+            try:
+                # 任务创建时复制了提交者的上下文，被采样的更新派生的后台任务仍记入它的 trace
+                with tracer.span(f"background.{name}", "background"):
+                    await factory()
+                self.completed += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.errors += 1
+                logger.error(f"后台任务 {name} 失败: {e}", exc_info=True)
+
+    def _done(self, task: asyncio.Task, key: Optional[Hashable]) -> None:
+        self._tasks.discard(task)
+        if key is not None and self._keys.get(key) is task:
+            del self._keys[key]
+
+    def pending(self) -> int:
+        """排队和运行中的任务数"""
+        return len(self._tasks)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "pending": len(self._tasks),
+            "completed": self.completed,
+            "errors": self.errors,
+            "dropped": self.dropped,
+        }
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """不再接受新任务，等待已提交的任务完成，超时后取消剩余的"""
+        self._closing = True
+        if not self._tasks:
+            return
+        done, pending = await asyncio.wait(set(self._tasks), timeout=timeout)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+            logger.warning(f"关闭时取消了 {len(pending)} 个未完成的后台任务")
+
+
+background_tasks = BackgroundTasks(BACKGROUND_MAX_CONCURRENCY, BACKGROUND_MAX_PENDING)
@@ -0,0 +1,159 @@
+# services/comment_preview.py
+
+import html
+import itertools
+import logging
+import re
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Tuple
+
+from config import COMMENT_PREVIEW_CACHE_SIZE
+from storage import CommentRow, PostCacheStorage, storage
+
+logger = logging.getLogger(__name__)
+
+# 评论区最多展示的评论条数
+PREVIEW_COMMENTS = 5
+
+COMMENT_SECTION_HEADER = "\n\n--- 评论区"
+_EMPTY_SECTION = f"{COMMENT_SECTION_HEADER} ---\n✨ 暂无评论，快来抢沙发吧！"
+_MORE = "...\n"
+_TAG_RE = re.compile(r"<[^>]*>")
+
+
+def visible_length(caption_html: str) -> int:
+    """caption 在 Telegram 中计入长度限制的字符数 (去掉 HTML 标签、还原实体后的 UTF-16 长度)"""
+    return utf16_length(html.unescape(_TAG_RE.sub("", caption_html)))
+
+
+def utf16_length(text: str) -> int:
+    return len(text.encode("utf-16-le")) // 2
+
+
+def _escape(text: str) -> str:
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _truncate(text: str, budget: int) -> str:
+    """按 UTF-16 长度截断到 budget 以内 (不拆开代理对)"""
+    used = 0
+    for i, char in enumerate(text):
+        used += 2 if ord(char) > 0xFFFF else 1
+        if used > budget:
+            return text[:i]
+    return text
+
+
+def render_comment_section(comments: List[CommentRow], total: int, budget: int) -> str:
+    """
+    渲染评论区 HTML，可见长度不超过 budget；放不下的评论截断或省略为 "..."。
+    连标题都放不下时返回空字符串。
+    """
+    if not comments:
+        return _EMPTY_SECTION if utf16_length(_EMPTY_SECTION) <= budget else ""
+
+    header = f"{COMMENT_SECTION_HEADER} ({total}条) ---\n"
+    used = utf16_length(header)
+    if used > budget:
+        return ""
+
+    lines = []
+    truncated = False
+    # 末尾的 "..." 总要留出位置
+    room = budget - utf16_length(_MORE)
+    for idx, comment in enumerate(comments, 1):
+        prefix = f"{idx}. {comment.user_name}: "
+        line_length = utf16_length(prefix) + utf16_length(comment.comment_text) + 1
+        if used + line_length > room:
+            # 放不下整条时截断评论内容，剩余空间太少就不再展示
+            text_budget = room - used - utf16_length(prefix) - 2
+            if text_budget >= 10:
+                text = _truncate(comment.comment_text, text_budget) + "…"
+                lines.append(f'{idx}. <a href="tg://user?id={comment.user_id}">{_escape(comment.user_name)}</a>: {_escape(text)}\n')
+            truncated = True
+            break
+        used += line_length
+        lines.append(f'{idx}. <a href="tg://user?id={comment.user_id}">{_escape(comment.user_name)}</a>: {_escape(comment.comment_text)}\n')
+
+    section = header + "".join(lines)
+    if truncated or total > len(comments):
+        section += _MORE
+    return section
+
+
+class _Preview(NamedTuple):
+    version: int
+    comments: List[CommentRow]
+    total: int
+    budget: int       # 上次渲染使用的长度预算
+    rendered: str
+
+
+class CommentPreviewCache:
+    """
+    每个帖子评论区的渲染结果缓存
+
+    - 新增/删除评论时调用 bump() 更新该帖子的版本，版本未变的刷新不查询数据库、不重新转义
+    - 版本取自全局递增计数器：渲染期间发生的 bump 会让这次结果在下次读取时失效，不会误用旧结果
+    - 长度预算不同 (帖子正文变化) 时用缓存的评论重新渲染，同样不查询数据库
+    - 最多缓存 max_posts 个帖子 (LRU)
+    - 只有本进程的 bump() 能让缓存失效，因此与热点帖子缓存一样只在单进程后端 (PostCacheStorage) 上启用；
+      多个进程共用数据库 (PostgreSQL) 时每次都查询，否则会把其他进程改过的评论区用旧内容覆盖
+    """
+
+    def __init__(self, max_posts: int):
+        self.max_posts = max_posts
+        self._previews: "OrderedDict[int, _Preview]" = OrderedDict()
+        self._versions: "OrderedDict[int, int]" = OrderedDict()
+        self._counter = itertools.count(1)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_posts > 0 and isinstance(storage, PostCacheStorage)
+
+    def bump(self, message_id: int) -> None:
+        """评论有变化：之后的读取重新查询数据库"""
+        self._versions[message_id] = next(self._counter)
+        self._versions.move_to_end(message_id)
+        while len(self._versions) > self.max_posts:
+            self._versions.popitem(last=False)
+        self._previews.pop(message_id, None)
+
+    async def get(self, message_id: int, budget: int) -> Tuple[str, int]:
+        """返回 (评论区 HTML, 评论总数)"""
+        if not self.enabled:
+            comments = await storage.get_comment_preview(message_id, PREVIEW_COMMENTS)
+            total = await storage.count_comments(message_id) if comments else 0
+            return (render_comment_section(comments, total, budget), total)
+
+        version = self._versions.get(message_id, 0)
+        cached = self._previews.get(message_id)
+        if cached is not None and cached.version == version:
+            self._previews.move_to_end(message_id)
+            self.hits += 1
+            if cached.budget != budget:
+                cached = cached._replace(budget=budget,
+                                         rendered=render_comment_section(cached.comments, cached.total, budget))
+                self._previews[message_id] = cached
+            return (cached.rendered, cached.total)
+
+        self.misses += 1
+        comments = await storage.get_comment_preview(message_id, PREVIEW_COMMENTS)
+        total = await storage.count_comments(message_id) if comments else 0
+        rendered = render_comment_section(comments, total, budget)
+
+        # 查询期间评论又有变化时不缓存，下次重新查询
+        if self._versions.get(message_id, 0) == version:
+            self._previews[message_id] = _Preview(version, comments, total, budget, rendered)
+            self._previews.move_to_end(message_id)
+            while len(self._previews) > self.max_posts:
+                self._previews.popitem(last=False)
+        return (rendered, total)
+
+    def stats(self) -> Dict[str, int]:
+        return {"posts": len(self._previews), "hits": self.hits, "misses": self.misses}
+
+
+comment_previews = CommentPreviewCache(COMMENT_PREVIEW_CACHE_SIZE)
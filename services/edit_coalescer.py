@@ -0,0 +1,162 @@
+# services/edit_coalescer.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Bot, InlineKeyboardMarkup
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, RetryAfter, TelegramError
+
+from config import CHANNEL_ID, EDIT_COALESCE_WINDOW
+from services.outbound import Priority, outbound, retry_after_seconds
+from services.tracing import Span, tracer
+
+logger = logging.getLogger(__name__)
+
+# 渲染结果: (caption_html, reply_markup)
+Rendered = Tuple[str, Optional[InlineKeyboardMarkup]]
+RenderFn = Callable[[], Awaitable[Rendered]]
+
+
+class EditCoalescer:
+    """
+    按 channel_message_id 合并频道消息的 caption 编辑
+
+    - 点击只登记"需要重新渲染"，真正的渲染在发送前才执行，因此总是发送最新状态
+    - 同一帖子同一时刻最多只有一个编辑在进行，两次编辑之间至少间隔 window 秒
+    - 渲染结果与消息当前内容 (调用方传入的 current，否则为本进程上次发送的内容) 相同时跳过编辑
+    - 可以指定延迟 (如新评论后的刷新)：延迟期间到达的请求合并，到期后只渲染发送一次
+    """
+
+    def __init__(self, window: float, max_remembered: int = 2048):
+        self.window = window
+        self.max_remembered = max_remembered
+        self._pending: Dict[int, RenderFn] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+        self._last_sent_at: Dict[int, float] = {}
+        self._not_before: Dict[int, float] = {}
+        self._last_sent: "OrderedDict[int, Rendered]" = OrderedDict()
+        # 最新一次渲染请求所在的追踪 span：合并后的渲染和编辑记入最后一个请求者的 trace
+        self._spans: Dict[int, Optional[Span]] = {}
+        self._closing = False
+        self.edits_sent = 0
+        self.edits_skipped = 0
+
+    def schedule(self, bot: Bot, message_id: int, render: RenderFn,
+                 current: Optional[Rendered] = None, delay: float = 0.0) -> None:
+        """
+        登记一次渲染请求。current 为消息当前显示的内容 (如 query.message 上的)，
+        总是覆盖本进程记住的上次发送内容：多个进程共用频道时，其他进程可能已经改过这条消息，
+        跳过编辑要以 Telegram 上实际显示的为准。delay > 0 时最早在 delay 秒后发送
+        (已有延迟中的请求时不再推迟)；delay 为 0 的请求会取消已有的延迟。
+        """
+        if current is not None:
+            self._remember(message_id, current)
+
+        if delay <= 0:
+            self._not_before.pop(message_id, None)
+        elif message_id not in self._not_before:
+            self._not_before[message_id] = time.monotonic() + delay
+
+        # 只保留最新的渲染请求，旧的直接被覆盖
+        self._pending[message_id] = render
+        if tracer.enabled:
+            self._spans[message_id] = tracer.current()
+        if message_id not in self._workers:
+            self._workers[message_id] = asyncio.create_task(self._run(bot, message_id))
+
+    def _remember(self, message_id: int, rendered: Rendered) -> None:
+        self._last_sent[message_id] = rendered
+        self._last_sent.move_to_end(message_id)
+        while len(self._last_sent) > self.max_remembered:
+            evicted, _ = self._last_sent.popitem(last=False)
+            self._last_sent_at.pop(evicted, None)
+
+    async def _run(self, bot: Bot, message_id: int) -> None:
+        try:
+            while message_id in self._pending:
+                # 距离上次发送不足 window (或还在请求的延迟内) 时先等待，期间到达的请求会被合并
+                while not self._closing:
+                    ready_at = max(self._last_sent_at.get(message_id, 0) + self.window,
+                                   self._not_before.get(message_id, 0))
+                    delay = ready_at - time.monotonic()
+                    if delay <= 0:
+                        break
+                    # 分段等待：期间到达的无延迟请求 (点击) 会取消延迟，最多再等一个 window
+                    await asyncio.sleep(min(delay, self.window) if self.window > 0 else delay)
+                self._not_before.pop(message_id, None)
+
+                render = self._pending.pop(message_id)
+                with tracer.resume(self._spans.pop(message_id, None)):
+                    try:
+                        with tracer.span("edit.render", "edit"):
+                            rendered = await render()
+                    except Exception as e:
+                        logger.warning(f"渲染帖子 {message_id} 失败: {e}")
+                        continue
+
+                    if self._last_sent.get(message_id) == rendered:
+                        self.edits_skipped += 1
+                        continue
+
+                    await self._send(bot, message_id, rendered)
+        finally:
+            self._workers.pop(message_id, None)
+
+    async def _send(self, bot: Bot, message_id: int, rendered: Rendered) -> None:
+        caption, reply_markup = rendered
+        try:
+            # 被限流时不在调度器里重试，而是交给下面重新渲染最新状态
+            await outbound.submit(
+                CHANNEL_ID, Priority.EDIT, bot.edit_message_caption,
+                retry=False,
+                lane=message_id,
+                chat_id=CHANNEL_ID,
+                message_id=message_id,
+                caption=caption,
+                parse_mode=ParseMode.HTML,
+                reply_markup=reply_markup
+            )
+            self.edits_sent += 1
+            self._remember(message_id, rendered)
+        except RetryAfter as e:
+            # 被限流：如果期间没有更新的渲染请求，就把本次放回去，等待后重试
+            logger.warning(f"编辑帖子 {message_id} 被限流，{e.retry_after} 秒后重试")
+            if not self._closing:
+                self._pending.setdefault(message_id, _constant(rendered))
+            self._last_sent_at[message_id] = time.monotonic() + retry_after_seconds(e) - self.window
+            return
+        except BadRequest as e:
+            if "not modified" in str(e).lower():
+                self._remember(message_id, rendered)
+            else:
+                logger.warning(f"编辑帖子 {message_id} 失败: {e}")
+        except TelegramError as e:
+            logger.warning(f"编辑帖子 {message_id} 失败: {e}")
+
+        self._last_sent_at[message_id] = time.monotonic()
+
+    def pending(self) -> int:
+        """有编辑在等待或进行中的帖子数"""
+        return len(self._workers)
+
+    async def flush(self) -> None:
+        """立即发送所有待处理的编辑 (关闭时调用)；完成后恢复正常的合并"""
+        self._closing = True
+        try:
+            while self._workers:
+                await asyncio.gather(*list(self._workers.values()), return_exceptions=True)
+        finally:
+            self._closing = False
+
+
+def _constant(rendered: Rendered) -> RenderFn:
+    async def render() -> Rendered:
+        return rendered
+    return render
+
+
+edit_coalescer = EditCoalescer(EDIT_COALESCE_WINDOW)
@@ -0,0 +1,355 @@
+# services/metrics.py
+
+import asyncio
+import logging
+import re
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aiohttp import web
+from telegram.request import BaseRequest, RequestData
+
+from config import METRICS_LISTEN, METRICS_PORT, METRICS_PATH, METRICS_LOG_INTERVAL
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+# 直方图分桶上界 (秒)
+HANDLER_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQL_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Prometheus 文本格式 0.0.4
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# 每个指标最多的标签值数量，超出的归入 "other" (防止异常的 SQL 文本或方法名撑爆内存)
+_MAX_LABELS = 200
+
+_WHITESPACE = re.compile(r"\s+")
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """把 SQL 文本归一化为标签：合并空白、字面量替换为 ?，过长时截断"""
+    text = _LITERALS.sub("?", _WHITESPACE.sub(" ", sql).strip())
+    return text if len(text) <= 160 else text[:157] + "..."
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Histogram:
+    """固定分桶的直方图 (非累积计数，输出时再累加)"""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+def quantile(buckets: Tuple[float, ...], counts: List[int], q: float) -> float:
+    """按分桶估计分位数 (取所在桶的上界；落在最后一个桶时返回最大的上界)"""
+    total = sum(counts)
+    if not total:
+        return 0.0
+    rank = q * total
+    seen = 0
+    for bound, count in zip(buckets, counts):
+        seen += count
+        if seen >= rank:
+            return bound
+    return buckets[-1]
+
+
+class HistogramFamily:
+    def __init__(self, name: str, help_text: str, label: str, buckets: Tuple[float, ...]):
+        self.name = name
+        self.help = help_text
+        self.label = label
+        self.buckets = buckets
+        self.series: Dict[str, Histogram] = {}
+
+    def observe(self, label_value: str, value: float) -> None:
+        series = self.series.get(label_value)
+        if series is None:
+            if len(self.series) >= _MAX_LABELS:
+                label_value = "other"
+                series = self.series.get(label_value)
+            if series is None:
+                series = self.series[label_value] = Histogram(self.buckets)
+        series.observe(value)
+
+    def render(self, lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} histogram")
+        for label_value, series in sorted(self.series.items()):
+            label = f'{self.label}="{_escape(label_value)}"'
+            cumulative = 0
+            for bound, count in zip(self.buckets, series.counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label},le="{_format(bound)}"}} {cumulative}')
+            lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {series.count}')
+            lines.append(f"{self.name}_sum{{{label}}} {_format(series.sum)}")
+            lines.append(f"{self.name}_count{{{label}}} {series.count}")
+
+
+class CounterFamily:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...]):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values: Dict[Tuple[str, ...], int] = {}
+
+    def inc(self, *label_values: str) -> None:
+        if label_values not in self.values and len(self.values) >= _MAX_LABELS:
+            label_values = ("other",) * len(self.labels)
+        self.values[label_values] = self.values.get(label_values, 0) + 1
+
+    def render(self, lines: List[str]) -> None:
+        lines.append(f"# HELP {self.name} {self.help}")
+        lines.append(f"# TYPE {self.name} counter")
+        for label_values, value in sorted(self.values.items()):
+            labels = ",".join(f'{key}="{_escape(v)}"' for key, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{labels}}} {value}")
+
+
+class Metrics:
+    """
+    进程内的指标注册表，开销只有一次 perf_counter、一次字典查找和一次二分查找，可以常开
+
+    - 处理器耗时：按钮回调按动作类型 (like/collect/comment_show/approve/...)，整个更新按更新类型
+    - SQL 耗时：按归一化的语句文本 (SQLite 由 DatabasePool 的连接包装记录，PostgreSQL 由 asyncpg 的 query logger 记录)
+    - Telegram API 耗时和错误数：按方法名 (由 InstrumentedRequest 记录)
+    - 队列深度：注册的回调在抓取时才求值
+    render() 输出 Prometheus 文本格式；summary() 生成距上次汇总以来的日志摘要。
+    """
+
+    def __init__(self):
+        self.handler = HistogramFamily(
+            "bot_handler_duration_seconds", "按钮回调处理耗时 (按动作类型)", "action", HANDLER_BUCKETS)
+        self.update = HistogramFamily(
+            "bot_update_duration_seconds", "单个更新的处理耗时 (按更新类型)", "type", HANDLER_BUCKETS)
+        self.sql = HistogramFamily(
+            "bot_sql_duration_seconds", "SQL 语句耗时 (按归一化的语句)", "query", SQL_BUCKETS)
+        self.api = HistogramFamily(
+            "bot_telegram_api_duration_seconds", "Telegram API 调用耗时 (按方法)", "method", HANDLER_BUCKETS)
+        self.handler_errors = CounterFamily(
+            "bot_handler_errors_total", "按钮回调处理器抛出的异常数", ("action",))
+        self.api_errors = CounterFamily(
+            "bot_telegram_api_errors_total", "Telegram API 调用错误数 (HTTP 状态码或异常类型)", ("method", "error"))
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._last: Dict[Tuple[str, str], Tuple[int, float, List[int]]] = {}
+        self._last_errors: Dict[Tuple[str, ...], int] = {}
+        self._started = time.time()
+        self._summary_task: Optional[asyncio.Task] = None
+
+    # --- 记录 ---
+
+    def observe_handler(self, action: str, seconds: float, failed: bool = False) -> None:
+        self.handler.observe(action, seconds)
+        if failed:
+            self.handler_errors.inc(action)
+
+    def observe_update(self, update_type: str, seconds: float) -> None:
+        self.update.observe(update_type, seconds)
+
+    def observe_sql(self, sql: str, seconds: float) -> None:
+        self.sql.observe(normalize_sql(sql), seconds)
+
+    def observe_api(self, method: str, seconds: float, error: Optional[str] = None) -> None:
+        self.api.observe(method, seconds)
+        if error is not None:
+            self.api_errors.inc(method, error)
+
+    def gauge(self, queue: str, read: Callable[[], float]) -> None:
+        """注册一个队列深度，抓取时调用 read() 取当前值 (同名的重复注册会覆盖)"""
+        self._gauges[queue] = read
+
+    # --- 输出 ---
+
+    def _gauge_values(self) -> Dict[str, float]:
+        values = {}
+        for queue, read in self._gauges.items():
+            try:
+                values[queue] = float(read())
+            except Exception as e:
+                logger.debug(f"读取队列深度 {queue} 失败: {e}")
+        return values
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for family in (self.handler, self.update, self.sql, self.api):
+            family.render(lines)
+        for family in (self.handler_errors, self.api_errors):
+            family.render(lines)
+        lines.append("# HELP bot_queue_depth 后台队列中等待的任务数")
+        lines.append("# TYPE bot_queue_depth gauge")
+        for queue, value in sorted(self._gauge_values().items()):
+            lines.append(f'bot_queue_depth{{queue="{_escape(queue)}"}} {_format(value)}')
+        lines.append("# HELP bot_uptime_seconds 进程启动以来的秒数")
+        lines.append("# TYPE bot_uptime_seconds gauge")
+        lines.append(f"bot_uptime_seconds {_format(round(time.time() - self._started, 3))}")
+        return "\n".join(lines) + "\n"
+
+    def _delta(self, family: HistogramFamily) -> List[Tuple[str, int, float, float]]:
+        """距上次汇总以来每个标签的 (标签, 次数, 平均秒, p95 秒)"""
+        rows = []
+        for label_value, series in family.series.items():
+            key = (family.name, label_value)
+            count, total, counts = self._last.get(key, (0, 0.0, [0] * len(series.counts)))
+            delta_counts = [now - before for now, before in zip(series.counts, counts)]
+            delta = series.count - count
+            self._last[key] = (series.count, series.sum, list(series.counts))
+            if delta:
+                rows.append((label_value, delta, (series.sum - total) / delta,
+                             quantile(family.buckets, delta_counts, 0.95)))
+        return rows
+
+    def summary(self) -> str:
+        """距上次调用以来的摘要 (供定期日志使用)"""
+        def describe(rows, limit: int) -> str:
+            return "; ".join(
+                f"{label} ×{count} 平均 {avg * 1000:.1f}ms p95≤{p95 * 1000:g}ms"
+                for label, count, avg, p95 in rows[:limit]
+            ) or "无"
+
+        handlers = sorted(self._delta(self.handler), key=lambda row: -row[1])
+        updates = sorted(self._delta(self.update), key=lambda row: -row[1])
+        api = sorted(self._delta(self.api), key=lambda row: -row[1])
+        # SQL 按总耗时排序
+        sql = sorted(self._delta(self.sql), key=lambda row: -row[1] * row[2])
+        errors = {}
+        for key, value in self.api_errors.values.items():
+            delta = value - self._last_errors.get(key, 0)
+            self._last_errors[key] = value
+            if delta:
+                errors[f"{key[0]}:{key[1]}"] = delta
+        return "\n".join([
+            f"更新: {describe(updates, 5)}",
+            f"按钮: {describe(handlers, 8)}",
+            f"API: {describe(api, 8)}",
+            f"API 错误: {errors or '无'}",
+            f"SQL (按总耗时): {describe(sql, 5)}",
+            f"队列: {self._gauge_values()}",
+        ])
+
+    # --- 定期日志 ---
+
+    def start_summary(self, interval: float) -> None:
+        """每 interval 秒在日志中输出一次摘要 (interval <= 0 时不输出)"""
+        if interval > 0 and self._summary_task is None:
+            self._summary_task = asyncio.create_task(self._log_summaries(interval))
+
+    async def _log_summaries(self, interval: float) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            logger.info(f"📊 最近 {interval:g} 秒的指标:\n{self.summary()}")
+
+    async def stop_summary(self) -> None:
+        if self._summary_task is not None:
+            self._summary_task.cancel()
+            await asyncio.gather(self._summary_task, return_exceptions=True)
+            self._summary_task = None
+
+
+metrics = Metrics()
+
+
+class InstrumentedRequest(BaseRequest):
+    """包装 PTB 的 HTTP 层：按 API 方法记录每次调用的耗时和错误 (HTTP 状态码 >= 400 或网络异常)"""
+
+    def __init__(self, request: BaseRequest):
+        self._request = request
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self._request.read_timeout
+
+    async def initialize(self) -> None:
+        await self._request.initialize()
+
+    async def shutdown(self) -> None:
+        await self._request.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=BaseRequest.DEFAULT_NONE, write_timeout=BaseRequest.DEFAULT_NONE,
+                         connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        endpoint = url.rsplit("/", 1)[-1]
+        started = time.perf_counter()
+        try:
+            status, payload = await self._request.do_request(
+                url, method, request_data=request_data, read_timeout=read_timeout,
+                write_timeout=write_timeout, connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+            )
+        except Exception as e:
+            seconds = time.perf_counter() - started
+            metrics.observe_api(endpoint, seconds, type(e).__name__)
+            tracer.record(endpoint, "telegram", started, seconds, error=type(e).__name__)
+            raise
+        seconds = time.perf_counter() - started
+        metrics.observe_api(endpoint, seconds, str(status) if status >= 400 else None)
+        tracer.record(endpoint, "telegram", started, seconds, status=status)
+        return status, payload
+
+
+class MetricsServer:
+    """只监听本地地址的 Prometheus 抓取端点 (与 webhook 服务器分开，不对公网暴露)"""
+
+    def __init__(self, listen: str, port: int, path: str):
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(body=metrics.render().encode(), headers={"Content-Type": CONTENT_TYPE})
+
+    async def start(self) -> None:
+        if self.port <= 0 or self._runner is not None:
+            return
+        app = web.Application()
+        app.router.add_get(self.path, self.handle_metrics)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.listen, self.port)
+        await site.start()
+        logger.info(f"📈 指标端点已监听 http://{self.listen}:{self.port}{self.path}")
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+metrics_server = MetricsServer(METRICS_LISTEN, METRICS_PORT, METRICS_PATH)
+
+
+async def start_metrics() -> None:
+    """启动本地抓取端点和定期日志摘要 (post_init 中调用)"""
+    try:
+        await metrics_server.start()
+    except OSError as e:
+        # 端口被占用不影响机器人运行
+        logger.error(f"❌ 指标端点启动失败 ({METRICS_LISTEN}:{METRICS_PORT}): {e}")
+    metrics.start_summary(METRICS_LOG_INTERVAL)
+
+
+async def stop_metrics() -> None:
+    await metrics.stop_summary()
+    await metrics_server.stop()
@@ -0,0 +1,328 @@
+# services/notification_outbox.py
+
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Set, Tuple
+
+from telegram import Bot
+from telegram.constants import ParseMode
+from telegram.error import BadRequest, Forbidden, RetryAfter
+
+from config import (
+    CHANNEL_USERNAME,
+    NOTIFY_BATCH_SIZE,
+    NOTIFY_POLL_INTERVAL,
+    NOTIFY_LEASE,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_BACKOFF_BASE,
+    NOTIFY_BACKOFF_MAX,
+    NOTIFY_DIGEST_WINDOW,
+    NOTIFY_IMMEDIATE_TYPES,
+    NOTIFY_DIGEST_MAX_GROUPS,
+    NOTIFY_DIGEST_MAX_ROWS,
+)
+from services.outbound import Priority, outbound, retry_after_seconds
+from services.profile_cache import profile_cache
+from storage import OutboxRow, storage
+
+logger = logging.getLogger(__name__)
+
+
+def _escape(text: str) -> str:
+    return text.replace('<', '&lt;').replace('>', '&gt;')
+
+
+def _post_link(message_id: int, content_text: str) -> str:
+    post_url = f"https://t.me/{CHANNEL_USERNAME}/{message_id}"
+    content_text = content_text or "你的作品"
+    preview_text = content_text[:30] + "..." if len(content_text) > 30 else content_text
+    return f'<a href="{post_url}">{_escape(preview_text)}</a>'
+
+
+async def render_notification(bot: Bot, row: OutboxRow) -> Optional[str]:
+    """生成通知文本；帖子已不存在时返回 None"""
+    submission = await storage.get_submission(row.channel_message_id)
+    if submission is None:
+        return None
+
+    # 生成行为者链接 (名称以用户目录为准)
+    actor_name = await profile_cache.display_name(bot, row.actor_id, row.payload.get("actor_name", ""))
+    actor_link = f'<a href="tg://user?id={row.actor_id}">{actor_name}</a>'
+    post_link = _post_link(row.channel_message_id, submission.content_text)
+
+    if row.notification_type == "like":
+        return f"👍 {actor_link} 赞了你的作品 {post_link}"
+    if row.notification_type == "collect":
+        return f"⭐ {actor_link} 收藏了你的作品 {post_link}"
+    if row.notification_type == "comment":
+        comment_text = row.payload.get("comment_text", "")
+        preview = comment_text[:50] + ("..." if len(comment_text) > 50 else "")
+        return f"💬 {actor_link} 评论了你的作品 {post_link}\n\n评论内容：{_escape(preview)}"
+    return None
+
+
+# 汇总消息中每种通知的图标和动词，按这个顺序排列
+_DIGEST_VERBS = (("like", "👍", "赞了"), ("collect", "⭐", "收藏了"), ("comment", "💬", "评论了"))
+
+
+async def render_digest(bot: Bot, rows: List[OutboxRow], merged: Optional[Dict[str, int]] = None) -> Optional[str]:
+    """
+    把同一作者、同一帖子的多条通知合并成一条消息，例如
+    "👍 张三 和另外 37 人赞了你的作品 《...》"；只有一条时与单条通知相同。
+    merged 为每种通知中已经只计数、不在 rows 里的条数 (见 _DigestGroup)
+    """
+    merged = merged or {}
+    if len(rows) == 1 and not any(merged.values()):
+        return await render_notification(bot, rows[0])
+
+    submission = await storage.get_submission(rows[0].channel_message_id)
+    if submission is None:
+        return None
+    post_link = f"《{_post_link(rows[0].channel_message_id, submission.content_text)}》"
+
+    lines = []
+    for notification_type, emoji, verb in _DIGEST_VERBS:
+        typed = [row for row in rows if row.notification_type == notification_type]
+        counted = merged.get(notification_type, 0)
+        if not typed:
+            if counted:
+                lines.append(f"{emoji} {counted} 人{verb}你的作品 {post_link}")
+            continue
+        # 点名最近的一位，其余人合并计数
+        latest = typed[-1]
+        actor_name = await profile_cache.display_name(bot, latest.actor_id, latest.payload.get("actor_name", ""))
+        actor_link = f'<a href="tg://user?id={latest.actor_id}">{actor_name}</a>'
+        others = len({row.actor_id for row in typed}) - 1 + counted
+        if others > 0:
+            lines.append(f"{emoji} {actor_link} 和另外 {others} 人{verb}你的作品 {post_link}")
+        else:
+            lines.append(f"{emoji} {actor_link} {verb}你的作品 {post_link}")
+    return "\n".join(lines) if lines else None
+
+
+class _DigestGroup:
+    """
+    一组 (作者, 帖子) 的汇总：只保留最近的 max_rows 行 (用于点名)，更早的行只按类型计数。
+    通知按 (帖子, 触发用户, 类型) 去重，所以计数就是人数
+    """
+
+    __slots__ = ("rows", "merged", "deadline")
+
+    def __init__(self, deadline: float):
+        self.rows: "OrderedDict[int, OutboxRow]" = OrderedDict()  # 按通知 ID 去重 (租约到期后可能被重新认领)
+        self.merged: Dict[str, int] = {}
+        self.deadline = deadline
+
+    def add(self, row: OutboxRow, max_rows: int) -> Optional[OutboxRow]:
+        """加入一行；超出 max_rows 时把最早的一行折叠成计数并返回它"""
+        self.rows[row.id] = row
+        self.rows.move_to_end(row.id)
+        if len(self.rows) <= max_rows:
+            return None
+        _, oldest = self.rows.popitem(last=False)
+        self.merged[oldest.notification_type] = self.merged.get(oldest.notification_type, 0) + 1
+        return oldest
+
+
+class NotificationOutbox:
+    """
+    通知发件箱 (notifications 表) 的后台投递任务
+
+    处理器在写入互动/评论的同一个事务内插入通知，这里按批认领到期的行，
+    通过出站调度器发送，成功后标记为已送达，失败时按指数退避重试。
+    认领带租约：进程在发送途中退出时，租约到期后这些行会被重新认领 (至少送达一次)。
+
+    汇总模式：不在 immediate_types 中的通知按 (作者, 帖子) 在内存中缓冲 digest_window 秒，
+    合并成一条消息发送。缓冲中的行一直持有租约 (租约时长会加上窗口)，进程退出未发出时
+    同样会被重新认领；缓冲最多 max_groups 组，超出时提前发送最早的一组，关闭时全部发出。
+    每组最多保留 max_rows 行，更早的行折叠成计数并立即标记为已送达 (内容已并入这条汇总)，
+    因此进程在汇总发出前退出时，折叠掉的通知不会再发送。
+    """
+
+    def __init__(self, batch_size: int, poll_interval: float, lease: int,
+                 max_attempts: int, backoff_base: float, backoff_max: float,
+                 digest_window: float = 0, immediate_types: Set[str] = frozenset(),
+                 max_groups: int = 1000, max_rows: int = 50):
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.digest_window = digest_window
+        self.immediate_types = set(immediate_types)
+        self.max_groups = max_groups
+        self.max_rows = max_rows
+        self._groups: "OrderedDict[Tuple[int, int], _DigestGroup]" = OrderedDict()
+        self._bot: Optional[Bot] = None
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.delivered = 0
+        self.failed = 0
+        self.digests_sent = 0
+
+    def start(self, bot: Bot) -> None:
+        if self._task is None:
+            self._bot = bot
+            self._closing = False
+            self._task = asyncio.create_task(self._run())
+
+    def wake(self) -> None:
+        """有新通知写入时调用，让投递任务立即检查而不必等到下次轮询"""
+        self._wakeup.set()
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempts))
+        return delay * random.uniform(0.8, 1.2)
+
+    def is_immediate(self, notification_type: str) -> bool:
+        return self.digest_window <= 0 or notification_type in self.immediate_types
+
+    async def _deliver(self, rows: List[OutboxRow], merged: Optional[Dict[str, int]] = None) -> None:
+        """发送一条消息 (单条通知或同一帖子的汇总)，并更新这些行的状态"""
+        recipient_id = rows[0].recipient_id
+        error = None
+        retry_at = None
+        try:
+            text = await render_digest(self._bot, rows, merged)
+            if text is not None:
+                await outbound.submit(
+                    recipient_id, Priority.NOTIFICATION, self._bot.send_message,
+                    chat_id=recipient_id,
+                    text=text,
+                    parse_mode=ParseMode.HTML,
+                    disable_web_page_preview=False
+                )
+        except (Forbidden, BadRequest) as e:
+            # 用户屏蔽了机器人 / 从未私聊过机器人，重试没有意义
+            error = str(e)
+        except RetryAfter as e:
+            error = str(e)
+            retry_at = int(time.time() + retry_after_seconds(e))
+        except Exception as e:
+            error = str(e)
+            attempts = max(row.attempts for row in rows)
+            if attempts + 1 < self.max_attempts:
+                retry_at = int(time.time() + self._backoff(attempts))
+
+        if error is None:
+            folded = sum(merged.values()) if merged else 0
+            self.delivered += len(rows) + folded
+            if len(rows) + folded > 1:
+                self.digests_sent += 1
+            now = int(time.time())
+            for row in rows:
+                await storage.complete_notification(row.id, row.lease_until, now)
+            return
+
+        if retry_at is None:
+            self.failed += len(rows)
+            logger.warning(f"放弃发送 {len(rows)} 条通知 (给 {recipient_id}): {error}")
+        else:
+            logger.warning(f"发送 {len(rows)} 条通知 (给 {recipient_id}) 失败，{retry_at - int(time.time())} 秒后重试: {error}")
+        for row in rows:
+            await storage.fail_notification(row.id, row.lease_until, error, retry_at)
+
+    def _buffer(self, row: OutboxRow) -> Optional[OutboxRow]:
+        """放入汇总缓冲，返回被折叠成计数的行 (需要标记为已送达)"""
+        key = (row.recipient_id, row.channel_message_id)
+        group = self._groups.get(key)
+        if group is None:
+            group = self._groups[key] = _DigestGroup(time.monotonic() + self.digest_window)
+        return group.add(row, self.max_rows)
+
+    async def _flush_groups(self, force: bool = False) -> None:
+        """发送已到期的汇总 (force 时全部发送)，以及超出 max_groups 的最早几组"""
+        now = time.monotonic()
+        due = []
+        for key, group in list(self._groups.items()):
+            if force or group.deadline <= now or len(self._groups) > self.max_groups:
+                self._groups.pop(key)
+                due.append(group)
+        if due:
+            await asyncio.gather(*(self._deliver(list(group.rows.values()), group.merged) for group in due))
+
+    def _next_deadline(self) -> Optional[float]:
+        """距最早一组汇总到期的秒数，没有缓冲时返回 None"""
+        if not self._groups:
+            return None
+        return min(group.deadline for group in self._groups.values()) - time.monotonic()
+
+    def buffered(self) -> int:
+        """缓冲中等待汇总的通知条数"""
+        return sum(len(group.rows) for group in self._groups.values())
+
+    async def dispatch_once(self) -> int:
+        """认领一批到期的通知：立即类型直接发送，其余放入汇总缓冲；返回认领的条数"""
+        now = int(time.time())
+        # 汇总中的行在缓冲期间要一直持有租约
+        lease = self.lease + (int(self.digest_window) + 1 if self.digest_window > 0 else 0)
+        rows = await storage.claim_notifications(now, now + lease, self.batch_size)
+        immediate = []
+        folded = []
+        for row in rows:
+            if self.is_immediate(row.notification_type):
+                immediate.append([row])
+            else:
+                row = self._buffer(row)
+                if row is not None:
+                    folded.append(row)
+        for row in folded:
+            await storage.complete_notification(row.id, row.lease_until, now)
+        if immediate:
+            await asyncio.gather(*(self._deliver(group) for group in immediate))
+        await self._flush_groups()
+        return len(rows)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            self._wakeup.clear()
+            try:
+                claimed = await self.dispatch_once()
+            except Exception as e:
+                logger.error(f"投递通知失败: {e}")
+                claimed = 0
+
+            # 满批说明还有积压，继续投递；否则等待新通知、下一组汇总到期或下次轮询
+            if claimed < self.batch_size and not self._closing:
+                timeout = self.poll_interval
+                next_deadline = self._next_deadline()
+                if next_deadline is not None:
+                    timeout = max(0.0, min(timeout, next_deadline))
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def stop(self) -> None:
+        """停止投递 (正在发送的一批会发完)；未送达的通知留在表中，下次启动后继续"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+        # 缓冲中的汇总不等窗口结束，关闭前全部发出
+        try:
+            await self._flush_groups(force=True)
+        except Exception as e:
+            logger.error(f"关闭时发送汇总通知失败: {e}")
+        logger.info(f"📮 通知投递已停止: 送达 {self.delivered} 条 (汇总消息 {self.digests_sent} 条)，放弃 {self.failed} 条")
+
+
+notification_outbox = NotificationOutbox(
+    NOTIFY_BATCH_SIZE,
+    NOTIFY_POLL_INTERVAL,
+    NOTIFY_LEASE,
+    NOTIFY_MAX_ATTEMPTS,
+    NOTIFY_BACKOFF_BASE,
+    NOTIFY_BACKOFF_MAX,
+    NOTIFY_DIGEST_WINDOW,
+    NOTIFY_IMMEDIATE_TYPES,
+    NOTIFY_DIGEST_MAX_GROUPS,
+    NOTIFY_DIGEST_MAX_ROWS,
+)
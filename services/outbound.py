@@ -0,0 +1,330 @@
+# services/outbound.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict, deque
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Set, Tuple, Union
+
+from telegram.error import RetryAfter
+
+from config import (
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_GROUP_PER_MINUTE,
+    OUTBOUND_GROUP_EDIT_PER_MINUTE,
+    OUTBOUND_MAX_INFLIGHT,
+    OUTBOUND_MAX_RETRIES,
+)
+from services.tracing import Span, tracer
+
+logger = logging.getLogger(__name__)
+
+
+class Priority(IntEnum):
+    EDIT = 0          # 用户正在看的编辑 (频道按钮栏、菜单翻页)
+    REPLY = 1         # 对用户操作的直接回复、审核流程
+    NOTIFICATION = 2  # 通知作者、置顶等附带消息
+
+
+def retry_after_seconds(e: RetryAfter) -> float:
+    """RetryAfter.retry_after 在新版本中是 timedelta"""
+    value = e.retry_after
+    return value.total_seconds() if hasattr(value, "total_seconds") else float(value)
+
+
+class TokenBucket:
+    """令牌桶：每秒补充 rate 个令牌，最多存 capacity 个"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """还需要等待多久才有一个令牌 (0 表示现在就有)"""
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def consume(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+
+class _Job:
+    __slots__ = ("chat_id", "priority", "lane", "method", "args", "kwargs", "retry", "future", "attempts", "span")
+
+    def __init__(self, chat_id: int, priority: Priority, method: Callable[..., Awaitable[Any]],
+                 args: tuple, kwargs: dict, retry: bool, future: asyncio.Future, span: Optional[Span] = None,
+                 lane: Optional[Hashable] = None):
+        self.chat_id = chat_id
+        self.priority = priority
+        self.lane = lane
+        self.method = method
+        self.args = args
+        self.kwargs = kwargs
+        self.retry = retry
+        self.future = future
+        self.attempts = 0
+        # 入队时所在的追踪 span，在调度器的任务中执行时继续使用
+        self.span = span
+
+
+class OutboundScheduler:
+    """
+    所有发往 Telegram 的消息/编辑都经过这里
+
+    - 全局令牌桶 (约 30 条/秒) + 每个聊天一个令牌桶 (私聊约 1 条/秒，群组/频道约 20 条/分钟)；
+      群组/频道的编辑另用一个令牌桶 (group_edit_per_minute)，发布、置顶等不占用编辑的额度
+    - 按优先级出队：编辑 > 回复 > 通知；同一优先级内按聊天轮转，某个聊天被限速时不阻塞其他聊天；
+      同一聊天内再按 lane (如频道帖子 ID) 轮转，一个帖子积压的编辑不会让其他帖子一直等待
+    - 编辑额度是整个频道共用的上限：同时有 N 个帖子在等待编辑时，每个帖子大约每 N × 60 / group_edit_per_minute
+      秒才能编辑一次 (默认 20 次/分钟即 N × 3 秒)。EditCoalescer 保证每个帖子最多排队一个编辑，
+      chat_depth(CHANNEL_ID) 即等待中的帖子数，作为指标导出
+    - 收到 RetryAfter 时该聊天暂停对应时间，任务放回队首自动重试 (retry=False 时把异常交给调用方)
+    未启动 (脚本、测试) 或已关闭时直接调用，不做限速。
+    """
+
+    def __init__(self, global_rate: float, private_rate: float, group_per_minute: float,
+                 max_inflight: int, max_retries: int, max_buckets: int = 10000,
+                 group_edit_per_minute: Optional[float] = None):
+        self.private_rate = private_rate
+        self.group_rate = group_per_minute / 60
+        self.group_edit_rate = (group_edit_per_minute or group_per_minute) / 60
+        self.max_inflight = max_inflight
+        self.max_retries = max_retries
+        self.max_buckets = max_buckets
+        self._global = TokenBucket(global_rate, global_rate)
+        # (chat_id, 是否为群组/频道的编辑) -> 令牌桶
+        self._buckets: "OrderedDict[Tuple[int, bool], TokenBucket]" = OrderedDict()
+        self._cooldown: Dict[int, float] = {}
+        # 每个优先级: chat_id -> lane -> 待发任务 (OrderedDict 顺序即轮转顺序)
+        self._queues: List["OrderedDict[int, OrderedDict[Hashable, Deque[_Job]]]"] = [OrderedDict() for _ in Priority]
+        self._depth = [0 for _ in Priority]
+        self._wakeup = asyncio.Event()
+        self._inflight: Optional[asyncio.Semaphore] = None
+        self._running: Set[asyncio.Task] = set()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+        self.sent = 0
+        self.failed = 0
+        self.rate_limited = 0
+        self.retried = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._closing = False
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._task = asyncio.create_task(self._run())
+
+    async def submit(self, chat_id: Union[int, str], priority: Priority, method: Callable[..., Awaitable[Any]], /,
+                     *args, retry: bool = True, lane: Optional[Hashable] = None, **kwargs) -> Any:
+        """
+        排队调用 method(*args, **kwargs) 并等待结果，例如:
+            await outbound.submit(author_id, Priority.NOTIFICATION, context.bot.send_message, chat_id=author_id, text=...)
+        chat_id 用于按聊天限速；lane 用于同一聊天内的轮转 (如频道帖子 ID)，不指定时按入队顺序发送。
+        """
+        if self._task is None or self._closing:
+            return await method(*args, **kwargs)
+
+        chat_id = _chat_key(chat_id)
+        future = asyncio.get_running_loop().create_future()
+        # 被采样的更新中，span 覆盖排队 + 调用，API 调用本身是它的子 span
+        with tracer.span(f"outbound.{getattr(method, '__name__', 'call')}", "outbound", priority=priority.name) as span:
+            self._enqueue(_Job(chat_id, priority, method, args, kwargs, retry, future, span, lane))
+            return await future
+
+    def _enqueue(self, job: _Job, front: bool = False) -> None:
+        lanes = self._queues[job.priority].get(job.chat_id)
+        if lanes is None:
+            lanes = self._queues[job.priority][job.chat_id] = OrderedDict()
+        jobs = lanes.get(job.lane)
+        if jobs is None:
+            jobs = lanes[job.lane] = deque()
+        if front:
+            jobs.appendleft(job)
+            lanes.move_to_end(job.lane, last=False)
+        else:
+            jobs.append(job)
+        self._depth[job.priority] += 1
+        self._wakeup.set()
+
+    def _bucket(self, chat_id: int, priority: Priority) -> TokenBucket:
+        # 负数 ID 和 @username 是群组/频道
+        group = isinstance(chat_id, str) or chat_id < 0
+        key = (chat_id, group and priority == Priority.EDIT)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if key[1]:
+                bucket = TokenBucket(self.group_edit_rate, min(5, max(1, self.group_edit_rate * 60)))
+            elif group:
+                bucket = TokenBucket(self.group_rate, min(5, max(1, self.group_rate * 60)))
+            else:
+                bucket = TokenBucket(self.private_rate, 3)
+            self._buckets[key] = bucket
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _pick(self, now: float) -> Tuple[Optional[_Job], float]:
+        """取出优先级最高、且所在聊天当前可发送的任务；都不可发送时返回最短等待时间"""
+        min_delay = 1.0
+        for priority, queue in enumerate(self._queues):
+            for chat_id in list(queue):
+                lanes = queue[chat_id]
+                # 跳过调用方已取消的任务
+                while lanes:
+                    lane, jobs = next(iter(lanes.items()))
+                    while jobs and jobs[0].future.done():
+                        jobs.popleft()
+                        self._depth[priority] -= 1
+                    if jobs:
+                        break
+                    del lanes[lane]
+                if not lanes:
+                    del queue[chat_id]
+                    continue
+
+                cooldown = self._cooldown.get(chat_id, 0) - now
+                if cooldown <= 0:
+                    self._cooldown.pop(chat_id, None)
+                delay = max(cooldown, self._bucket(chat_id, Priority(priority)).wait_time(now))
+                if delay > 0:
+                    min_delay = min(min_delay, delay)
+                    continue
+
+                job = jobs.popleft()
+                self._depth[priority] -= 1
+                if jobs:
+                    lanes.move_to_end(lane)  # 同一聊天内按 lane 轮转
+                else:
+                    del lanes[lane]
+                if lanes:
+                    queue.move_to_end(chat_id)  # 同优先级内按聊天轮转
+                else:
+                    del queue[chat_id]
+                return (job, 0.0)
+        return (None, min_delay)
+
+    async def _sleep(self, delay: float) -> None:
+        """等待 delay 秒，期间有新任务入队或任务完成时提前醒来"""
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run(self) -> None:
+        while True:
+            if not any(self._depth):
+                if self._closing:
+                    return
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            now = time.monotonic()
+            global_delay = self._global.wait_time(now)
+            if global_delay > 0:
+                await self._sleep(global_delay)
+                continue
+
+            job, delay = self._pick(now)
+            if job is None:
+                await self._sleep(delay)
+                continue
+
+            await self._inflight.acquire()
+            now = time.monotonic()
+            self._global.consume(now)
+            self._bucket(job.chat_id, job.priority).consume(now)
+            task = asyncio.create_task(self._execute(job))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _execute(self, job: _Job) -> None:
+        try:
+            with tracer.resume(job.span):
+                result = await job.method(*job.args, **job.kwargs)
+        except RetryAfter as e:
+            retry_after = retry_after_seconds(e)
+            self.rate_limited += 1
+            self._cooldown[job.chat_id] = time.monotonic() + retry_after
+            if job.retry and job.attempts < self.max_retries and not job.future.done():
+                job.attempts += 1
+                self.retried += 1
+                logger.warning(f"⏳ 发往 {job.chat_id} 的消息被限流，{retry_after:.0f} 秒后重试 (第 {job.attempts} 次)")
+                self._enqueue(job, front=True)
+            else:
+                self.failed += 1
+                if not job.future.done():
+                    job.future.set_exception(e)
+        except Exception as e:
+            self.failed += 1
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            self.sent += 1
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            self._inflight.release()
+            self._wakeup.set()
+
+    def queue_depth(self) -> Dict[str, int]:
+        """各优先级排队中的任务数"""
+        return {priority.name.lower(): self._depth[priority] for priority in Priority}
+
+    def chat_depth(self, chat_id: Union[int, str], priority: Priority = Priority.EDIT) -> int:
+        """某个聊天某个优先级排队中的任务数 (如频道等待编辑的帖子数)"""
+        lanes = self._queues[priority].get(_chat_key(chat_id))
+        return sum(len(jobs) for jobs in lanes.values()) if lanes else 0
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "queued": self.queue_depth(),
+            "inflight": len(self._running),
+            "sent": self.sent,
+            "failed": self.failed,
+            "rate_limited": self.rate_limited,
+            "retried": self.retried,
+        }
+
+    async def stop(self) -> None:
+        """发送完已排队的任务后停止；之后的 submit 直接调用"""
+        if self._task is None:
+            return
+        self._closing = True
+        self._wakeup.set()
+        await self._task
+        if self._running:
+            await asyncio.gather(*list(self._running), return_exceptions=True)
+        self._task = None
+        logger.info(f"📤 出站调度器已停止: {self.stats()}")
+
+
+def _chat_key(chat_id: Union[int, str]) -> Union[int, str]:
+    """配置中的 CHANNEL_ID 是字符串 ("-100..." 或 "@username")，数字形式统一为 int，与其他调用共用限速"""
+    if isinstance(chat_id, str) and chat_id.lstrip("-").isdigit():
+        return int(chat_id)
+    return chat_id
+
+
+outbound = OutboundScheduler(
+    OUTBOUND_GLOBAL_RATE,
+    OUTBOUND_PRIVATE_RATE,
+    OUTBOUND_GROUP_PER_MINUTE,
+    OUTBOUND_MAX_INFLIGHT,
+    OUTBOUND_MAX_RETRIES,
+    group_edit_per_minute=OUTBOUND_GROUP_EDIT_PER_MINUTE,
+)
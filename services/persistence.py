@@ -0,0 +1,261 @@
+# services/persistence.py
+
+import asyncio
+import json
+import logging
+import pickle
+import zlib
+from typing import Dict, Hashable, Optional, Tuple
+
+from telegram.ext import BasePersistence, PersistenceInput
+
+from storage.sqlite import DatabasePool
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = [
+    '''CREATE TABLE IF NOT EXISTS user_data (
+        user_id INTEGER PRIMARY KEY,
+        data BLOB NOT NULL
+    )''',
+    '''CREATE TABLE IF NOT EXISTS conversations (
+        name TEXT NOT NULL,
+        conv_key TEXT NOT NULL,
+        state BLOB NOT NULL,
+        PRIMARY KEY (name, conv_key)
+    ) WITHOUT ROWID''',
+]
+
+SQL_GET_USER_DATA = "SELECT data FROM user_data WHERE user_id = ?"
+SQL_UPSERT_USER_DATA = "INSERT INTO user_data (user_id, data) VALUES (?, ?) ON CONFLICT (user_id) DO UPDATE SET data = excluded.data"
+SQL_DELETE_USER_DATA = "DELETE FROM user_data WHERE user_id = ?"
+SQL_GET_CONVERSATIONS = "SELECT conv_key, state FROM conversations WHERE name = ?"
+SQL_UPSERT_CONVERSATION = "INSERT INTO conversations (name, conv_key, state) VALUES (?, ?, ?) ON CONFLICT (name, conv_key) DO UPDATE SET state = excluded.state"
+SQL_DELETE_CONVERSATION = "DELETE FROM conversations WHERE name = ? AND conv_key = ?"
+
+# 超过该长度的数据先压缩再存储 (如删除评论时暂存的评论列表)
+_COMPRESS_OVER = 512
+# 收到第一条变更后等待多久再写入，使 Application 同一轮 update_persistence 的所有变更合并为一个事务
+_COLLECT_DELAY = 0.05
+
+
+def dumps(value: object) -> bytes:
+    """紧凑序列化：pickle 最高协议，较大的数据再用 zlib 压缩；首字节标记格式"""
+    raw = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+    if len(raw) > _COMPRESS_OVER:
+        packed = zlib.compress(raw)
+        if len(packed) < len(raw):
+            return b"z" + packed
+    return b"p" + raw
+
+
+def loads(data: bytes) -> object:
+    if data[:1] == b"z":
+        return pickle.loads(zlib.decompress(data[1:]))
+    return pickle.loads(data[1:])
+
+
+class SqlitePersistence(BasePersistence):
+    """
+    对话状态和 user_data 的 SQLite 持久化 (单独的数据库文件)
+
+    - user_data 按用户懒加载：启动时不读取，用户的更新第一次进入处理器时
+      (refresh_user_data) 才按主键读取该用户的一行
+    - 脏数据跟踪：Application 会为每个有更新的用户调用 update_user_data，
+      序列化结果与上次写入的相同时不写；空的 user_data 直接删除该行
+    - 批量写入：Application 每 update_interval 秒汇总一次变更，本类把这一轮的所有
+      变更合并为一个事务写入；flush() (关闭时) 写完剩余的变更并关闭数据库
+    - 对话状态数量很少 (只有进行中的对话)，启动时整表读取
+    - 不保存 chat_data / bot_data / callback_data
+    """
+
+    def __init__(self, path: str, update_interval: float):
+        super().__init__(
+            store_data=PersistenceInput(bot_data=False, chat_data=False, user_data=True, callback_data=False),
+            update_interval=update_interval,
+        )
+        self.pool = DatabasePool(path, reader_count=1)
+        self._opened = False
+        self._open_lock = asyncio.Lock()
+        # 已加载用户最后一次写入 (或读出) 的序列化结果，用于判断是否有变化
+        self._stored: Dict[int, bytes] = {}
+        self._loading: Dict[int, asyncio.Future] = {}
+        # 待写入的变更：None 表示删除
+        self._pending_users: Dict[int, Optional[bytes]] = {}
+        self._pending_conversations: Dict[Tuple[str, str], Optional[bytes]] = {}
+        self._write_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self.user_loads = 0
+        self.writes = 0
+        self.skipped = 0
+
+    async def _open(self) -> None:
+        async with self._open_lock:
+            if self._opened:
+                return
+            await self.pool.open()
+            async with self.pool.write() as db:
+                for statement in SCHEMA:
+                    await db.execute(statement)
+            self._opened = True
+
+    # --- user_data ---
+
+    async def get_user_data(self) -> Dict[int, dict]:
+        """启动时不加载任何用户 (见 refresh_user_data)"""
+        await self._open()
+        return {}
+
+    async def _load_user(self, user_id: int) -> dict:
+        async with self.pool.read() as db:
+            cursor = await db.execute(SQL_GET_USER_DATA, (user_id,))
+            row = await cursor.fetchone()
+        self.user_loads += 1
+        if row is None:
+            return {}
+        self._stored[user_id] = bytes(row[0])
+        return loads(row[0])
+
+    async def refresh_user_data(self, user_id: int, user_data: dict) -> None:
+        """用户第一次出现时从数据库装载其 user_data (原地更新)；之后直接返回"""
+        if user_id in self._stored:
+            return
+        future = self._loading.get(user_id)
+        if future is None:
+            # 同一用户的并发更新只读取一次
+            future = self._loading[user_id] = asyncio.ensure_future(self._load_user(user_id))
+            try:
+                data = await future
+            finally:
+                del self._loading[user_id]
+            self._stored.setdefault(user_id, b"")
+            # 读取期间已写入的键以内存中的为准
+            for key, value in data.items():
+                user_data.setdefault(key, value)
+        else:
+            await future
+
+    async def update_user_data(self, user_id: int, data: dict) -> None:
+        if user_id not in self._stored and not data:
+            # 从未装载、也没有写入过的用户，没有需要保存的内容
+            return
+        payload = dumps(data) if data else b""
+        if self._stored.get(user_id) == payload:
+            self.skipped += 1
+            return
+        self._stored[user_id] = payload
+        self._pending_users[user_id] = payload or None
+        self._schedule_flush()
+
+    async def drop_user_data(self, user_id: int) -> None:
+        self._stored[user_id] = b""
+        self._pending_users[user_id] = None
+        self._schedule_flush()
+
+    # --- 对话状态 ---
+
+    async def get_conversations(self, name: str) -> Dict[Tuple[Hashable, ...], object]:
+        await self._open()
+        async with self.pool.read() as db:
+            cursor = await db.execute(SQL_GET_CONVERSATIONS, (name,))
+            rows = await cursor.fetchall()
+        return {tuple(json.loads(key)): loads(state) for key, state in rows}
+
+    async def update_conversation(self, name: str, key: Tuple[Hashable, ...], new_state: Optional[object]) -> None:
+        conv_key = json.dumps(list(key), separators=(",", ":"))
+        self._pending_conversations[(name, conv_key)] = None if new_state is None else dumps(new_state)
+        self._schedule_flush()
+
+    # --- 批量写入 ---
+
+    def _schedule_flush(self) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_soon())
+
+    async def _flush_soon(self) -> None:
+        await asyncio.sleep(_COLLECT_DELAY)
+        try:
+            await self._write_pending()
+        except Exception as e:
+            logger.error(f"❌ 写入对话持久化数据失败: {e}")
+
+    async def _write_pending(self) -> None:
+        async with self._write_lock:
+            while self._pending_users or self._pending_conversations:
+                users, self._pending_users = self._pending_users, {}
+                conversations, self._pending_conversations = self._pending_conversations, {}
+                try:
+                    async with self.pool.write() as db:
+                        upserts = [(user_id, data) for user_id, data in users.items() if data is not None]
+                        deletes = [(user_id,) for user_id, data in users.items() if data is None]
+                        if upserts:
+                            await db.executemany(SQL_UPSERT_USER_DATA, upserts)
+                        if deletes:
+                            await db.executemany(SQL_DELETE_USER_DATA, deletes)
+
+                        conv_upserts = [(name, key, state) for (name, key), state in conversations.items() if state is not None]
+                        conv_deletes = [(name, key) for (name, key), state in conversations.items() if state is None]
+                        if conv_upserts:
+                            await db.executemany(SQL_UPSERT_CONVERSATION, conv_upserts)
+                        if conv_deletes:
+                            await db.executemany(SQL_DELETE_CONVERSATION, conv_deletes)
+                except Exception:
+                    # 放回待写入 (不覆盖期间产生的更新)，下次再试
+                    for user_id, data in users.items():
+                        self._pending_users.setdefault(user_id, data)
+                    for key, state in conversations.items():
+                        self._pending_conversations.setdefault(key, state)
+                    raise
+                self.writes += 1
+
+    async def flush(self) -> None:
+        """关闭时调用 (Application.shutdown)：写完剩余变更并关闭数据库"""
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+            self._flush_task = None
+        if not self._opened:
+            return
+        try:
+            await self._write_pending()
+        finally:
+            await self.pool.close()
+            self._opened = False
+        logger.info(f"💾 对话持久化已写入: {self.writes} 次批量写入，跳过 {self.skipped} 次未变化的 user_data")
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "loaded_users": len(self._stored),
+            "pending": len(self._pending_users) + len(self._pending_conversations),
+            "user_loads": self.user_loads,
+            "writes": self.writes,
+            "skipped": self.skipped,
+        }
+
+    # --- 不保存的数据 ---
+
+    async def get_chat_data(self) -> Dict[int, dict]:
+        return {}
+
+    async def get_bot_data(self) -> dict:
+        return {}
+
+    async def get_callback_data(self) -> None:
+        return None
+
+    async def update_chat_data(self, chat_id: int, data: dict) -> None:
+        pass
+
+    async def update_bot_data(self, data: dict) -> None:
+        pass
+
+    async def update_callback_data(self, data: object) -> None:
+        pass
+
+    async def drop_chat_data(self, chat_id: int) -> None:
+        pass
+
+    async def refresh_chat_data(self, chat_id: int, chat_data: dict) -> None:
+        pass
+
+    async def refresh_bot_data(self, bot_data: dict) -> None:
+        pass
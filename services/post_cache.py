@@ -0,0 +1,283 @@
+# services/post_cache.py
+
+import logging
+import sys
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from config import POST_CACHE_MAX_BYTES, POST_CACHE_WARM_POSTS
+from services.tracing import traced
+from storage import PostCacheStorage, PostState, Submission, ToggleIntent, ToggleOutcome, decide_toggle, storage
+
+logger = logging.getLogger(__name__)
+
+# 每个缓存条目除内容和成员集合外的估计开销 (对象、字典、OrderedDict 节点)
+_ENTRY_OVERHEAD = 600
+
+
+class IdSet:
+    """有序 int64 数组实现的紧凑用户 ID 集合 (每个成员 8 字节，查找为二分)"""
+
+    __slots__ = ("_ids",)
+
+    def __init__(self, ids: Iterable[int] = ()):
+        self._ids = array("q", sorted(set(ids)))
+
+    def __contains__(self, user_id: int) -> bool:
+        i = bisect_left(self._ids, user_id)
+        return i < len(self._ids) and self._ids[i] == user_id
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def add(self, user_id: int) -> None:
+        i = bisect_left(self._ids, user_id)
+        if i == len(self._ids) or self._ids[i] != user_id:
+            self._ids.insert(i, user_id)
+
+    def discard(self, user_id: int) -> None:
+        i = bisect_left(self._ids, user_id)
+        if i < len(self._ids) and self._ids[i] == user_id:
+            del self._ids[i]
+
+    def nbytes(self) -> int:
+        return sys.getsizeof(self._ids)
+
+
+class PostEntry:
+    """一个热点帖子在内存中的状态"""
+
+    __slots__ = ("submission", "stats", "pinned", "likers", "dislikers", "collectors", "nbytes")
+
+    def __init__(self, state: PostState):
+        self.submission = state.submission
+        self.stats = dict(state.stats)
+        self.pinned = state.pinned
+        self.likers = IdSet(state.likers)
+        self.dislikers = IdSet(state.dislikers)
+        self.collectors = IdSet(state.collectors)
+        self.nbytes = self.measure()
+
+    def measure(self) -> int:
+        content = sys.getsizeof(self.submission.content_text or "") if self.submission else 0
+        return _ENTRY_OVERHEAD + content + self.likers.nbytes() + self.dislikers.nbytes() + self.collectors.nbytes()
+
+    def previous(self, intent: ToggleIntent) -> int:
+        """该用户在切换前的状态 (与 decide_toggle 的 previous 含义一致)"""
+        if intent.action == 'react':
+            if intent.user_id in self.likers:
+                return 1
+            if intent.user_id in self.dislikers:
+                return -1
+            return 0
+        if intent.action == 'collect':
+            return 1 if intent.user_id in self.collectors else 0
+        return 0
+
+    def apply(self, intent: ToggleIntent, new_value: int, deltas: Dict[str, int]) -> None:
+        user_id = intent.user_id
+        if intent.action == 'react':
+            self.likers.discard(user_id)
+            self.dislikers.discard(user_id)
+            if new_value == 1:
+                self.likers.add(user_id)
+            elif new_value == -1:
+                self.dislikers.add(user_id)
+        elif intent.action == 'collect':
+            if new_value:
+                self.collectors.add(user_id)
+            else:
+                self.collectors.discard(user_id)
+        for key, delta in deltas.items():
+            self.stats[key] = self.stats.get(key, 0) + delta
+
+
+class PostCache:
+    """
+    热点帖子的内存状态缓存 (元数据、计数、置顶标记、赞/踩/收藏的用户集合)
+
+    - 缓存中的帖子切换时直接在内存中决定结果，只向数据库写入 (write-through)，不再读取已有行；
+      未缓存的帖子在写队列中首次出现时装载一次
+    - 按估算的内存占用做 LRU 淘汰，总量不超过 max_bytes
+    - 启动时用最新的 warm_posts 个帖子预热
+    - 要求本进程是唯一的写入者，只在存储后端实现 PostCacheStorage 时启用 (SQLite)；否则所有方法直接转发给 storage
+    - 置顶由 record_pin 同步更新；评论增删后 note_comment 丢弃该帖子，下次重新装载 (评论不经过写队列，
+      装载的快照是否已包含这条评论无从判断，不能在快照上加减)；装载期间评论有变动的帖子，这次装载的快照不放入缓存
+    - 写入失败时丢弃涉及的帖子，下次重新装载
+    """
+
+    def __init__(self, max_bytes: int, warm_posts: int):
+        self.max_bytes = max_bytes
+        self.warm_posts = warm_posts
+        self._entries: "OrderedDict[int, PostEntry]" = OrderedDict()
+        self._bytes = 0
+        self._loading: Dict[int, int] = {}  # 正在装载的帖子 -> 进行中的装载次数
+        self._changed: Set[int] = set()  # 装载期间评论有变动的帖子
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0 and isinstance(storage, PostCacheStorage)
+
+    # --- 装载与淘汰 ---
+
+    def _store(self, message_id: int, entry: PostEntry) -> None:
+        old = self._entries.pop(message_id, None)
+        if old is not None:
+            self._bytes -= old.nbytes
+        self._entries[message_id] = entry
+        self._bytes += entry.nbytes
+        self._evict()
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            _, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.nbytes
+            self.evictions += 1
+
+    def _remeasure(self, message_id: int) -> None:
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            nbytes = entry.measure()
+            self._bytes += nbytes - entry.nbytes
+            entry.nbytes = nbytes
+
+    def _lookup(self, message_id: int) -> Optional[PostEntry]:
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            self._entries.move_to_end(message_id)
+            self.hits += 1
+        return entry
+
+    async def _ensure(self, message_ids: Sequence[int]) -> Dict[int, PostEntry]:
+        entries = {}
+        missing = []
+        for message_id in message_ids:
+            entry = self._lookup(message_id)
+            if entry is None:
+                missing.append(message_id)
+            else:
+                entries[message_id] = entry
+        if missing:
+            self.misses += len(missing)
+            entries.update(await self._load(missing))
+        return entries
+
+    async def _load(self, message_ids: Sequence[int]) -> Dict[int, PostEntry]:
+        """从数据库装载并放入缓存；装载期间评论有变动的帖子只返回给调用方，不放入缓存"""
+        for message_id in message_ids:
+            self._loading[message_id] = self._loading.get(message_id, 0) + 1
+        try:
+            states = await storage.load_post_states(message_ids)
+        finally:
+            stale = self._changed.intersection(message_ids)
+            for message_id in message_ids:
+                self._loading[message_id] -= 1
+                if not self._loading[message_id]:
+                    del self._loading[message_id]
+                    self._changed.discard(message_id)
+        entries = {}
+        for message_id, state in states.items():
+            entries[message_id] = PostEntry(state)
+            if message_id not in stale:
+                self._store(message_id, entries[message_id])
+        return entries
+
+    def invalidate(self, message_id: int) -> None:
+        entry = self._entries.pop(message_id, None)
+        if entry is not None:
+            self._bytes -= entry.nbytes
+
+    async def warm(self) -> None:
+        """启动时装载最新的帖子"""
+        if not self.enabled or self.warm_posts <= 0:
+            return
+        message_ids = await storage.recent_post_ids(self.warm_posts)
+        # 最旧的先放入，最新的帖子在 LRU 中最后被淘汰
+        await self._load(message_ids[::-1])
+        logger.info(f"🔥 热点帖子缓存已预热: {len(self._entries)} 个帖子，约 {self._bytes // 1024} KB")
+
+    # --- 切换 ---
+
+    async def apply_toggles(self, intents: Sequence[ToggleIntent]) -> Tuple[List[ToggleOutcome], Dict[int, Dict[str, int]]]:
+        """与 storage.apply_toggles 相同的语义；启用时在内存中决定切换，只向数据库写入"""
+        if not self.enabled:
+            return await storage.apply_toggles(intents)
+
+        message_ids = list(dict.fromkeys(intent.message_id for intent in intents))
+        entries = await self._ensure(message_ids)
+
+        decided = []
+        outcomes = []
+        for intent in intents:
+            entry = entries[intent.message_id]
+            previous = entry.previous(intent)
+            new_value, deltas, outcome = decide_toggle(intent, previous)
+            entry.apply(intent, new_value, deltas)
+            decided.append((intent, previous))
+            outcomes.append(outcome)
+
+        try:
+            await storage.write_toggles(decided)
+        except Exception:
+            # 内存状态已经改变但没有写入，丢弃这些帖子，下次从数据库重新装载
+            for message_id in message_ids:
+                self.invalidate(message_id)
+            raise
+
+        for message_id in message_ids:
+            self._remeasure(message_id)
+        self._evict()
+        return (outcomes, {message_id: dict(entries[message_id].stats) for message_id in message_ids})
+
+    # --- 读取 (命中时不查询数据库) ---
+
+    @traced("post_cache.get_submission")
+    async def get_submission(self, message_id: int) -> Optional[Submission]:
+        entry = self._lookup(message_id)
+        if entry is not None:
+            return entry.submission
+        return await storage.get_submission(message_id)
+
+    async def get_post_stats(self, message_id: int) -> Dict[str, int]:
+        entry = self._lookup(message_id)
+        if entry is not None:
+            return dict(entry.stats)
+        return await storage.get_post_stats(message_id)
+
+    async def is_pinned(self, message_id: int) -> bool:
+        entry = self._lookup(message_id)
+        if entry is not None:
+            return entry.pinned
+        return await storage.is_pinned(message_id)
+
+    # --- 其他写入路径的同步 ---
+
+    async def record_pin(self, message_id: int, like_count: int) -> bool:
+        recorded = await storage.record_pin(message_id, like_count)
+        entry = self._entries.get(message_id)
+        if entry is not None:
+            entry.pinned = True
+        return recorded
+
+    def note_comment(self, message_id: int) -> None:
+        """评论写入或删除成功后调用：丢弃该帖子，正在进行的装载也不放入缓存"""
+        self.invalidate(message_id)
+        if message_id in self._loading:
+            self._changed.add(message_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "posts": len(self._entries),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+post_cache = PostCache(POST_CACHE_MAX_BYTES, POST_CACHE_WARM_POSTS)
@@ -0,0 +1,107 @@
+# services/profile_cache.py
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from telegram import Bot
+
+from config import PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL
+from services.tracing import traced
+from services.user_directory import Profile, user_directory
+
+logger = logging.getLogger(__name__)
+
+
+class ProfileCache:
+    """
+    作者资料 (username / full_name) 的 LRU + TTL 缓存
+
+    - 命中未过期条目直接返回；命中过期条目先返回旧值，再在后台刷新
+    - 未命中时先查 users 表 (用户目录)，只有目录里没有的用户才调用 get_chat
+    - 同一用户的并发查询只会触发一次加载
+    - 查询失败也会被缓存 (值为 None)，避免对同一用户反复请求
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, Tuple[float, Optional[Profile]]]" = OrderedDict()
+        self._inflight: Dict[int, asyncio.Future] = {}
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    def _lookup(self, user_id: int) -> Tuple[bool, bool, Optional[Profile]]:
+        """返回 (是否存在, 是否新鲜, 值)"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return (False, False, None)
+        self._entries.move_to_end(user_id)
+        expires_at, profile = entry
+        return (True, expires_at > time.monotonic(), profile)
+
+    def put(self, user_id: int, profile: Optional[Profile]) -> None:
+        self._entries[user_id] = (time.monotonic() + self.ttl, profile)
+        self._entries.move_to_end(user_id)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    @traced("profile_cache.get")
+    async def get(self, bot: Bot, user_id: int) -> Optional[Profile]:
+        """读取资料；过期条目返回旧值并在后台刷新，不存在时等待查询结果"""
+        found, fresh, profile = self._lookup(user_id)
+        if found:
+            if fresh:
+                self.hits += 1
+            else:
+                self.stale_hits += 1
+                self.refresh_in_background(bot, user_id)
+            return profile
+
+        self.misses += 1
+        # shield: 调用方被取消时不影响其他等待同一查询的调用方
+        return await asyncio.shield(self._load(bot, user_id))
+
+    def refresh_in_background(self, bot: Bot, user_id: int) -> None:
+        self._load(bot, user_id)
+
+    def _load(self, bot: Bot, user_id: int) -> "asyncio.Future":
+        # 已有进行中的查询时，直接复用同一个 Future
+        future = self._inflight.get(user_id)
+        if future is None:
+            future = asyncio.ensure_future(self._fetch(bot, user_id))
+            self._inflight[user_id] = future
+            future.add_done_callback(lambda _: self._inflight.pop(user_id, None))
+        return future
+
+    async def _fetch(self, bot: Bot, user_id: int) -> Optional[Profile]:
+        try:
+            profile = await user_directory.lookup(user_id)
+            if profile is None:
+                chat = await bot.get_chat(user_id)
+                profile = Profile(chat.username or "", chat.full_name or "")
+        except Exception as e:
+            logger.warning(f"获取用户 {user_id} 资料失败: {e}")
+            profile = None
+        self.put(user_id, profile)
+        return profile
+
+    async def display_name(self, bot: Bot, user_id: int, fallback: str) -> str:
+        """解析用户的显示名称，查不到时使用 fallback"""
+        profile = await self.get(bot, user_id)
+        return (profile.full_name if profile else "") or fallback
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "size": len(self._entries),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "inflight": len(self._inflight),
+        }
+
+
+profile_cache = ProfileCache(PROFILE_CACHE_SIZE, PROFILE_CACHE_TTL)
@@ -0,0 +1,156 @@
+# services/slow_queries.py
+
+import asyncio
+import html
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Sequence, Set
+
+from config import SLOW_QUERY_MS, SLOW_QUERY_MAX_STATEMENTS
+from services.metrics import normalize_sql
+
+logger = logging.getLogger(__name__)
+
+ExplainFn = Callable[[], Awaitable[List[str]]]
+
+# Telegram 单条消息的长度上限
+_MESSAGE_LIMIT = 4096
+
+
+def param_shape(parameters, many: bool = False) -> str:
+    """
+    参数的形状 (类型和长度，不含取值，日志中不会出现评论内容等用户数据)，例如
+    (int, int, str[42])、executemany 时为 120 × (int, str[8])
+    """
+    if many:
+        rows = parameters if isinstance(parameters, Sequence) else list(parameters or ())
+        return f"{len(rows)} × {param_shape(rows[0]) if rows else '()'}"
+    if parameters is None:
+        return "()"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{key}: {_value_shape(value)}" for key, value in parameters.items()) + "}"
+    return "(" + ", ".join(_value_shape(value) for value in parameters) + ")"
+
+
+def _value_shape(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, (str, bytes, bytearray, list, tuple)):
+        return f"{type(value).__name__}[{len(value)}]"
+    return type(value).__name__
+
+
+class SlowStatement:
+    """一条 (归一化后的) 语句的慢查询汇总"""
+
+    __slots__ = ("sql", "count", "total", "max", "last_shape", "last_seen", "plan")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last_shape = ""
+        self.last_seen = 0.0
+        self.plan: Optional[List[str]] = None
+
+
+class SlowQueryLog:
+    """
+    慢查询日志：耗时超过阈值的语句记一条 WARNING (带参数形状)，并汇总成按最大耗时排序的表
+
+    - 某条语句第一次变慢时执行一次 EXPLAIN QUERY PLAN (PostgreSQL 为 EXPLAIN)，
+      结果按归一化的语句缓存，写入这次的日志；之后同一语句变慢只记耗时和参数形状
+    - 表中最多保留 max_statements 条语句，超出时淘汰最大耗时最小的
+    - 阈值为 0 时关闭
+    计时由数据库层完成 (SQLite 的 TimedConnection、PostgreSQL 的 query logger)，这里只在变慢时才做额外的工作。
+    """
+
+    def __init__(self, threshold_ms: float, max_statements: int):
+        self.threshold = threshold_ms / 1000 if threshold_ms > 0 else float("inf")
+        self.max_statements = max_statements
+        self._statements: Dict[str, SlowStatement] = {}
+        self._explaining: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.since = time.time()
+
+    def is_slow(self, seconds: float) -> bool:
+        return seconds >= self.threshold
+
+    async def record(self, sql: str, parameters, seconds: float, explain: Optional[ExplainFn] = None,
+                     many: bool = False) -> None:
+        """记录一次慢查询；该语句还没有执行计划时先调用 explain() 获取"""
+        key = normalize_sql(sql)
+        entry = self._statements.get(key)
+        if entry is None:
+            entry = self._statements[key] = SlowStatement(key)
+        entry.count += 1
+        entry.total += seconds
+        entry.max = max(entry.max, seconds)
+        entry.last_shape = param_shape(parameters, many)
+        entry.last_seen = time.time()
+        self._evict()
+
+        # 刚加入就被淘汰 (比表中所有语句都快) 的语句不值得再执行一次 EXPLAIN
+        first = (entry.plan is None and explain is not None and key in self._statements
+                 and key not in self._explaining)
+        if first:
+            self._explaining.add(key)
+            try:
+                entry.plan = await explain()
+            except Exception as e:
+                entry.plan = [f"(无法获取执行计划: {e})"]
+            finally:
+                self._explaining.discard(key)
+            plan = "\n".join(f"    {line}" for line in entry.plan) or "    (无)"
+            logger.warning(f"🐢 慢查询 {seconds * 1000:.1f}ms: {key} 参数 {entry.last_shape}\n  执行计划:\n{plan}")
+        else:
+            logger.warning(f"🐢 慢查询 {seconds * 1000:.1f}ms (第 {entry.count} 次): {key} 参数 {entry.last_shape}")
+
+    def record_soon(self, sql: str, parameters, seconds: float, explain: Optional[ExplainFn] = None) -> None:
+        """在同步回调 (如 asyncpg 的 query logger) 中记录：放到后台任务里执行"""
+        task = asyncio.get_running_loop().create_task(self.record(sql, parameters, seconds, explain))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _evict(self) -> None:
+        while len(self._statements) > self.max_statements:
+            victim = min(self._statements.values(), key=lambda entry: entry.max)
+            del self._statements[victim.sql]
+
+    def top(self, limit: int) -> List[SlowStatement]:
+        return sorted(self._statements.values(), key=lambda entry: entry.max, reverse=True)[:limit]
+
+    def reset(self) -> None:
+        """清空汇总表 (已缓存的执行计划一并丢弃)"""
+        self._statements.clear()
+        self.since = time.time()
+
+    def report(self, limit: int) -> str:
+        """管理群中显示的汇总表 (HTML)"""
+        since = time.strftime("%m-%d %H:%M", time.localtime(self.since))
+        header = f"🐢 <b>慢查询 Top {limit}</b> (阈值 {self.threshold * 1000:g}ms，自 {since} 起)\n"
+        entries = self.top(limit)
+        if not entries:
+            return header + "\n暂无慢查询。"
+
+        blocks = []
+        for rank, entry in enumerate(entries, 1):
+            plan = " / ".join(entry.plan or []) or "未获取"
+            blocks.append(
+                f"<b>{rank}.</b> 最大 {entry.max * 1000:.1f}ms · 平均 {entry.total / entry.count * 1000:.1f}ms"
+                f" · {entry.count} 次\n"
+                f"<pre>{html.escape(entry.sql[:300])}</pre>\n"
+                f"参数 <code>{html.escape(entry.last_shape[:100])}</code>\n"
+                f"计划 <code>{html.escape(plan[:300])}</code>"
+            )
+        text = header
+        for block in blocks:
+            if len(text) + len(block) + 4 > _MESSAGE_LIMIT:
+                text += "\n…"
+                break
+            text += "\n" + block + "\n"
+        return text
+
+
+slow_queries = SlowQueryLog(SLOW_QUERY_MS, SLOW_QUERY_MAX_STATEMENTS)
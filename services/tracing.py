@@ -0,0 +1,224 @@
+# services/tracing.py
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import random
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, TextIO
+from weakref import WeakKeyDictionary
+
+from config import TRACE_SAMPLE_RATE, TRACE_FILE
+
+logger = logging.getLogger(__name__)
+
+# perf_counter -> 墙上时间 (秒)，跨进程的 trace 也能按时间对齐
+_EPOCH_OFFSET = time.time() - time.perf_counter()
+
+# 攒够这么多条才写文件 (更新结束时也会写)
+_FLUSH_LINES = 256
+
+_NULL = nullcontext()
+
+
+class Trace:
+    """
+    一次被采样的更新：span 编号和 "通道" (asyncio 任务) 编号都在 trace 内分配。
+    update_id 在重启后 (或不同的机器人之间) 可能重复，同一文件中用随机的 trace id 区分
+    """
+
+    __slots__ = ("update_id", "id", "lanes", "next_lane", "next_id", "done")
+
+    def __init__(self, update_id: int):
+        self.update_id = update_id
+        self.id = f"{random.getrandbits(64):016x}"
+        # 按任务对象 (弱引用) 编号：已结束任务的 id() 可能被新任务复用
+        self.lanes: "WeakKeyDictionary[asyncio.Task, int]" = WeakKeyDictionary()
+        self.next_lane = 0
+        self.next_id = 0
+        self.done = False
+
+    def lane(self) -> int:
+        """当前 asyncio 任务在本 trace 中的通道号：处理更新的任务为 0，派生出的任务 (编辑合并、后台任务等) 依次编号"""
+        try:
+            task = asyncio.current_task()
+        except RuntimeError:
+            return 0
+        if task is None:
+            return 0
+        lane = self.lanes.get(task)
+        if lane is None:
+            lane = self.lanes[task] = self.next_lane
+            self.next_lane += 1
+        return lane
+
+
+class Span:
+    """trace 中的一段耗时，结束时输出一行 JSON"""
+
+    __slots__ = ("tracer", "trace", "id", "parent", "name", "cat", "args", "start", "lane", "_token")
+
+    def __init__(self, tracer: "Tracer", trace: Trace, parent: Optional["Span"], name: str, cat: str,
+                 args: Dict[str, Any], start: float):
+        self.tracer = tracer
+        self.trace = trace
+        trace.next_id += 1
+        self.id = trace.next_id
+        self.parent = parent
+        self.name = name
+        self.cat = cat
+        self.args = args
+        self.start = start
+        self.lane = trace.lane()
+        self._token = None
+
+    def __enter__(self) -> "Span":
+        self._token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.emit(self, time.perf_counter() - self.start)
+        if self.parent is None:
+            self.trace.done = True
+        if self.trace.done:
+            self.tracer.flush()
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+class Tracer:
+    """
+    以 update_id 为 trace 的轻量 span 追踪
+
+    - 每个更新在开始处理时按 sample_rate 决定是否采样，未采样的更新只多一次 ContextVar 读取
+    - 当前 span 放在 contextvars 里：同一任务中的数据库语句和 Bot API 调用自动成为子 span；
+      处理器派生的任务 (asyncio.create_task 会复制上下文) 同样归属这次更新，
+      跨出上下文的队列 (发送调度、写队列) 在入队时带上 span，执行时 resume
+    - 每个 span 结束时输出一行 Chrome Trace Event 格式的 JSON ("ph": "X")，
+      pid 为 update_id、tid 为通道号，trace_view.py 可以打印时间线或转换后载入 Perfetto
+    """
+
+    def __init__(self, sample_rate: float, path: str):
+        self.sample_rate = sample_rate
+        self.path = path
+        self._file: Optional[TextIO] = None
+        self._pending: List[str] = []
+        self.sampled = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def start_update(self, update_id: Optional[int], name: str, **args):
+        """开始一次更新的根 span (按采样率决定)；未采样时返回空的上下文管理器"""
+        if update_id is None or self.sample_rate <= 0 or _current.get() is not None:
+            return _NULL
+        if self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return _NULL
+        self.sampled += 1
+        return Span(self, Trace(update_id), None, name, "update", args, time.perf_counter())
+
+    def current(self) -> Optional[Span]:
+        return _current.get()
+
+    def span(self, name: str, cat: str = "app", **args):
+        """当前更新被采样时开始一个子 span，否则返回空的上下文管理器"""
+        parent = _current.get()
+        if parent is None:
+            return _NULL
+        return Span(self, parent.trace, parent, name, cat, args, time.perf_counter())
+
+    def resume(self, span: Optional[Span]):
+        """在另一个任务中继续入队时的 span (发送调度、写队列等)；span 为 None 时在这段代码中停止追踪"""
+        if span is None and _current.get() is None:
+            return _NULL
+        return _Resume(span)
+
+    def record(self, name: str, cat: str, start: float, seconds: float, parent: Optional[Span] = None,
+               **args) -> None:
+        """记录一段已经计时完成的 span (数据库语句、API 调用)；start 为 perf_counter 时间"""
+        parent = parent or _current.get()
+        if parent is None:
+            return
+        self.emit(Span(self, parent.trace, parent, name, cat, args, start), seconds)
+        if parent.trace.done:
+            self.flush()
+
+    def emit(self, span: Span, seconds: float) -> None:
+        args = span.args
+        args["trace"] = span.trace.id
+        args["span"] = span.id
+        if span.parent is not None:
+            args["parent"] = span.parent.id
+        self._pending.append(json.dumps({
+            "name": span.name,
+            "cat": span.cat,
+            "ph": "X",
+            "ts": round((span.start + _EPOCH_OFFSET) * 1e6),
+            "dur": round(seconds * 1e6),
+            "pid": span.trace.update_id,
+            "tid": span.lane,
+            "args": args,
+        }, ensure_ascii=False, default=str))
+        if len(self._pending) >= _FLUSH_LINES:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending:
+            return
+        lines, self._pending = self._pending, []
+        try:
+            if self._file is None:
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+            self._file.write("\n".join(lines) + "\n")
+            self._file.flush()
+        except OSError as e:
+            logger.warning(f"写入 trace 文件 {self.path} 失败: {e}")
+
+    def close(self) -> None:
+        self.flush()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            logger.info(f"🔎 已关闭 trace 文件 {self.path} (本次共采样 {self.sampled} 个更新)")
+
+
+class _Resume:
+    __slots__ = ("span", "_token")
+
+    def __init__(self, span: Optional[Span]):
+        self.span = span
+
+    def __enter__(self) -> Optional[Span]:
+        self._token = _current.set(self.span)
+        return self.span
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        _current.reset(self._token)
+
+
+def traced(name: str, cat: str = "app") -> Callable:
+    """协程函数的装饰器：当前更新被采样时为每次调用记录一个 span"""
+    def decorate(fn: Callable) -> Callable:
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if _current.get() is None:
+                return await fn(*args, **kwargs)
+            with tracer.span(name, cat):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+tracer = Tracer(TRACE_SAMPLE_RATE, TRACE_FILE)
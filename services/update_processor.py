@@ -0,0 +1,127 @@
+# services/update_processor.py
+
+import asyncio
+import logging
+import time
+from typing import Awaitable, Dict, Hashable, Optional
+
+from telegram import Update
+from telegram.constants import ChatType
+from telegram.ext import BaseUpdateProcessor
+
+from services.metrics import metrics
+from services.tracing import tracer
+
+logger = logging.getLogger(__name__)
+
+
+def update_key(update: object) -> Optional[Hashable]:
+    """
+    计算更新的顺序键：同一键的更新严格按到达顺序处理，不同键之间并发
+
+    - 频道帖子上的按钮点击按 (帖子, 点击者) 串行：同一用户连点保持顺序，不同用户并发。
+      计数写入由 ToggleWriter 的队列按到达顺序执行，标题编辑由 EditCoalescer 按帖子合并，
+      因此不需要让整条帖子的点击 (包括 answerCallbackQuery 等 API 调用) 排成一队
+    - 群组里的按钮点击按消息串行 (管理群里即同一条投稿的通过/拒绝，不能同时处理两次)
+    - 其余更新按 (会话, 用户) 串行，与 ConversationHandler 的 per_chat + per_user 键一致，
+      私聊里就是同一用户的所有更新
+    - 没有会话和用户的更新不排序
+    """
+    if not isinstance(update, Update):
+        return None
+
+    query = update.callback_query
+    if query is not None and query.message is not None and query.message.chat.type != ChatType.PRIVATE:
+        if query.message.chat.type == ChatType.CHANNEL:
+            return ("click", query.message.chat.id, query.message.message_id, query.from_user.id)
+        return ("message", query.message.chat.id, query.message.message_id)
+
+    chat = update.effective_chat
+    user = update.effective_user
+    if chat is None and user is None:
+        return None
+    return ("conversation", chat.id if chat else None, user.id if user else None)
+
+
+def update_type(update: object) -> str:
+    """指标中的更新类型标签"""
+    if not isinstance(update, Update):
+        return "other"
+    if update.callback_query is not None:
+        return "callback_query"
+    message = update.effective_message
+    if message is not None and message.text and message.text.startswith("/"):
+        return "command"
+    if update.channel_post is not None:
+        return "channel_post"
+    if message is not None:
+        return "message"
+    return "other"
+
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """
+    并发处理更新，但同一顺序键 (见 update_key) 的更新按到达顺序逐个处理
+
+    先按键排队、轮到时才占用并发名额，因此同一用户的连续点击或同一会话的积压只占一个名额，
+    不会挤占其他更新的处理。
+    """
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self._locks: Dict[Hashable, asyncio.Lock] = {}
+        self._waiting: Dict[Hashable, int] = {}
+        self.max_key_depth = 0
+
+    async def process_update(self, update: object, coroutine: Awaitable) -> None:
+        # 根 span 从进入处理器开始，包括按键排队和等待并发名额的时间
+        update_id = update.update_id if isinstance(update, Update) else None
+        with tracer.start_update(update_id, f"update.{update_type(update)}"):
+            await self._process_in_order(update, coroutine)
+
+    async def _process_in_order(self, update: object, coroutine: Awaitable) -> None:
+        key = update_key(update)
+        if key is None:
+            await super().process_update(update, coroutine)
+            return
+
+        # asyncio.Lock 按等待顺序唤醒，Application 按到达顺序调用本方法，因此同一键保持顺序
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        depth = self._waiting.get(key, 0) + 1
+        self._waiting[key] = depth
+        self.max_key_depth = max(self.max_key_depth, depth)
+        try:
+            async with lock:
+                await super().process_update(update, coroutine)
+        finally:
+            depth = self._waiting[key] - 1
+            if depth:
+                self._waiting[key] = depth
+            else:
+                del self._waiting[key]
+                del self._locks[key]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable) -> None:
+        started = time.perf_counter()
+        try:
+            with tracer.span("process"):
+                await coroutine
+        finally:
+            metrics.observe_update(update_type(update), time.perf_counter() - started)
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "limit": self.max_concurrent_updates,
+            "running": self.current_concurrent_updates,
+            "active_keys": len(self._waiting),
+            "queued": sum(self._waiting.values()),
+            "max_key_depth": self.max_key_depth,
+        }
@@ -0,0 +1,104 @@
+# services/user_directory.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, NamedTuple, Optional, Tuple
+
+from telegram import User
+
+from config import USER_DIRECTORY_FLUSH_INTERVAL, USER_DIRECTORY_MAX_BUFFER
+from storage import storage
+
+logger = logging.getLogger(__name__)
+
+
+class Profile(NamedTuple):
+    username: str
+    full_name: str
+
+
+class UserDirectory:
+    """
+    用户目录 (users 表) 的写缓冲
+
+    每个更新的 from_user 只写入内存缓冲，由后台任务定期批量 UPSERT 到数据库；
+    缓冲超过上限时提前触发一次刷新。
+    """
+
+    def __init__(self, flush_interval: float, max_buffer: int):
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer: Dict[int, Tuple[str, str, str]] = {}
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._closing = False
+
+    def record(self, user: User) -> None:
+        """登记一次出现 (只写内存，O(1))"""
+        last_seen = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime())
+        self._buffer[user.id] = (user.username or "", user.full_name or "", last_seen)
+        if len(self._buffer) >= self.max_buffer:
+            self._flush_requested.set()
+
+    async def lookup(self, user_id: int) -> Optional[Profile]:
+        """先查缓冲，再查 users 表"""
+        buffered = self._buffer.get(user_id)
+        if buffered:
+            return Profile(buffered[0], buffered[1])
+
+        row = await storage.get_user(user_id)
+        return Profile(row.username, row.full_name) if row else None
+
+    async def flush(self) -> int:
+        """把缓冲一次性写入数据库，返回写入的行数"""
+        if not self._buffer:
+            return 0
+
+        batch, self._buffer = self._buffer, {}
+        try:
+            await storage.upsert_users([(user_id, *values) for user_id, values in batch.items()])
+        except asyncio.CancelledError:
+            # 被取消时同样放回缓冲，由下一次刷新写入
+            self._restore(batch)
+            raise
+        except Exception as e:
+            logger.warning(f"写入用户目录失败: {e}")
+            self._restore(batch)
+            return 0
+        return len(batch)
+
+    def _restore(self, batch: Dict[int, Tuple[str, str, str]]) -> None:
+        """把没写入的批次放回缓冲 (不覆盖期间产生的更新记录)"""
+        for user_id, values in batch.items():
+            self._buffer.setdefault(user_id, values)
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        通知后台任务退出并等待它结束 (不取消：进行中的刷新会写完)，再写入剩余的缓冲
+        """
+        if self._task is not None:
+            self._closing = True
+            self._flush_requested.set()
+            try:
+                await self._task
+            finally:
+                self._task = None
+                self._closing = False
+        await self.flush()
+
+
+user_directory = UserDirectory(USER_DIRECTORY_FLUSH_INTERVAL, USER_DIRECTORY_MAX_BUFFER)
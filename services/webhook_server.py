@@ -0,0 +1,166 @@
+# services/webhook_server.py
+
+import asyncio
+import hmac
+import json
+import logging
+import signal
+from typing import Optional
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+from config import (
+    WEBHOOK_URL,
+    WEBHOOK_PATH,
+    WEBHOOK_LISTEN,
+    WEBHOOK_PORT,
+    WEBHOOK_SECRET,
+    WEBHOOK_MAX_CONNECTIONS,
+    HEALTH_PATH,
+)
+from services.background import background_tasks
+from services.comment_preview import comment_previews
+from services.outbound import outbound
+from services.persistence import SqlitePersistence
+from services.post_cache import post_cache
+from services.update_processor import KeyedUpdateProcessor
+from services.write_queue import toggle_writer
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """
+    进程内的 aiohttp 服务器：接收 Telegram 推送的更新并放入 application.update_queue
+
+    - POST {path}: 校验 secret token 后解析 Update，入队即返回 200
+    - GET {health_path}: 应用已启动且未在关闭时返回 200，否则 503
+    本地测试时可以直接把录制的 Update JSON POST 到 {path} (带上 secret 头)。
+    """
+
+    def __init__(self, application: Application, listen: str, port: int, path: str,
+                 secret: str, health_path: str):
+        self.application = application
+        self.listen = listen
+        self.port = port
+        self.path = path
+        self.secret = secret
+        self.health_path = health_path
+        self.ready = False
+        self.updates_received = 0
+        self.updates_rejected = 0
+        self._runner: Optional[web.AppRunner] = None
+
+    async def handle_update(self, request: web.Request) -> web.Response:
+        token = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(token.encode(), self.secret.encode()):
+            self.updates_rejected += 1
+            logger.warning(f"⚠️ 拒绝了一个 secret token 不匹配的 webhook 请求 (来自 {request.remote})")
+            return web.Response(status=403)
+
+        try:
+            data = await request.json()
+            update = Update.de_json(data, self.application.bot)
+        except (json.JSONDecodeError, TypeError, KeyError, ValueError) as e:
+            self.updates_rejected += 1
+            logger.warning(f"⚠️ 无法解析 webhook 更新: {e}")
+            return web.Response(status=400)
+
+        if update is None:
+            self.updates_rejected += 1
+            return web.Response(status=400)
+
+        self.updates_received += 1
+        await self.application.update_queue.put(update)
+        return web.Response(status=200)
+
+    async def handle_health(self, request: web.Request) -> web.Response:
+        ready = self.ready and self.application.running
+        processor = self.application.update_processor
+        persistence = self.application.persistence
+        return web.json_response(
+            {
+                "status": "ready" if ready else "unavailable",
+                "update_queue": self.application.update_queue.qsize(),
+                "update_processor": processor.stats() if isinstance(processor, KeyedUpdateProcessor) else None,
+                "toggle_queue": toggle_writer.queue_depth(),
+                "outbound": outbound.stats(),
+                "background": background_tasks.stats(),
+                "post_cache": post_cache.stats(),
+                "comment_previews": comment_previews.stats(),
+                "persistence": persistence.stats() if isinstance(persistence, SqlitePersistence) else None,
+                "updates_received": self.updates_received,
+                "updates_rejected": self.updates_rejected,
+            },
+            status=200 if ready else 503,
+        )
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_post(self.path, self.handle_update)
+        app.router.add_get(self.health_path, self.handle_health)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.listen, self.port).start()
+        logger.info(f"🌐 Webhook 服务器已监听 http://{self.listen}:{self.port}{self.path} (健康检查 {self.health_path})")
+
+    async def stop(self) -> None:
+        self.ready = False
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def run_webhook(application: Application) -> None:
+    """
+    以 webhook 模式运行机器人，直到收到 SIGINT/SIGTERM
+
+    生命周期与 run_polling 一致: initialize -> post_init -> start -> ... -> stop
+    -> post_stop -> shutdown -> post_shutdown。退出时不删除 webhook，
+    重启期间的更新由 Telegram 暂存，启动后继续推送。
+    """
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop_event.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    server = WebhookServer(application, WEBHOOK_LISTEN, WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, HEALTH_PATH)
+
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        await server.start()
+
+        if WEBHOOK_URL:
+            await application.bot.set_webhook(
+                url=WEBHOOK_URL.rstrip("/") + WEBHOOK_PATH,
+                secret_token=WEBHOOK_SECRET,
+                max_connections=WEBHOOK_MAX_CONNECTIONS,
+                drop_pending_updates=False,
+            )
+            logger.info(f"🔗 已设置 webhook: {WEBHOOK_URL.rstrip('/')}{WEBHOOK_PATH} (max_connections={WEBHOOK_MAX_CONNECTIONS})")
+        else:
+            logger.info("🔗 未设置 WEBHOOK_URL，不调用 setWebhook (本地测试模式)")
+
+        server.ready = True
+        await stop_event.wait()
+        logger.info("🛑 收到退出信号，正在关闭...")
+    finally:
+        # 先停止接收新的更新，再等待队列中已接收的更新处理完
+        await server.stop()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -0,0 +1,138 @@
+# services/write_queue.py
+
+import asyncio
+import logging
+import time
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from config import WRITE_BATCH_INTERVAL, WRITE_BATCH_MAX
+from services.post_cache import post_cache
+from services.tracing import Span, tracer
+from storage import ToggleIntent
+
+logger = logging.getLogger(__name__)
+
+
+class ToggleResult(NamedTuple):
+    counts: Dict[str, int]            # 该帖子在本批次提交后的计数
+    notification_type: Optional[str]  # 'like' / 'collect' / None
+    should_check_pin: bool
+
+
+class ToggleWriter:
+    """
+    点赞/踩/收藏切换的单写者队列 (group commit)
+
+    处理器把切换意图放入队列并等待 Future；后台唯一的写任务每攒够
+    max_batch 个或等待 batch_interval 秒后，在一个事务内批量执行并提交，
+    提交成功后再逐个返回切换后的状态。切换经由 post_cache：热点帖子在内存中决定结果，只写不读。
+    """
+
+    def __init__(self, batch_interval: float, max_batch: int):
+        self.batch_interval = batch_interval
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._closed = False
+        # 被采样的更新提交的意图：Future -> 提交时的 span，写任务据此把批次记入这些更新的 trace
+        self._traced: Dict[asyncio.Future, Span] = {}
+        self.batches = 0
+        self.ops = 0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._closed = False
+            self._task = asyncio.create_task(self._run())
+
+    def queue_depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def submit(self, intent: ToggleIntent) -> ToggleResult:
+        if self._closed or self._queue is None:
+            raise RuntimeError("写队列未启动或已关闭")
+        future = asyncio.get_running_loop().create_future()
+        with tracer.span("toggle_writer.submit", "write", action=intent.action) as span:
+            if span is not None:
+                self._traced[future] = span
+            self._queue.put_nowait((intent, future))
+            return await future
+
+    async def _collect_batch(self) -> List[Tuple[ToggleIntent, asyncio.Future]]:
+        batch = [await self._queue.get()]
+        deadline = time.monotonic() + self.batch_interval
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # 把队列里已经到达的意图也带上，不再额外等待
+        while len(batch) < self.max_batch and not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        return batch
+
+    def _take_traced(self, batch: List[Tuple[ToggleIntent, asyncio.Future]]) -> List[Span]:
+        if not self._traced:
+            return []
+        return [span for span in (self._traced.pop(future, None) for _, future in batch) if span is not None]
+
+    async def _apply_batch(self, batch: List[Tuple[ToggleIntent, asyncio.Future]]) -> None:
+        # 批次的语句记入第一个被采样的提交者的 trace，其余被采样的提交者只记一个批次 span
+        traced = self._take_traced(batch)
+        started = time.perf_counter()
+        try:
+            with tracer.resume(traced[0] if traced else None), \
+                    tracer.span("toggle_writer.batch", "write", size=len(batch)):
+                outcomes, counts = await post_cache.apply_toggles([intent for intent, _ in batch])
+        except Exception as e:
+            # 整批失败时逐个重试，避免一条坏数据拖垮整批
+            logger.warning(f"批量写入 {len(batch)} 条切换失败，改为逐条写入: {e}")
+            for item in batch:
+                await self._apply_single(*item)
+            return
+
+        for span in traced[1:]:
+            tracer.record("toggle_writer.batch", "write", started, time.perf_counter() - started,
+                          parent=span, size=len(batch), shared=True)
+        for (intent, future), (notification_type, should_check_pin) in zip(batch, outcomes):
+            if not future.done():
+                future.set_result(ToggleResult(counts[intent.message_id], notification_type, should_check_pin))
+
+    async def _apply_single(self, intent: ToggleIntent, future: asyncio.Future) -> None:
+        try:
+            outcomes, counts = await post_cache.apply_toggles([intent])
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        notification_type, should_check_pin = outcomes[0]
+        if not future.done():
+            future.set_result(ToggleResult(counts[intent.message_id], notification_type, should_check_pin))
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect_batch()
+            # 关闭哨兵 (None) 一定是队列中的最后一项
+            stopping = any(intent is None for intent, _ in batch)
+            batch = [item for item in batch if item[0] is not None]
+            if batch:
+                await self._apply_batch(batch)
+                self.batches += 1
+                self.ops += len(batch)
+            if stopping:
+                return
+
+    async def stop(self) -> None:
+        """停止接收新意图，写完队列中剩余的全部意图后退出"""
+        if self._task is None:
+            return
+        self._closed = True
+        self._queue.put_nowait((None, None))
+        await self._task
+        self._task = None
+
+
+toggle_writer = ToggleWriter(WRITE_BATCH_INTERVAL, WRITE_BATCH_MAX)
@@ -0,0 +1,32 @@
+# storage/__init__.py
+
+from config import DB_BACKEND, DB_NAME, DB_READER_COUNT, DATABASE_URL, PG_POOL_MIN, PG_POOL_MAX
+from storage.base import (
+    CommentForDelete,
+    CommentRow,
+    OutboxRow,
+    PageRow,
+    PostCacheStorage,
+    PostState,
+    Storage,
+    Submission,
+    ToggleIntent,
+    ToggleOutcome,
+    UserRow,
+    decide_toggle,
+)
+
+
+def create_storage(backend: str = DB_BACKEND) -> Storage:
+    """按配置创建存储实现 (sqlite / postgres)"""
+    if backend == "sqlite":
+        from storage.sqlite import SqliteStorage
+        return SqliteStorage(DB_NAME, DB_READER_COUNT)
+    if backend == "postgres":
+        # asyncpg 只在使用 PostgreSQL 时才需要安装
+        from storage.postgres import PostgresStorage
+        return PostgresStorage(DATABASE_URL, PG_POOL_MIN, PG_POOL_MAX)
+    raise RuntimeError(f"错误: 未知的 DB_BACKEND '{backend}'，可选 sqlite / postgres。")
+
+
+storage = create_storage()
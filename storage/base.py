@@ -0,0 +1,262 @@
+# storage/base.py
+
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+
+class Submission(NamedTuple):
+    user_id: int
+    user_name: str
+    content_text: str
+
+
+class PageRow(NamedTuple):
+    content_text: str
+    channel_message_id: int
+    cursor_ts: int   # 游标时间戳 (Unix 秒)
+    cursor_id: int   # 游标行 ID
+
+
+class CommentRow(NamedTuple):
+    id: int
+    user_id: int
+    user_name: str
+    comment_text: str
+
+
+class CommentForDelete(NamedTuple):
+    user_id: int
+    comment_text: str
+    user_name: str
+    post_author_id: int
+    channel_message_id: int
+
+
+class UserRow(NamedTuple):
+    username: str
+    full_name: str
+
+
+class ToggleIntent(NamedTuple):
+    action: str          # 'react' 或 'collect'
+    message_id: int
+    user_id: int
+    reaction_value: int = 0  # react: 1 赞 / -1 踩；collect 时忽略
+    actor_name: str = ""     # 写入通知发件箱时使用的显示名
+
+
+class ToggleOutcome(NamedTuple):
+    notification_type: Optional[str]  # 'like' / 'collect' / None
+    should_check_pin: bool
+
+
+class PostState(NamedTuple):
+    """一个帖子的完整互动状态，用于装载内存中的热点帖子缓存"""
+    submission: Optional[Submission]  # 帖子已不在 submissions 中时为 None
+    stats: Dict[str, int]
+    pinned: bool
+    likers: List[int]
+    dislikers: List[int]
+    collectors: List[int]
+
+
+def decide_toggle(intent: ToggleIntent, previous: int) -> Tuple[int, Dict[str, int], ToggleOutcome]:
+    """
+    根据切换前的状态决定一次切换的结果 (不访问数据库)
+
+    previous: 点赞/踩时为已有的 reaction_type (没有为 0)，收藏时为 1 (已收藏) / 0
+    返回 (切换后的状态, 计数增量, 结果)
+    """
+    if intent.action == 'react':
+        value = intent.reaction_value
+        key = "likes" if value == 1 else "dislikes"
+        if previous == 0:
+            # 新增点赞/踩
+            new_value, deltas = value, {key: 1}
+        elif previous == value:
+            # 取消点赞/踩 - 不发通知
+            new_value, deltas = 0, {key: -1}
+        else:
+            # 从踩切换到赞，或从赞切换到踩
+            new_value, deltas = value, {"likes": value, "dislikes": -value}
+        if new_value == 1:
+            return (new_value, deltas, ToggleOutcome("like", True))
+        return (new_value, deltas, ToggleOutcome(None, False))
+
+    if intent.action == 'collect':
+        if previous:
+            return (0, {"collections": -1}, ToggleOutcome(None, False))
+        return (1, {"collections": 1}, ToggleOutcome("collect", False))
+
+    return (previous, {}, ToggleOutcome(None, False))
+
+
+class OutboxRow(NamedTuple):
+    id: int
+    channel_message_id: int
+    actor_id: int
+    notification_type: str   # 'like' / 'collect' / 'comment'
+    recipient_id: int        # 帖子作者
+    payload: Dict[str, Any]  # actor_name，评论还有 comment_text
+    attempts: int
+    lease_until: int         # 认领租约到期时间 (Unix 秒)，完成/失败时用来确认仍持有该行
+
+
+class Storage(ABC):
+    """
+    存储层接口：所有处理器和后台任务只通过它访问数据库
+
+    每个方法自成一个事务；需要原子性的组合操作 (如切换 + 计数) 由实现类
+    在同一事务内完成。
+    """
+
+    name = "base"
+
+    # --- 生命周期 ---
+
+    @abstractmethod
+    async def open(self) -> None: ...
+
+    @abstractmethod
+    async def close(self) -> None: ...
+
+    @abstractmethod
+    async def migrate(self) -> int:
+        """执行未应用的迁移，返回 schema 版本"""
+
+    async def check_query_plans(self) -> List[str]:
+        """检查热点查询的执行计划，返回有问题的查询 (默认不检查)"""
+        return []
+
+    # --- 投稿 ---
+
+    @abstractmethod
+    async def get_submission(self, message_id: int) -> Optional[Submission]: ...
+
+    @abstractmethod
+    async def add_submission(self, user_id: int, user_name: str, message_id: int, content_text: str) -> None:
+        """保存投稿并初始化该帖子的计数"""
+
+    @abstractmethod
+    async def count_user_submissions(self, user_id: int) -> int: ...
+
+    @abstractmethod
+    async def page_user_submissions(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]:
+        """
+        游标分页：newer=False 时返回比游标更旧的记录 (按时间倒序)，
+        newer=True 时返回比游标更新的记录 (按时间正序)
+        """
+
+    # --- 收藏 ---
+
+    @abstractmethod
+    async def count_user_collections(self, user_id: int) -> int: ...
+
+    @abstractmethod
+    async def page_user_collections(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]: ...
+
+    # --- 点赞/踩/收藏切换与计数 ---
+
+    @abstractmethod
+    async def apply_toggles(self, intents: Sequence[ToggleIntent]) -> Tuple[List[ToggleOutcome], Dict[int, Dict[str, int]]]:
+        """
+        在一个事务内依次执行所有切换，返回 (每个意图的结果, 涉及帖子提交后的计数)；
+        需要通知作者的切换在同一事务内写入通知发件箱
+        """
+
+    @abstractmethod
+    async def get_post_stats(self, message_id: int) -> Dict[str, int]: ...
+
+    @abstractmethod
+    async def reconcile_post_stats(self) -> int:
+        """从原始表重建 post_stats，返回存在偏差的帖子数"""
+
+    # --- 评论 ---
+
+    @abstractmethod
+    async def add_comment(self, message_id: int, user_id: int, user_name: str, comment_text: str) -> None:
+        """保存评论，并在同一事务内给作者写入一条待发送的评论通知"""
+
+    @abstractmethod
+    async def get_comment_preview(self, message_id: int, limit: int) -> List[CommentRow]:
+        """按时间正序返回最早的 limit 条评论"""
+
+    @abstractmethod
+    async def count_comments(self, message_id: int) -> int: ...
+
+    @abstractmethod
+    async def list_user_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        """某用户在帖子下的评论 (按时间倒序)"""
+
+    @abstractmethod
+    async def list_other_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        """帖子下除某用户外的所有评论 (按时间倒序)"""
+
+    @abstractmethod
+    async def get_comment_for_delete(self, comment_id: int) -> Optional[CommentForDelete]: ...
+
+    @abstractmethod
+    async def delete_comment(self, comment_id: int) -> bool:
+        """删除评论并更新计数，返回是否真的删除了"""
+
+    # --- 通知发件箱 ---
+    # 通知按 (帖子, 触发用户, 类型) 去重：赞和收藏每人每帖只通知一次，
+    # 新评论会把同一用户的评论通知重新置为待发送 (内容取最新一条)。
+
+    @abstractmethod
+    async def claim_notifications(self, now: int, lease_until: int, limit: int) -> List[OutboxRow]:
+        """认领最多 limit 条到期的待发送通知，租约到 lease_until 为止 (到期未完成会被重新认领)"""
+
+    @abstractmethod
+    async def complete_notification(self, notification_id: int, lease_until: int, now: int) -> bool:
+        """标记为已送达；租约已失效 (如评论通知被重新置为待发送) 时返回 False"""
+
+    @abstractmethod
+    async def fail_notification(self, notification_id: int, lease_until: int, error: str,
+                                retry_at: Optional[int]) -> None:
+        """记录一次发送失败：retry_at 为下次重试时间，None 表示放弃"""
+
+    # --- 置顶 ---
+
+    @abstractmethod
+    async def is_pinned(self, message_id: int) -> bool: ...
+
+    @abstractmethod
+    async def record_pin(self, message_id: int, like_count: int) -> bool:
+        """记录置顶，已记录过时返回 False"""
+
+    # --- 用户目录 ---
+
+    @abstractmethod
+    async def upsert_users(self, rows: Iterable[Tuple[int, str, str, str]]) -> None:
+        """批量写入 (id, username, full_name, last_seen)"""
+
+    @abstractmethod
+    async def get_user(self, user_id: int) -> Optional[UserRow]: ...
+
+
+class PostCacheStorage(ABC):
+    """
+    内存热点帖子缓存 (services.post_cache) 需要的额外接口
+
+    缓存在内存中决定切换结果，要求本进程是数据库唯一的写入者，
+    因此只有单进程的后端 (SQLite) 实现它；缓存用 isinstance 判断是否启用。
+    其他只靠本进程失效的缓存 (如 services.comment_preview) 也用它判断是否启用。
+    """
+
+    @abstractmethod
+    async def recent_post_ids(self, limit: int) -> List[int]:
+        """最新的 limit 个帖子 (用于启动时预热缓存)"""
+
+    @abstractmethod
+    async def load_post_states(self, message_ids: Sequence[int]) -> Dict[int, PostState]:
+        """读取帖子的完整互动状态 (元数据、计数、置顶、赞/踩/收藏的用户)"""
+
+    @abstractmethod
+    async def write_toggles(self, decided: Sequence[Tuple[ToggleIntent, int]]) -> None:
+        """
+        在一个事务内写入已由调用方决定好的切换 (意图, 切换前状态)，不再读取已有行；
+        计数增量与通知同 Storage.apply_toggles
+        """
@@ -0,0 +1,552 @@
+# storage/postgres.py
+
+import json
+import logging
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import asyncpg
+
+from services.metrics import metrics, normalize_sql
+from services.slow_queries import slow_queries
+from services.tracing import tracer
+from storage.base import (
+    CommentForDelete,
+    CommentRow,
+    OutboxRow,
+    PageRow,
+    Storage,
+    Submission,
+    ToggleIntent,
+    ToggleOutcome,
+    UserRow,
+    decide_toggle,
+)
+
+logger = logging.getLogger(__name__)
+
+# 迁移时使用的 advisory lock，保证多个机器人进程同时启动时只有一个在执行迁移
+_MIGRATION_LOCK_ID = 7310054
+
+# 切换操作按帖子加锁时使用的 advisory lock 命名空间
+_TOGGLE_LOCK_SPACE = 7310055
+
+# --- 迁移列表 (与 migrations.py 的 SQLite 版本一一对应，只能追加) ---
+# Telegram 的 ID 可能超过 32 位，所有 ID 列都使用 BIGINT；
+# 时间戳精确到秒 (TIMESTAMP(0))、使用 UTC，与 SQLite 的 CURRENT_TIMESTAMP 一致。
+PG_MIGRATIONS: List[Tuple[int, str, Tuple[str, ...]]] = [
+    (1, "V10.4 基础表结构", (
+        '''
+        CREATE TABLE IF NOT EXISTS submissions (
+            id BIGSERIAL PRIMARY KEY,
+            user_id BIGINT NOT NULL,
+            user_name TEXT,
+            channel_message_id BIGINT NOT NULL UNIQUE,
+            content_text TEXT,
+            timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS reactions (
+            id BIGSERIAL PRIMARY KEY,
+            channel_message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            reaction_type SMALLINT NOT NULL,
+            timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            UNIQUE (channel_message_id, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS collections (
+            id BIGSERIAL PRIMARY KEY,
+            channel_message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            UNIQUE (channel_message_id, user_id)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS comments (
+            id BIGSERIAL PRIMARY KEY,
+            channel_message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            user_name TEXT NOT NULL,
+            comment_text TEXT NOT NULL,
+            timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id BIGSERIAL PRIMARY KEY,
+            channel_message_id BIGINT NOT NULL,
+            user_id BIGINT NOT NULL,
+            notification_type TEXT NOT NULL,
+            timestamp TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            UNIQUE (channel_message_id, user_id, notification_type)
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS pinned_posts (
+            id BIGSERIAL PRIMARY KEY,
+            channel_message_id BIGINT NOT NULL UNIQUE,
+            pinned_at TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc'),
+            like_count_at_pin INTEGER
+        )
+        ''',
+    )),
+    (2, "热点查询的复合索引", (
+        "CREATE INDEX IF NOT EXISTS idx_submissions_user_ts ON submissions (user_id, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_post_ts ON comments (channel_message_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_comments_post_user_ts ON comments (channel_message_id, user_id, timestamp)",
+        "CREATE INDEX IF NOT EXISTS idx_reactions_post_type ON reactions (channel_message_id, reaction_type)",
+    )),
+    (3, "每个帖子的计数表 post_stats", (
+        '''
+        CREATE TABLE IF NOT EXISTS post_stats (
+            channel_message_id BIGINT PRIMARY KEY,
+            likes INTEGER NOT NULL DEFAULT 0,
+            dislikes INTEGER NOT NULL DEFAULT 0,
+            collections INTEGER NOT NULL DEFAULT 0,
+            comments INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+    )),
+    (4, "用户目录表 users", (
+        '''
+        CREATE TABLE IF NOT EXISTS users (
+            id BIGINT PRIMARY KEY,
+            username TEXT,
+            full_name TEXT,
+            last_seen TIMESTAMP(0) NOT NULL DEFAULT (now() AT TIME ZONE 'utc')
+        )
+        ''',
+    )),
+    (5, "收藏列表按 (timestamp, id) 游标分页的覆盖索引", (
+        "CREATE INDEX IF NOT EXISTS idx_collections_user_ts_id ON collections (user_id, timestamp, id) INCLUDE (channel_message_id)",
+    )),
+    (6, "notifications 表改为通知发件箱", (
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS recipient_id BIGINT",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS payload TEXT",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS status TEXT NOT NULL DEFAULT 'pending'",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS attempts INTEGER NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS next_attempt_at BIGINT NOT NULL DEFAULT 0",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS last_error TEXT",
+        "ALTER TABLE notifications ADD COLUMN IF NOT EXISTS delivered_at BIGINT",
+        "UPDATE notifications SET status = 'delivered'",
+        "CREATE INDEX IF NOT EXISTS idx_notifications_due ON notifications (next_attempt_at) WHERE status = 'pending'",
+    )),
+]
+
+# 从原始表重新聚合每个帖子的计数
+_FRESH_COUNTS_SQL = '''
+    SELECT ids.channel_message_id,
+           COALESCE(r.likes, 0), COALESCE(r.dislikes, 0),
+           COALESCE(c.n, 0), COALESCE(m.n, 0)
+    FROM (
+        SELECT channel_message_id FROM submissions
+        UNION SELECT channel_message_id FROM reactions
+        UNION SELECT channel_message_id FROM collections
+        UNION SELECT channel_message_id FROM comments
+    ) ids
+    LEFT JOIN (
+        SELECT channel_message_id,
+               COUNT(*) FILTER (WHERE reaction_type = 1) AS likes,
+               COUNT(*) FILTER (WHERE reaction_type = -1) AS dislikes
+        FROM reactions GROUP BY channel_message_id
+    ) r ON r.channel_message_id = ids.channel_message_id
+    LEFT JOIN (
+        SELECT channel_message_id, COUNT(*) AS n FROM collections GROUP BY channel_message_id
+    ) c ON c.channel_message_id = ids.channel_message_id
+    LEFT JOIN (
+        SELECT channel_message_id, COUNT(*) AS n FROM comments GROUP BY channel_message_id
+    ) m ON m.channel_message_id = ids.channel_message_id
+'''
+
+SQL_BUMP_POST_STATS = '''
+    INSERT INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+    VALUES ($1, $2, $3, $4, $5)
+    ON CONFLICT (channel_message_id) DO UPDATE SET
+        likes = post_stats.likes + EXCLUDED.likes,
+        dislikes = post_stats.dislikes + EXCLUDED.dislikes,
+        collections = post_stats.collections + EXCLUDED.collections,
+        comments = post_stats.comments + EXCLUDED.comments
+'''
+SQL_GET_POST_STATS = "SELECT likes, dislikes, collections, comments FROM post_stats WHERE channel_message_id = $1"
+SQL_PAGE_USER_SUBMISSIONS = '''
+    SELECT content_text, channel_message_id, EXTRACT(EPOCH FROM timestamp)::BIGINT, id
+    FROM submissions
+    WHERE user_id = $1 AND (timestamp, id) {cmp} (to_timestamp($2) AT TIME ZONE 'utc', $3)
+    ORDER BY timestamp {order}, id {order} LIMIT $4
+'''
+SQL_PAGE_USER_COLLECTIONS = '''
+    SELECT s.content_text, s.channel_message_id, EXTRACT(EPOCH FROM c.timestamp)::BIGINT, c.id
+    FROM collections c JOIN submissions s ON c.channel_message_id = s.channel_message_id
+    WHERE c.user_id = $1 AND (c.timestamp, c.id) {cmp} (to_timestamp($2) AT TIME ZONE 'utc', $3)
+    ORDER BY c.timestamp {order}, c.id {order} LIMIT $4
+'''
+
+
+SQL_ENQUEUE_NOTIFICATION = '''
+    INSERT INTO notifications (channel_message_id, user_id, notification_type, recipient_id, payload, status, attempts, next_attempt_at)
+    SELECT $1::BIGINT, $2::BIGINT, $3::TEXT, user_id, $4::TEXT, 'pending', 0, $5::BIGINT
+    FROM submissions WHERE channel_message_id = $1 AND user_id != $2
+    ON CONFLICT (channel_message_id, user_id, notification_type) DO UPDATE SET
+        payload = EXCLUDED.payload,
+        status = 'pending',
+        attempts = 0,
+        next_attempt_at = EXCLUDED.next_attempt_at,
+        last_error = NULL,
+        delivered_at = NULL
+    WHERE notifications.notification_type = 'comment'
+'''
+# 多个进程同时投递时用 SKIP LOCKED 各自认领不同的行
+SQL_CLAIM_NOTIFICATIONS = '''
+    UPDATE notifications SET next_attempt_at = $3
+    WHERE id IN (
+        SELECT id FROM notifications
+        WHERE status = 'pending' AND next_attempt_at <= $1
+        ORDER BY next_attempt_at LIMIT $2
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING id, channel_message_id, user_id, notification_type, recipient_id, payload, attempts
+'''
+
+
+async def _enqueue_notification(conn, message_id: int, actor_id: int, notification_type: str, payload: dict) -> None:
+    await conn.execute(
+        SQL_ENQUEUE_NOTIFICATION,
+        message_id, actor_id, notification_type, json.dumps(payload, ensure_ascii=False), int(time.time())
+    )
+
+
+async def _bump_post_stats(conn, message_id: int, likes: int = 0, dislikes: int = 0,
+                           collections: int = 0, comments: int = 0) -> None:
+    await conn.execute(SQL_BUMP_POST_STATS, message_id, likes, dislikes, collections, comments)
+
+
+def _stats_dict(row) -> Dict[str, int]:
+    row = row or (0, 0, 0, 0)
+    return {"likes": row[0], "dislikes": row[1], "collections": row[2], "comments": row[3]}
+
+
+async def _apply_toggle(conn, intent: ToggleIntent) -> ToggleOutcome:
+    """执行一次切换，需要通知作者时在同一事务内写入通知发件箱"""
+    outcome = await _toggle(conn, intent)
+    if outcome.notification_type:
+        await _enqueue_notification(conn, intent.message_id, intent.user_id, outcome.notification_type,
+                                    {"actor_name": intent.actor_name})
+    return outcome
+
+
+async def _toggle(conn, intent: ToggleIntent) -> ToggleOutcome:
+    """
+    在事务内执行一次切换 (调用方已持有该帖子的 advisory lock)。
+    先尝试插入 (ON CONFLICT DO NOTHING)，插入失败再锁定已有行读出切换前的状态；
+    切换规则由 decide_toggle 决定，与 SQLite 一致。
+    """
+    message_id, user_id = intent.message_id, intent.user_id
+    previous = 0
+
+    if intent.action == 'react':
+        inserted = await conn.fetchval(
+            "INSERT INTO reactions (channel_message_id, user_id, reaction_type) VALUES ($1, $2, $3) "
+            "ON CONFLICT (channel_message_id, user_id) DO NOTHING RETURNING id",
+            message_id, user_id, intent.reaction_value
+        )
+        if inserted is None:
+            previous = await conn.fetchval(
+                "SELECT reaction_type FROM reactions WHERE channel_message_id = $1 AND user_id = $2 FOR UPDATE",
+                message_id, user_id
+            )
+    elif intent.action == 'collect':
+        inserted = await conn.fetchval(
+            "INSERT INTO collections (channel_message_id, user_id) VALUES ($1, $2) "
+            "ON CONFLICT (channel_message_id, user_id) DO NOTHING RETURNING id",
+            message_id, user_id
+        )
+        if inserted is None:
+            previous = 1
+
+    new_value, deltas, outcome = decide_toggle(intent, previous)
+
+    if previous and intent.action == 'react':
+        if new_value == 0:
+            await conn.execute("DELETE FROM reactions WHERE channel_message_id = $1 AND user_id = $2", message_id, user_id)
+        else:
+            await conn.execute(
+                "UPDATE reactions SET reaction_type = $1 WHERE channel_message_id = $2 AND user_id = $3",
+                new_value, message_id, user_id
+            )
+    elif previous and intent.action == 'collect':
+        await conn.execute("DELETE FROM collections WHERE channel_message_id = $1 AND user_id = $2", message_id, user_id)
+
+    if deltas:
+        await _bump_post_stats(conn, message_id, **deltas)
+    return outcome
+
+
+class PostgresStorage(Storage):
+    """基于 asyncpg 连接池的存储实现，支持多个机器人进程共享一个数据库"""
+
+    name = "postgres"
+
+    def __init__(self, dsn: str, min_size: int, max_size: int):
+        self.dsn = dsn
+        self.min_size = min_size
+        self.max_size = max_size
+        self.pool: Optional[asyncpg.Pool] = None
+
+    async def open(self) -> None:
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.dsn, min_size=self.min_size, max_size=self.max_size,
+                                                  init=self._init_connection)
+            logger.info(f"🗄️ PostgreSQL 连接池已打开: {self.min_size}-{self.max_size} 个连接")
+
+    async def _init_connection(self, conn) -> None:
+        conn.add_query_logger(self._record_query)
+
+    def _record_query(self, record) -> None:
+        """asyncpg 的 query logger：把每条语句的耗时记入指标，慢语句交给 slow_queries (EXPLAIN 自身除外)"""
+        metrics.observe_sql(record.query, record.elapsed)
+        if tracer.current() is not None:
+            # 回调在语句完成后调用，开始时间由耗时倒推
+            tracer.record(normalize_sql(record.query), "sql", time.perf_counter() - record.elapsed, record.elapsed)
+        if slow_queries.is_slow(record.elapsed) and not record.query.lstrip().upper().startswith("EXPLAIN"):
+            slow_queries.record_soon(record.query, record.args, record.elapsed,
+                                     lambda: self._explain(record.query, record.args))
+
+    async def _explain(self, query: str, args) -> List[str]:
+        rows = await self.pool.fetch(f"EXPLAIN {query}", *(args or ()))
+        return [row[0] for row in rows]
+
+    async def close(self) -> None:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+            logger.info("🗄️ PostgreSQL 连接池已关闭。")
+
+    async def migrate(self) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", _MIGRATION_LOCK_ID)
+                await conn.execute("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+                current = await conn.fetchval("SELECT MAX(version) FROM schema_version") or 0
+
+                for version, description, statements in PG_MIGRATIONS:
+                    if version <= current:
+                        continue
+                    for statement in statements:
+                        await conn.execute(statement)
+                    await conn.execute("INSERT INTO schema_version (version) VALUES ($1)", version)
+                    current = version
+                    logger.info(f"🧱 已应用 PostgreSQL 迁移 v{version}: {description}")
+        return current
+
+    # --- 投稿 ---
+
+    async def get_submission(self, message_id: int) -> Optional[Submission]:
+        row = await self.pool.fetchrow(
+            "SELECT user_id, user_name, content_text FROM submissions WHERE channel_message_id = $1", message_id
+        )
+        return Submission(*row) if row else None
+
+    async def add_submission(self, user_id: int, user_name: str, message_id: int, content_text: str) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO submissions (user_id, user_name, channel_message_id, content_text) VALUES ($1, $2, $3, $4)",
+                    user_id, user_name, message_id, content_text
+                )
+                await conn.execute(
+                    "INSERT INTO post_stats (channel_message_id) VALUES ($1) ON CONFLICT DO NOTHING", message_id
+                )
+
+    async def count_user_submissions(self, user_id: int) -> int:
+        return await self.pool.fetchval("SELECT COUNT(*) FROM submissions WHERE user_id = $1", user_id)
+
+    async def _page(self, sql: str, user_id: int, cursor_ts: int, cursor_id: int,
+                    limit: int, newer: bool) -> List[PageRow]:
+        sql = sql.format(cmp=">" if newer else "<", order="ASC" if newer else "DESC")
+        rows = await self.pool.fetch(sql, user_id, cursor_ts, cursor_id, limit)
+        return [PageRow(*row) for row in rows]
+
+    async def page_user_submissions(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]:
+        return await self._page(SQL_PAGE_USER_SUBMISSIONS, user_id, cursor_ts, cursor_id, limit, newer)
+
+    # --- 收藏 ---
+
+    async def count_user_collections(self, user_id: int) -> int:
+        return await self.pool.fetchval("SELECT COUNT(*) FROM collections WHERE user_id = $1", user_id)
+
+    async def page_user_collections(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]:
+        return await self._page(SQL_PAGE_USER_COLLECTIONS, user_id, cursor_ts, cursor_id, limit, newer)
+
+    # --- 点赞/踩/收藏切换与计数 ---
+
+    async def apply_toggles(self, intents: Sequence[ToggleIntent]) -> Tuple[List[ToggleOutcome], Dict[int, Dict[str, int]]]:
+        counts = {}
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # 先给涉及的帖子加事务级 advisory lock，之后按原顺序执行切换。
+                # 双键形式的第二个键只能是 int4，帖子 ID (BIGINT) 用 hashint8 映射；
+                # 按映射后的键排序，多个进程的批次总以相同顺序加锁，避免死锁 (哈希碰撞只会多串行一些)
+                await conn.execute(
+                    "SELECT pg_advisory_xact_lock($1, key) FROM "
+                    "(SELECT DISTINCT hashint8(id) AS key FROM unnest($2::BIGINT[]) AS id) AS keys ORDER BY key",
+                    _TOGGLE_LOCK_SPACE, sorted({intent.message_id for intent in intents})
+                )
+                outcomes = [await _apply_toggle(conn, intent) for intent in intents]
+                for intent in intents:
+                    if intent.message_id not in counts:
+                        counts[intent.message_id] = _stats_dict(await conn.fetchrow(SQL_GET_POST_STATS, intent.message_id))
+        return (outcomes, counts)
+
+    async def get_post_stats(self, message_id: int) -> Dict[str, int]:
+        return _stats_dict(await self.pool.fetchrow(SQL_GET_POST_STATS, message_id))
+
+    async def reconcile_post_stats(self) -> int:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                drifted = await conn.fetchval(
+                    f'''
+                    WITH fresh (channel_message_id, likes, dislikes, collections, comments) AS ({_FRESH_COUNTS_SQL})
+                    SELECT COUNT(*) FROM fresh
+                    LEFT JOIN post_stats p ON p.channel_message_id = fresh.channel_message_id
+                    WHERE p.channel_message_id IS NULL
+                       OR (p.likes, p.dislikes, p.collections, p.comments)
+                          IS DISTINCT FROM (fresh.likes, fresh.dislikes, fresh.collections, fresh.comments)
+                    '''
+                )
+                await conn.execute(
+                    f'''
+                    INSERT INTO post_stats (channel_message_id, likes, dislikes, collections, comments)
+                    {_FRESH_COUNTS_SQL}
+                    ON CONFLICT (channel_message_id) DO UPDATE SET
+                        likes = EXCLUDED.likes,
+                        dislikes = EXCLUDED.dislikes,
+                        collections = EXCLUDED.collections,
+                        comments = EXCLUDED.comments
+                    '''
+                )
+        return drifted
+
+    # --- 评论 ---
+
+    async def add_comment(self, message_id: int, user_id: int, user_name: str, comment_text: str) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text) VALUES ($1, $2, $3, $4)",
+                    message_id, user_id, user_name, comment_text
+                )
+                await _bump_post_stats(conn, message_id, comments=1)
+                await _enqueue_notification(conn, message_id, user_id, "comment",
+                                            {"actor_name": user_name, "comment_text": comment_text})
+
+    async def get_comment_preview(self, message_id: int, limit: int) -> List[CommentRow]:
+        rows = await self.pool.fetch(
+            "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = $1 "
+            "ORDER BY timestamp ASC, id ASC LIMIT $2",
+            message_id, limit
+        )
+        return [CommentRow(*row) for row in rows]
+
+    async def count_comments(self, message_id: int) -> int:
+        return await self.pool.fetchval("SELECT COUNT(*) FROM comments WHERE channel_message_id = $1", message_id)
+
+    async def list_user_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        rows = await self.pool.fetch(
+            "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = $1 AND user_id = $2 "
+            "ORDER BY timestamp DESC, id DESC",
+            message_id, user_id
+        )
+        return [CommentRow(*row) for row in rows]
+
+    async def list_other_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        rows = await self.pool.fetch(
+            "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = $1 AND user_id != $2 "
+            "ORDER BY timestamp DESC, id DESC",
+            message_id, user_id
+        )
+        return [CommentRow(*row) for row in rows]
+
+    async def get_comment_for_delete(self, comment_id: int) -> Optional[CommentForDelete]:
+        row = await self.pool.fetchrow(
+            "SELECT c.user_id, c.comment_text, c.user_name, s.user_id, c.channel_message_id "
+            "FROM comments c JOIN submissions s ON c.channel_message_id = s.channel_message_id WHERE c.id = $1",
+            comment_id
+        )
+        return CommentForDelete(*row) if row else None
+
+    async def delete_comment(self, comment_id: int) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                message_id = await conn.fetchval(
+                    "DELETE FROM comments WHERE id = $1 RETURNING channel_message_id", comment_id
+                )
+                if message_id is None:
+                    return False
+                await _bump_post_stats(conn, message_id, comments=-1)
+        return True
+
+    # --- 通知发件箱 ---
+
+    async def claim_notifications(self, now: int, lease_until: int, limit: int) -> List[OutboxRow]:
+        rows = await self.pool.fetch(SQL_CLAIM_NOTIFICATIONS, now, limit, lease_until)
+        return [
+            OutboxRow(row[0], row[1], row[2], row[3], row[4], json.loads(row[5] or "{}"), row[6], lease_until)
+            for row in rows
+        ]
+
+    async def complete_notification(self, notification_id: int, lease_until: int, now: int) -> bool:
+        result = await self.pool.execute(
+            "UPDATE notifications SET status = 'delivered', delivered_at = $1 "
+            "WHERE id = $2 AND status = 'pending' AND next_attempt_at = $3",
+            now, notification_id, lease_until
+        )
+        return result == "UPDATE 1"
+
+    async def fail_notification(self, notification_id: int, lease_until: int, error: str,
+                                retry_at: Optional[int]) -> None:
+        status = "failed" if retry_at is None else "pending"
+        await self.pool.execute(
+            "UPDATE notifications SET attempts = attempts + 1, last_error = $1, status = $2, next_attempt_at = $3 "
+            "WHERE id = $4 AND status = 'pending' AND next_attempt_at = $5",
+            error[:500], status, retry_at if retry_at is not None else lease_until, notification_id, lease_until
+        )
+
+    # --- 置顶 ---
+
+    async def is_pinned(self, message_id: int) -> bool:
+        return await self.pool.fetchval(
+            "SELECT 1 FROM pinned_posts WHERE channel_message_id = $1", message_id
+        ) is not None
+
+    async def record_pin(self, message_id: int, like_count: int) -> bool:
+        inserted = await self.pool.fetchval(
+            "INSERT INTO pinned_posts (channel_message_id, like_count_at_pin) VALUES ($1, $2) "
+            "ON CONFLICT DO NOTHING RETURNING id",
+            message_id, like_count
+        )
+        return inserted is not None
+
+    # --- 用户目录 ---
+
+    async def upsert_users(self, rows: Iterable[Tuple[int, str, str, str]]) -> None:
+        await self.pool.executemany(
+            '''
+            INSERT INTO users (id, username, full_name, last_seen)
+            VALUES ($1, $2, $3, $4::TEXT::TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET
+                username = EXCLUDED.username,
+                full_name = EXCLUDED.full_name,
+                last_seen = EXCLUDED.last_seen
+            ''',
+            list(rows)
+        )
+
+    async def get_user(self, user_id: int) -> Optional[UserRow]:
+        row = await self.pool.fetchrow("SELECT username, full_name FROM users WHERE id = $1", user_id)
+        return UserRow(row[0] or "", row[1] or "") if row else None
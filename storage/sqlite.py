@@ -0,0 +1,509 @@
+# storage/sqlite.py
+
+import asyncio
+import aiosqlite
+import json
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from config import (
+    DB_CACHE_SIZE_KB,
+    DB_MMAP_SIZE,
+    DB_BUSY_TIMEOUT_MS,
+)
+from migrations import run_migrations, check_query_plans
+from post_stats import bump_post_stats, get_post_stats, reconcile_post_stats
+from services.metrics import metrics, normalize_sql
+from services.slow_queries import slow_queries
+from services.tracing import tracer
+from storage.base import (
+    CommentForDelete,
+    CommentRow,
+    OutboxRow,
+    PageRow,
+    PostCacheStorage,
+    PostState,
+    Storage,
+    Submission,
+    ToggleIntent,
+    ToggleOutcome,
+    UserRow,
+    decide_toggle,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class TimedConnection:
+    """
+    记录每条语句耗时的连接包装 (execute / executemany)，其余属性原样转发
+
+    耗时包含 aiosqlite 把语句交给数据库线程的往返；多行结果的 fetch 不计入。
+    超过慢查询阈值的语句交给 slow_queries，第一次变慢时在同一连接上执行 EXPLAIN QUERY PLAN。
+    """
+
+    __slots__ = ("_conn",)
+
+    def __init__(self, conn: aiosqlite.Connection):
+        self._conn = conn
+
+    async def _explain(self, sql: str, parameters) -> List[str]:
+        cursor = await self._conn.execute(f"EXPLAIN QUERY PLAN {sql}", parameters)
+        return [row[3] for row in await cursor.fetchall()]
+
+    async def _observe(self, sql: str, parameters, started: float, many: bool) -> None:
+        seconds = time.perf_counter() - started
+        metrics.observe_sql(sql, seconds)
+        if tracer.current() is not None:
+            tracer.record(normalize_sql(sql), "sql", started, seconds)
+        if slow_queries.is_slow(seconds):
+            sample = (parameters[0] if parameters else None) if many else parameters
+            await slow_queries.record(sql, parameters, seconds, lambda: self._explain(sql, sample), many=many)
+
+    async def execute(self, sql: str, parameters=None) -> aiosqlite.Cursor:
+        started = time.perf_counter()
+        try:
+            return await self._conn.execute(sql, parameters)
+        finally:
+            await self._observe(sql, parameters, started, many=False)
+
+    async def executemany(self, sql: str, parameters) -> aiosqlite.Cursor:
+        if not isinstance(parameters, (list, tuple)):
+            parameters = list(parameters)
+        started = time.perf_counter()
+        try:
+            return await self._conn.executemany(sql, parameters)
+        finally:
+            await self._observe(sql, parameters, started, many=True)
+
+    def __getattr__(self, name: str):
+        return getattr(self._conn, name)
+
+
+class DatabasePool:
+    """
+    长连接池：一个写连接 + N 个读连接 (WAL 模式)
+
+    - 所有写操作通过 write() 串行化到同一个连接上，退出时自动提交/回滚
+    - 读操作通过 read() 从空闲读连接中借用，WAL 下读写互不阻塞
+    """
+
+    def __init__(self, path: str, reader_count: int = 4):
+        self.path = path
+        self.reader_count = max(1, reader_count)
+        self._writer: Optional[aiosqlite.Connection] = None
+        self._write_lock = asyncio.Lock()
+        self._idle_readers: Optional[asyncio.Queue] = None
+        self._readers: List[aiosqlite.Connection] = []
+
+    async def _connect(self) -> aiosqlite.Connection:
+        conn = await aiosqlite.connect(self.path)
+        await conn.execute(f"PRAGMA busy_timeout = {DB_BUSY_TIMEOUT_MS}")
+        await conn.execute("PRAGMA synchronous = NORMAL")
+        await conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KB}")
+        await conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE}")
+        await conn.execute("PRAGMA temp_store = MEMORY")
+        return conn
+
+    async def open(self) -> None:
+        """打开写连接与所有读连接"""
+        if self._writer is not None:
+            return
+
+        self._writer = await self._connect()
+        # journal_mode 是数据库文件级别的持久设置，在写连接上设置一次即可
+        cursor = await self._writer.execute("PRAGMA journal_mode = WAL")
+        journal_mode = (await cursor.fetchone())[0]
+
+        self._idle_readers = asyncio.Queue()
+        for _ in range(self.reader_count):
+            conn = await self._connect()
+            await conn.execute("PRAGMA query_only = ON")
+            self._readers.append(conn)
+            self._idle_readers.put_nowait(conn)
+
+        logger.info(f"🗄️ 数据库连接池已打开: 1 写 + {self.reader_count} 读, journal_mode={journal_mode}")
+
+    async def close(self) -> None:
+        """关闭所有连接 (写连接关闭前会执行 WAL checkpoint)"""
+        if self._writer is None:
+            return
+
+        async with self._write_lock:
+            try:
+                await self._writer.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            except aiosqlite.Error as e:
+                logger.warning(f"WAL checkpoint 失败: {e}")
+            await self._writer.close()
+            self._writer = None
+
+        for conn in self._readers:
+            await conn.close()
+        self._readers.clear()
+        self._idle_readers = None
+        logger.info("🗄️ 数据库连接池已关闭。")
+
+    async def set_trace_callback(self, callback: Optional[Callable[[str], None]]) -> None:
+        """在所有连接上设置 SQL 跟踪回调 (在数据库线程中调用，None 表示取消)，供基准测试统计查询"""
+        for conn in [self._writer, *self._readers]:
+            await conn.set_trace_callback(callback)
+
+    @asynccontextmanager
+    async def read(self) -> AsyncIterator[TimedConnection]:
+        """借用一个只读连接"""
+        conn = await self._idle_readers.get()
+        try:
+            yield TimedConnection(conn)
+        finally:
+            self._idle_readers.put_nowait(conn)
+
+    @asynccontextmanager
+    async def write(self) -> AsyncIterator[TimedConnection]:
+        """独占写连接，正常退出时提交事务，出现异常时回滚"""
+        async with self._write_lock:
+            try:
+                yield TimedConnection(self._writer)
+            except BaseException:
+                await self._writer.rollback()
+                raise
+            else:
+                await self._writer.commit()
+
+
+# --- SQL 语句 (基准测试和执行计划检查也会直接使用这些常量) ---
+
+SQL_GET_SUBMISSION = "SELECT user_id, user_name, content_text FROM submissions WHERE channel_message_id = ?"
+SQL_ADD_SUBMISSION = "INSERT INTO submissions (user_id, user_name, channel_message_id, content_text) VALUES (?, ?, ?, ?)"
+SQL_SEED_POST_STATS = "INSERT OR IGNORE INTO post_stats (channel_message_id) VALUES (?)"
+SQL_COUNT_USER_SUBMISSIONS = "SELECT COUNT(*) FROM submissions WHERE user_id = ?"
+SQL_PAGE_USER_SUBMISSIONS = '''
+    SELECT content_text, channel_message_id, CAST(strftime('%s', timestamp) AS INTEGER), id
+    FROM submissions
+    WHERE user_id = ? AND (timestamp, id) {cmp} (datetime(?, 'unixepoch'), ?)
+    ORDER BY timestamp {order}, id {order} LIMIT ?
+'''
+SQL_COUNT_USER_COLLECTIONS = "SELECT COUNT(*) FROM collections WHERE user_id = ?"
+SQL_PAGE_USER_COLLECTIONS = '''
+    SELECT s.content_text, s.channel_message_id, CAST(strftime('%s', c.timestamp) AS INTEGER), c.id
+    FROM collections c JOIN submissions s ON c.channel_message_id = s.channel_message_id
+    WHERE c.user_id = ? AND (c.timestamp, c.id) {cmp} (datetime(?, 'unixepoch'), ?)
+    ORDER BY c.timestamp {order}, c.id {order} LIMIT ?
+'''
+SQL_GET_REACTION = "SELECT reaction_type FROM reactions WHERE channel_message_id = ? AND user_id = ?"
+SQL_INSERT_REACTION = "INSERT INTO reactions (channel_message_id, user_id, reaction_type) VALUES (?, ?, ?)"
+SQL_DELETE_REACTION = "DELETE FROM reactions WHERE channel_message_id = ? AND user_id = ?"
+SQL_UPDATE_REACTION = "UPDATE reactions SET reaction_type = ? WHERE channel_message_id = ? AND user_id = ?"
+SQL_GET_COLLECTION = "SELECT id FROM collections WHERE channel_message_id = ? AND user_id = ?"
+SQL_DELETE_COLLECTION = "DELETE FROM collections WHERE channel_message_id = ? AND user_id = ?"
+SQL_INSERT_COLLECTION = "INSERT INTO collections (channel_message_id, user_id) VALUES (?, ?)"
+SQL_ADD_COMMENT = "INSERT INTO comments (channel_message_id, user_id, user_name, comment_text) VALUES (?, ?, ?, ?)"
+SQL_COMMENT_PREVIEW = "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = ? ORDER BY timestamp ASC, id ASC LIMIT ?"
+SQL_COUNT_COMMENTS = "SELECT COUNT(*) FROM comments WHERE channel_message_id = ?"
+SQL_USER_COMMENTS = "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = ? AND user_id = ? ORDER BY timestamp DESC, id DESC"
+SQL_OTHER_COMMENTS = "SELECT id, user_id, user_name, comment_text FROM comments WHERE channel_message_id = ? AND user_id != ? ORDER BY timestamp DESC, id DESC"
+SQL_COMMENT_FOR_DELETE = "SELECT c.user_id, c.comment_text, c.user_name, s.user_id, c.channel_message_id FROM comments c JOIN submissions s ON c.channel_message_id = s.channel_message_id WHERE c.id = ?"
+SQL_COMMENT_POST = "SELECT channel_message_id FROM comments WHERE id = ?"
+SQL_DELETE_COMMENT = "DELETE FROM comments WHERE id = ?"
+# 只给别人的帖子写通知 (作者取自 submissions)；赞/收藏重复时忽略，评论重复时重新置为待发送
+SQL_ENQUEUE_NOTIFICATION = '''
+    INSERT INTO notifications (channel_message_id, user_id, notification_type, recipient_id, payload, status, attempts, next_attempt_at)
+    SELECT ?, ?, ?, user_id, ?, 'pending', 0, ? FROM submissions WHERE channel_message_id = ? AND user_id != ?
+    ON CONFLICT(channel_message_id, user_id, notification_type) DO UPDATE SET
+        payload = excluded.payload,
+        status = 'pending',
+        attempts = 0,
+        next_attempt_at = excluded.next_attempt_at,
+        last_error = NULL,
+        delivered_at = NULL
+    WHERE notifications.notification_type = 'comment'
+'''
+SQL_DUE_NOTIFICATIONS = '''
+    SELECT id, channel_message_id, user_id, notification_type, recipient_id, payload, attempts
+    FROM notifications WHERE status = 'pending' AND next_attempt_at <= ?
+    ORDER BY next_attempt_at LIMIT ?
+'''
+SQL_LEASE_NOTIFICATION = "UPDATE notifications SET next_attempt_at = ? WHERE id = ?"
+SQL_COMPLETE_NOTIFICATION = "UPDATE notifications SET status = 'delivered', delivered_at = ? WHERE id = ? AND status = 'pending' AND next_attempt_at = ?"
+SQL_FAIL_NOTIFICATION = '''
+    UPDATE notifications SET attempts = attempts + 1, last_error = ?, status = ?, next_attempt_at = ?
+    WHERE id = ? AND status = 'pending' AND next_attempt_at = ?
+'''
+SQL_IS_PINNED = "SELECT id FROM pinned_posts WHERE channel_message_id = ?"
+SQL_RECORD_PIN = "INSERT OR IGNORE INTO pinned_posts (channel_message_id, like_count_at_pin) VALUES (?, ?)"
+SQL_UPSERT_USER = '''
+    INSERT INTO users (id, username, full_name, last_seen) VALUES (?, ?, ?, ?)
+    ON CONFLICT(id) DO UPDATE SET
+        username = excluded.username,
+        full_name = excluded.full_name,
+        last_seen = excluded.last_seen
+'''
+SQL_GET_USER = "SELECT username, full_name FROM users WHERE id = ?"
+SQL_GET_POST_STATS = "SELECT likes, dislikes, collections, comments FROM post_stats WHERE channel_message_id = ?"
+SQL_RECENT_POSTS = "SELECT channel_message_id FROM submissions ORDER BY id DESC LIMIT ?"
+SQL_POST_REACTIONS = "SELECT user_id, reaction_type FROM reactions WHERE channel_message_id = ?"
+SQL_POST_COLLECTORS = "SELECT user_id FROM collections WHERE channel_message_id = ?"
+
+# 第一页游标：9999-12-31 23:59:59 UTC
+MAX_CURSOR_TS = 253402300799
+
+# --- 热点查询 (用于 EXPLAIN QUERY PLAN 检查) ---
+# 名称 -> (SQL, 示例参数)。新增热点查询时请同步登记在这里。
+HOT_QUERIES = {
+    "navigate_my_posts.count": (SQL_COUNT_USER_SUBMISSIONS, (0,)),
+    "navigate_my_posts.page": (SQL_PAGE_USER_SUBMISSIONS.format(cmp="<", order="DESC"), (0, MAX_CURSOR_TS, 0, 11)),
+    "navigate_my_posts.prev": (SQL_PAGE_USER_SUBMISSIONS.format(cmp=">", order="ASC"), (0, 0, 0, 11)),
+    "show_my_collections.count": (SQL_COUNT_USER_COLLECTIONS, (0,)),
+    "show_my_collections.page": (SQL_PAGE_USER_COLLECTIONS.format(cmp="<", order="DESC"), (0, MAX_CURSOR_TS, 0, 11)),
+    "show_my_collections.prev": (SQL_PAGE_USER_COLLECTIONS.format(cmp=">", order="ASC"), (0, 0, 0, 11)),
+    "build_comment_section.preview": (SQL_COMMENT_PREVIEW, (0, 5)),
+    "build_comment_section.count": (SQL_COUNT_COMMENTS, (0,)),
+    "show_delete_comment_menu.mine": (SQL_USER_COMMENTS, (0, 0)),
+    "show_delete_comment_menu.others": (SQL_OTHER_COMMENTS, (0, 0)),
+    "get_all_counts": (SQL_GET_POST_STATS, (0,)),
+    "notification_outbox.due": (SQL_DUE_NOTIFICATIONS, (0, 50)),
+}
+
+
+async def enqueue_notification(db, message_id: int, actor_id: int, notification_type: str, payload: dict) -> None:
+    """在当前写事务内写入一条待发送通知 (自己的帖子不会写入)"""
+    await db.execute(
+        SQL_ENQUEUE_NOTIFICATION,
+        (message_id, actor_id, notification_type, json.dumps(payload, ensure_ascii=False), int(time.time()),
+         message_id, actor_id)
+    )
+
+
+async def apply_toggle(db, intent: ToggleIntent) -> ToggleOutcome:
+    """在写事务内执行一次点赞/踩/收藏切换 (先读出切换前的状态)"""
+    previous = 0
+    if intent.action == 'react':
+        cursor = await db.execute(SQL_GET_REACTION, (intent.message_id, intent.user_id))
+        existing_reaction = await cursor.fetchone()
+        previous = existing_reaction[0] if existing_reaction else 0
+    elif intent.action == 'collect':
+        cursor = await db.execute(SQL_GET_COLLECTION, (intent.message_id, intent.user_id))
+        previous = 1 if await cursor.fetchone() else 0
+    return await write_toggle(db, intent, previous)
+
+
+async def write_toggle(db, intent: ToggleIntent, previous: int) -> ToggleOutcome:
+    """在写事务内按已知的切换前状态写入一次切换，不读取已有行"""
+    message_id, user_id = intent.message_id, intent.user_id
+    new_value, deltas, outcome = decide_toggle(intent, previous)
+
+    if intent.action == 'react':
+        if previous == 0:
+            await db.execute(SQL_INSERT_REACTION, (message_id, user_id, new_value))
+        elif new_value == 0:
+            await db.execute(SQL_DELETE_REACTION, (message_id, user_id))
+        else:
+            await db.execute(SQL_UPDATE_REACTION, (new_value, message_id, user_id))
+    elif intent.action == 'collect':
+        if new_value:
+            await db.execute(SQL_INSERT_COLLECTION, (message_id, user_id))
+        else:
+            await db.execute(SQL_DELETE_COLLECTION, (message_id, user_id))
+
+    if deltas:
+        await bump_post_stats(db, message_id, **deltas)
+    if outcome.notification_type:
+        await enqueue_notification(db, message_id, user_id, outcome.notification_type,
+                                   {"actor_name": intent.actor_name})
+    return outcome
+
+
+class SqliteStorage(Storage, PostCacheStorage):
+    """基于 aiosqlite 长连接池的存储实现 (单进程，支持热点帖子缓存)"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, reader_count: int):
+        self.pool = DatabasePool(path, reader_count)
+
+    async def open(self) -> None:
+        await self.pool.open()
+
+    async def close(self) -> None:
+        await self.pool.close()
+
+    async def migrate(self) -> int:
+        return await run_migrations(self.pool)
+
+    async def check_query_plans(self) -> List[str]:
+        async with self.pool.read() as db:
+            return await check_query_plans(db, HOT_QUERIES)
+
+    async def _fetchone(self, sql: str, params: tuple):
+        async with self.pool.read() as db:
+            cursor = await db.execute(sql, params)
+            return await cursor.fetchone()
+
+    async def _fetchall(self, sql: str, params: tuple) -> list:
+        async with self.pool.read() as db:
+            cursor = await db.execute(sql, params)
+            return await cursor.fetchall()
+
+    # --- 投稿 ---
+
+    async def get_submission(self, message_id: int) -> Optional[Submission]:
+        row = await self._fetchone(SQL_GET_SUBMISSION, (message_id,))
+        return Submission(*row) if row else None
+
+    async def add_submission(self, user_id: int, user_name: str, message_id: int, content_text: str) -> None:
+        async with self.pool.write() as db:
+            await db.execute(SQL_ADD_SUBMISSION, (user_id, user_name, message_id, content_text))
+            await db.execute(SQL_SEED_POST_STATS, (message_id,))
+
+    async def count_user_submissions(self, user_id: int) -> int:
+        return (await self._fetchone(SQL_COUNT_USER_SUBMISSIONS, (user_id,)))[0]
+
+    async def _page(self, sql: str, user_id: int, cursor_ts: int, cursor_id: int,
+                    limit: int, newer: bool) -> List[PageRow]:
+        sql = sql.format(cmp=">" if newer else "<", order="ASC" if newer else "DESC")
+        rows = await self._fetchall(sql, (user_id, cursor_ts, cursor_id, limit))
+        return [PageRow(*row) for row in rows]
+
+    async def page_user_submissions(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]:
+        return await self._page(SQL_PAGE_USER_SUBMISSIONS, user_id, cursor_ts, cursor_id, limit, newer)
+
+    # --- 收藏 ---
+
+    async def count_user_collections(self, user_id: int) -> int:
+        return (await self._fetchone(SQL_COUNT_USER_COLLECTIONS, (user_id,)))[0]
+
+    async def page_user_collections(self, user_id: int, cursor_ts: int, cursor_id: int,
+                                    limit: int, newer: bool) -> List[PageRow]:
+        return await self._page(SQL_PAGE_USER_COLLECTIONS, user_id, cursor_ts, cursor_id, limit, newer)
+
+    # --- 点赞/踩/收藏切换与计数 ---
+
+    async def apply_toggles(self, intents: Sequence[ToggleIntent]) -> Tuple[List[ToggleOutcome], Dict[int, Dict[str, int]]]:
+        async with self.pool.write() as db:
+            outcomes = [await apply_toggle(db, intent) for intent in intents]
+            counts = {}
+            for intent in intents:
+                if intent.message_id not in counts:
+                    counts[intent.message_id] = await get_post_stats(db, intent.message_id)
+        return (outcomes, counts)
+
+    async def get_post_stats(self, message_id: int) -> Dict[str, int]:
+        async with self.pool.read() as db:
+            return await get_post_stats(db, message_id)
+
+    async def recent_post_ids(self, limit: int) -> List[int]:
+        return [row[0] for row in await self._fetchall(SQL_RECENT_POSTS, (limit,))]
+
+    async def load_post_states(self, message_ids: Sequence[int]) -> Dict[int, PostState]:
+        states = {}
+        async with self.pool.read() as db:
+            for message_id in message_ids:
+                cursor = await db.execute(SQL_GET_SUBMISSION, (message_id,))
+                row = await cursor.fetchone()
+                stats = await get_post_stats(db, message_id)
+                cursor = await db.execute(SQL_IS_PINNED, (message_id,))
+                pinned = await cursor.fetchone() is not None
+                cursor = await db.execute(SQL_POST_REACTIONS, (message_id,))
+                reactions = await cursor.fetchall()
+                cursor = await db.execute(SQL_POST_COLLECTORS, (message_id,))
+                collectors = [user_id for (user_id,) in await cursor.fetchall()]
+                states[message_id] = PostState(
+                    Submission(*row) if row else None, stats, pinned,
+                    [user_id for user_id, value in reactions if value == 1],
+                    [user_id for user_id, value in reactions if value == -1],
+                    collectors,
+                )
+        return states
+
+    async def write_toggles(self, decided: Sequence[Tuple[ToggleIntent, int]]) -> None:
+        async with self.pool.write() as db:
+            for intent, previous in decided:
+                await write_toggle(db, intent, previous)
+
+    async def reconcile_post_stats(self) -> int:
+        async with self.pool.write() as db:
+            return await reconcile_post_stats(db)
+
+    # --- 评论 ---
+
+    async def add_comment(self, message_id: int, user_id: int, user_name: str, comment_text: str) -> None:
+        async with self.pool.write() as db:
+            await db.execute(SQL_ADD_COMMENT, (message_id, user_id, user_name, comment_text))
+            await bump_post_stats(db, message_id, comments=1)
+            await enqueue_notification(db, message_id, user_id, "comment",
+                                       {"actor_name": user_name, "comment_text": comment_text})
+
+    async def get_comment_preview(self, message_id: int, limit: int) -> List[CommentRow]:
+        return [CommentRow(*row) for row in await self._fetchall(SQL_COMMENT_PREVIEW, (message_id, limit))]
+
+    async def count_comments(self, message_id: int) -> int:
+        return (await self._fetchone(SQL_COUNT_COMMENTS, (message_id,)))[0]
+
+    async def list_user_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        return [CommentRow(*row) for row in await self._fetchall(SQL_USER_COMMENTS, (message_id, user_id))]
+
+    async def list_other_comments(self, message_id: int, user_id: int) -> List[CommentRow]:
+        return [CommentRow(*row) for row in await self._fetchall(SQL_OTHER_COMMENTS, (message_id, user_id))]
+
+    async def get_comment_for_delete(self, comment_id: int) -> Optional[CommentForDelete]:
+        row = await self._fetchone(SQL_COMMENT_FOR_DELETE, (comment_id,))
+        return CommentForDelete(*row) if row else None
+
+    async def delete_comment(self, comment_id: int) -> bool:
+        async with self.pool.write() as db:
+            cursor = await db.execute(SQL_COMMENT_POST, (comment_id,))
+            row = await cursor.fetchone()
+            if not row:
+                return False
+            await db.execute(SQL_DELETE_COMMENT, (comment_id,))
+            await bump_post_stats(db, row[0], comments=-1)
+        return True
+
+    # --- 通知发件箱 ---
+
+    async def claim_notifications(self, now: int, lease_until: int, limit: int) -> List[OutboxRow]:
+        async with self.pool.write() as db:
+            cursor = await db.execute(SQL_DUE_NOTIFICATIONS, (now, limit))
+            rows = await cursor.fetchall()
+            await db.executemany(SQL_LEASE_NOTIFICATION, [(lease_until, row[0]) for row in rows])
+        return [
+            OutboxRow(row_id, message_id, actor_id, notification_type, recipient_id,
+                      json.loads(payload or "{}"), attempts, lease_until)
+            for row_id, message_id, actor_id, notification_type, recipient_id, payload, attempts in rows
+        ]
+
+    async def complete_notification(self, notification_id: int, lease_until: int, now: int) -> bool:
+        async with self.pool.write() as db:
+            cursor = await db.execute(SQL_COMPLETE_NOTIFICATION, (now, notification_id, lease_until))
+            return cursor.rowcount == 1
+
+    async def fail_notification(self, notification_id: int, lease_until: int, error: str,
+                                retry_at: Optional[int]) -> None:
+        status = "failed" if retry_at is None else "pending"
+        async with self.pool.write() as db:
+            await db.execute(
+                SQL_FAIL_NOTIFICATION,
+                (error[:500], status, retry_at if retry_at is not None else lease_until, notification_id, lease_until)
+            )
+
+    # --- 置顶 ---
+
+    async def is_pinned(self, message_id: int) -> bool:
+        return await self._fetchone(SQL_IS_PINNED, (message_id,)) is not None
+
+    async def record_pin(self, message_id: int, like_count: int) -> bool:
+        async with self.pool.write() as db:
+            cursor = await db.execute(SQL_RECORD_PIN, (message_id, like_count))
+            return cursor.rowcount == 1
+
+    # --- 用户目录 ---
+
+    async def upsert_users(self, rows: Iterable[Tuple[int, str, str, str]]) -> None:
+        async with self.pool.write() as db:
+            await db.executemany(SQL_UPSERT_USER, list(rows))
+
+    async def get_user(self, user_id: int) -> Optional[UserRow]:
+        row = await self._fetchone(SQL_GET_USER, (user_id,))
+        return UserRow(row[0] or "", row[1] or "") if row else None
@@ -0,0 +1,93 @@
+# test_callback_router.py - 检查按钮 callback_data 的编码、旧格式兼容和路由分发
+
+import asyncio
+import sys
+
+from telegram import Update
+from telegram.constants import InlineKeyboardButtonLimit
+
+from handlers.callback_router import CHANNEL_KINDS, CallbackAction, CallbackRouter, Kind, decode_callback, encode_callback
+from testkit import check, report
+
+# 使用方法：python test_callback_router.py
+# 不需要连接 Telegram，也不读写数据库
+
+
+def click(data: str) -> Update:
+    user = {"id": 7, "is_bot": False, "first_name": "u7"}
+    return Update.de_json({
+        "update_id": 1,
+        "callback_query": {"id": "1", "from": user, "chat_instance": "1", "data": data},
+    }, None)
+
+
+async def main() -> int:
+    # 紧凑编码往返
+    cases = [
+        (Kind.SUBMIT_POST, ()),
+        (Kind.MY_POSTS_PAGE, (1,)),
+        (Kind.MY_COLLECTIONS_PAGE, (12, 1, 1_700_000_000, 987_654_321)),
+        (Kind.APPROVE, (8_123_456_789, 2_147_483_647)),
+        (Kind.LIKE, (-5,)),
+    ]
+    check("紧凑编码往返一致", all(decode_callback(encode_callback(kind, *fields)) == (kind, fields)
+                               for kind, fields in cases))
+    longest = encode_callback(Kind.MY_POSTS_PAGE, 2 ** 62, 1, 2 ** 62, 2 ** 62)
+    check(f"4 个 64 位字段也不超过 64 字节 ({len(longest)})",
+          len(longest) <= InlineKeyboardButtonLimit.MAX_CALLBACK_DATA)
+    check("点赞按钮比旧格式更短", len(encode_callback(Kind.LIKE, 123456)) < len("react:like:123456"))
+
+    # 已发布帖子和旧消息上的按钮
+    legacy = {
+        "submit_post": CallbackAction(Kind.SUBMIT_POST),
+        "back_to_main": CallbackAction(Kind.BACK_TO_MAIN),
+        "my_posts_page:1": CallbackAction(Kind.MY_POSTS_PAGE, (1,)),
+        "my_collections_page:3:p:1700000000:42": CallbackAction(Kind.MY_COLLECTIONS_PAGE, (3, 1, 1700000000, 42)),
+        "my_posts_page:2:n:1700000000:41": CallbackAction(Kind.MY_POSTS_PAGE, (2, 0, 1700000000, 41)),
+        "approve:111:222": CallbackAction(Kind.APPROVE, (111, 222)),
+        "decline:111:222": CallbackAction(Kind.DECLINE, (111, 222)),
+        "react:like:55": CallbackAction(Kind.LIKE, (55,)),
+        "react:dislike:55": CallbackAction(Kind.DISLIKE, (55,)),
+        "collect:55": CallbackAction(Kind.COLLECT, (55,)),
+        "comment:show:55": CallbackAction(Kind.COMMENT_SHOW, (55,)),
+        "comment:refresh:55": CallbackAction(Kind.COMMENT_REFRESH, (55,)),
+        "comment:hide:55": CallbackAction(Kind.COMMENT_HIDE, (55,)),
+    }
+    wrong = [data for data, expected in legacy.items() if decode_callback(data) != expected]
+    check(f"旧格式全部可以解析 {wrong}", not wrong)
+
+    garbage = ["", "unknown:1", "approve:x:1", "~", "~!!!", "~gA", "react"]
+    check("无法识别的数据返回 None", all(decode_callback(data) is None for data in garbage))
+    check("缺少的字段取默认值", CallbackAction(Kind.LIKE).field(0, -1) == -1)
+
+    # 路由
+    router = CallbackRouter()
+    calls = []
+
+    async def record(update, context, action):
+        calls.append(action)
+        return "next"
+
+    for kind in (Kind.APPROVE, *CHANNEL_KINDS):
+        router.route(kind, record)
+    top = router.handler(Kind.APPROVE, *CHANNEL_KINDS)
+    check("匹配紧凑格式", bool(top.check_update(click(encode_callback(Kind.COLLECT, 9)))))
+    check("匹配旧格式", bool(top.check_update(click("comment:hide:9"))))
+    check("不匹配未接受的类型", not top.check_update(click(encode_callback(Kind.SUBMIT_POST))))
+    check("不匹配无法识别的数据", not top.check_update(click("react")))
+
+    result = await router.dispatch(click("approve:1:2"), None)
+    check("分发时传入解析结果并返回处理器的返回值",
+          result == "next" and calls == [CallbackAction(Kind.APPROVE, (1, 2))])
+
+    try:
+        router.handler(Kind.DECLINE)
+        check("未注册的类型在启动时报错", False)
+    except ValueError:
+        check("未注册的类型在启动时报错", True)
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,92 @@
+# test_comment_preview.py - 评论区渲染缓存与 caption 长度预算检查
+
+import asyncio
+import os
+import sys
+import tempfile
+
+from services.comment_preview import CommentPreviewCache, render_comment_section, utf16_length, visible_length
+from storage import CommentRow, PostCacheStorage, storage
+from testkit import check, report
+
+# 使用方法：python test_comment_preview.py
+# 在临时目录中建库，不需要连接 Telegram
+
+
+class SharedStorage:
+    """统计评论查询次数，其余调用原样转发；相当于多个进程共用的后端"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.queries = 0
+
+    async def get_comment_preview(self, *args):
+        self.queries += 1
+        return await self.inner.get_comment_preview(*args)
+
+    async def count_comments(self, *args):
+        self.queries += 1
+        return await self.inner.count_comments(*args)
+
+
+class CountingStorage(SharedStorage):
+    """单进程后端 (虚拟子类，不必实现缓存接口的方法)"""
+
+
+PostCacheStorage.register(CountingStorage)
+
+
+async def main() -> int:
+    os.chdir(tempfile.mkdtemp(prefix="test_comment_preview_"))  # 全局 storage 的 DB_NAME 是相对路径
+    await storage.open()
+    try:
+        await storage.migrate()
+        await storage.add_submission(1, "作者", 100, "正文")
+        for i in range(7):
+            await storage.add_comment(100, 10 + i, f"用户{i}", f"第 {i} 条评论 <b>")
+
+        import services.comment_preview as comment_preview
+        counting = CountingStorage(storage)
+        comment_preview.storage = counting
+        cache = CommentPreviewCache(16)
+
+        text, total = await cache.get(100, 1024)
+        check("首次渲染查询数据库", counting.queries == 2 and total == 7)
+        check("评论内容已转义", "&lt;b&gt;" in text and "<b>" not in text)
+        check("超过 5 条时显示省略号", text.endswith("...\n") and "5. " in text and "6. " not in text)
+
+        again, _ = await cache.get(100, 1024)
+        check("评论未变化时刷新不查询数据库", counting.queries == 2 and again == text)
+
+        smaller, _ = await cache.get(100, 120)
+        check("预算变化时用缓存重新渲染", counting.queries == 2 and visible_length(smaller) <= 120)
+
+        await storage.add_comment(100, 99, "新用户", "新评论")
+        cache.bump(100)
+        _, total = await cache.get(100, 1024)
+        check("bump 后重新查询", counting.queries == 4 and total == 8)
+
+        # 预算：长评论被截断，emoji 按 UTF-16 计数
+        long_comments = [CommentRow(i, i, "😀" * 20, "很长的评论😀" * 100) for i in range(5)]
+        for budget in (40, 80, 300, 1024):
+            section = render_comment_section(long_comments, 9, budget)
+            check(f"预算 {budget}: 可见长度 {visible_length(section)}", visible_length(section) <= budget)
+        check("连标题都放不下时返回空", render_comment_section(long_comments, 9, 10) == "")
+        check("UTF-16 长度", utf16_length("a😀") == 3)
+
+        # 多个进程共用的后端：其他进程写入的评论不会触发本进程的 bump，每次都查询
+        shared = SharedStorage(storage)
+        comment_preview.storage = shared
+        cache = CommentPreviewCache(16)
+        await cache.get(100, 1024)
+        await storage.add_comment(100, 98, "另一进程", "别处写入")
+        _, total = await cache.get(100, 1024)
+        check("共用数据库时不缓存，读到其他进程的评论", not cache.enabled and shared.queries == 4 and total == 9)
+    finally:
+        await storage.close()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
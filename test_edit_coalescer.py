@@ -0,0 +1,52 @@
+# test_edit_coalescer.py - 检查频道编辑合并：以调用方看到的当前内容判断是否需要编辑
+
+import asyncio
+import sys
+
+from services.edit_coalescer import EditCoalescer
+from testkit import check, report
+
+# 使用方法：python test_edit_coalescer.py
+# 不需要连接 Telegram；出站调度器未启动时直接调用假的 bot
+
+
+class FakeBot:
+    def __init__(self):
+        self.captions = []
+
+    async def edit_message_caption(self, caption, **kwargs):
+        self.captions.append(caption)
+
+
+def rendering(caption: str):
+    async def render():
+        return (caption, None)
+    return render
+
+
+async def main() -> int:
+    bot = FakeBot()
+    coalescer = EditCoalescer(window=0)
+
+    coalescer.schedule(bot, 42, rendering("👍 1"), current=("👍 0", None))
+    await coalescer.flush()
+    check("内容不同时发送编辑", bot.captions == ["👍 1"])
+
+    coalescer.schedule(bot, 42, rendering("👍 1"))
+    await coalescer.flush()
+    check("与上次发送的内容相同时跳过", bot.captions == ["👍 1"] and coalescer.edits_skipped == 1)
+
+    # 另一个进程把消息改成了 "👍 5"：本进程的渲染结果虽然与自己上次发送的相同，也要编辑
+    coalescer.schedule(bot, 42, rendering("👍 1"), current=("👍 5", None))
+    await coalescer.flush()
+    check("以调用方看到的当前内容为准", bot.captions == ["👍 1", "👍 1"])
+
+    coalescer.schedule(bot, 42, rendering("👍 5"), current=("👍 5", None))
+    await coalescer.flush()
+    check("与当前显示的内容相同时跳过", bot.captions == ["👍 1", "👍 1"] and coalescer.edits_skipped == 2)
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,167 @@
+# test_metrics.py - 检查运行指标的记录、Prometheus 文本输出和本地抓取端点
+
+import asyncio
+import os
+import socket
+import sys
+import tempfile
+import time
+
+import aiohttp
+from telegram import Update
+from telegram.request import BaseRequest
+
+from handlers.callback_router import CallbackRouter, Kind, encode_callback
+from services.metrics import InstrumentedRequest, MetricsServer, metrics, normalize_sql
+from storage.sqlite import DatabasePool
+from testkit import check, report
+
+# 使用方法：python test_metrics.py
+# 不需要连接 Telegram；在临时目录中建库，在本机随机端口上启动抓取端点
+
+
+class ScriptedRequest(BaseRequest):
+    """按顺序返回预设的结果；值为异常时抛出"""
+
+    def __init__(self, results):
+        self.results = list(results)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        result = self.results.pop(0)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def click(data: str) -> Update:
+    user = {"id": 7, "is_bot": False, "first_name": "u7"}
+    return Update.de_json({
+        "update_id": 1,
+        "callback_query": {"id": "1", "from": user, "chat_instance": "1", "data": data},
+    }, None)
+
+
+async def main() -> int:
+    check("SQL 归一化合并空白并替换字面量",
+          normalize_sql("SELECT id\n   FROM t WHERE a = 5 AND b = 'x''y' LIMIT ?") ==
+          "SELECT id FROM t WHERE a = ? AND b = ? LIMIT ?")
+
+    # 按钮处理器：按动作类型记录，异常也计入
+    router = CallbackRouter()
+
+    async def like(update, context, action):
+        await asyncio.sleep(0.002)
+
+    async def broken(update, context, action):
+        raise RuntimeError("boom")
+
+    router.route(Kind.LIKE, like)
+    router.route(Kind.COLLECT, broken)
+    await router.dispatch(click(encode_callback(Kind.LIKE, 1)), None)
+    try:
+        await router.dispatch(click(encode_callback(Kind.COLLECT, 1)), None)
+    except RuntimeError:
+        pass
+    check("按钮耗时按动作类型记录", metrics.handler.series["like"].count == 1
+          and metrics.handler.series["like"].sum >= 0.002)
+    check("处理器异常计数", metrics.handler_errors.values.get(("collect",)) == 1)
+
+    # SQL：经过 DatabasePool 的语句都被计时
+    path = os.path.join(tempfile.mkdtemp(prefix="test_metrics_"), "m.db")
+    pool = DatabasePool(path, reader_count=1)
+    await pool.open()
+    async with pool.write() as db:
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        await db.executemany("INSERT INTO t (v) VALUES (?)", [("a",), ("b",)])
+    for _ in range(3):
+        async with pool.read() as db:
+            cursor = await db.execute("SELECT v FROM t WHERE id = ?", (1,))
+            await cursor.fetchone()
+    await pool.close()
+    check("SQL 按归一化文本记录", metrics.sql.series["SELECT v FROM t WHERE id = ?"].count == 3)
+    check("executemany 也被记录", metrics.sql.series["INSERT INTO t (v) VALUES (?)"].count == 1)
+
+    # Telegram API：按方法记录耗时，HTTP 错误和异常分别计数
+    request = InstrumentedRequest(ScriptedRequest([(200, b"{}"), (429, b"{}"), OSError("reset")]))
+    url = "https://api.telegram.org/bot1:x/editMessageCaption"
+    await request.do_request(url, "POST")
+    await request.do_request(url, "POST")
+    try:
+        await request.do_request(url, "POST")
+    except OSError:
+        pass
+    check("API 耗时按方法记录", metrics.api.series["editMessageCaption"].count == 3)
+    check("API 错误按状态码/异常类型计数",
+          metrics.api_errors.values == {("editMessageCaption", "429"): 1, ("editMessageCaption", "OSError"): 1})
+
+    # 队列深度在抓取时求值
+    depth = [4]
+    metrics.gauge("toggle_writer", lambda: depth[0])
+    metrics.gauge("broken", lambda: 1 / 0)
+
+    # 本地抓取
+    port = free_port()
+    server = MetricsServer("127.0.0.1", port, "/metrics")
+    await server.start()
+    try:
+        depth[0] = 7
+        async with aiohttp.ClientSession() as session:
+            async with session.get(f"http://127.0.0.1:{port}/metrics") as response:
+                status = response.status
+                content_type = response.headers.get("Content-Type", "")
+                body = await response.text()
+    finally:
+        await server.stop()
+    lines = body.splitlines()
+    check(f"抓取返回 200 text/plain ({status}, {content_type})", status == 200 and content_type.startswith("text/plain"))
+    check("直方图有累积分桶、+Inf、_sum、_count",
+          'bot_handler_duration_seconds_bucket{action="like",le="+Inf"} 1' in lines
+          and any(line.startswith('bot_handler_duration_seconds_sum{action="like"}') for line in lines)
+          and 'bot_handler_duration_seconds_count{action="like"} 1' in lines)
+    buckets = [int(line.rsplit(" ", 1)[1]) for line in lines
+               if line.startswith('bot_sql_duration_seconds_bucket{query="SELECT v FROM t WHERE id = ?"')]
+    check("分桶计数单调不减", buckets == sorted(buckets) and buckets[-1] == 3)
+    check("API 错误计数", 'bot_telegram_api_errors_total{method="editMessageCaption",error="429"} 1' in lines)
+    check("队列深度取抓取时的值", 'bot_queue_depth{queue="toggle_writer"} 7' in lines)
+    check("读取失败的队列不输出", 'queue="broken"' not in body)
+    check("每个指标都有 TYPE 行", all(
+        f"# TYPE {name} " in body for name in (
+            "bot_handler_duration_seconds", "bot_update_duration_seconds", "bot_sql_duration_seconds",
+            "bot_telegram_api_duration_seconds", "bot_telegram_api_errors_total", "bot_queue_depth")))
+
+    # 日志摘要：只包含上次汇总之后的变化
+    summary = metrics.summary()
+    check("摘要包含各类指标", "like ×1" in summary and "editMessageCaption ×3" in summary
+          and "editMessageCaption:429" in summary)
+    check("第二次摘要只有增量", "like ×" not in metrics.summary())
+
+    # 开销：常开需要足够便宜
+    count = 100_000
+    started = time.perf_counter()
+    for _ in range(count):
+        metrics.observe_sql("SELECT v FROM t WHERE id = ?", 0.0001)
+    per_call = (time.perf_counter() - started) / count * 1e6
+    check(f"每次记录开销 {per_call:.2f} µs", per_call < 20)
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
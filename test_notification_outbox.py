@@ -0,0 +1,72 @@
+# test_notification_outbox.py - 检查通知汇总：超过每组上限的通知只计数，内存占用有界，全部标记为已送达
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+from services.notification_outbox import NotificationOutbox
+from storage import ToggleIntent, storage
+from testkit import check, report
+
+# 使用方法：python test_notification_outbox.py
+# 在临时目录中建库；机器人用记录消息的假对象代替 (查询资料失败时使用通知里的名称)
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        self.sent.append((chat_id, text))
+
+    async def get_chat(self, chat_id):
+        raise RuntimeError("离线测试")
+
+
+async def main() -> int:
+    os.chdir(tempfile.mkdtemp(prefix="test_notification_outbox_"))  # 全局 storage 的 DB_NAME 是相对路径
+    await storage.open()
+    await storage.migrate()
+    try:
+        await storage.add_submission(1, "作者", 500, "热门帖子")
+        # 先有 1 个收藏，再有 120 个赞：每组只保留最近 20 行，收藏和前 100 个赞只计数
+        await storage.apply_toggles([ToggleIntent('collect', 500, 2, 0, "收藏者")])
+        await storage.apply_toggles([ToggleIntent('react', 500, user_id, 1, f"用户{user_id}")
+                                     for user_id in range(100, 220)])
+
+        bot = FakeBot()
+        outbox = NotificationOutbox(50, 1, 120, 3, 1, 10, digest_window=60, immediate_types={"comment"},
+                                    max_groups=10, max_rows=20)
+        outbox._bot = bot
+        claimed, largest = 0, 0
+        while True:
+            count = await outbox.dispatch_once()
+            largest = max([largest] + [len(group.rows) for group in outbox._groups.values()])
+            if not count:
+                break
+            claimed += count
+        check(f"认领全部 121 条通知 ({claimed})", claimed == 121)
+        check(f"每组最多保留 20 行 (最多 {largest})", largest == 20 and outbox.buffered() == 20)
+        check("窗口内不发送", not bot.sent)
+
+        await outbox._flush_groups(force=True)
+        texts = [text for _, text in bot.sent]
+        check("汇总成一条消息", len(texts) == 1)
+        text = texts[0] if texts else ""
+        check("点名最近的点赞者，其余计数", "用户219" in text and "和另外 119 人赞了" in text)
+        check("全部被折叠的类型只显示人数", "⭐ 1 人收藏了" in text)
+        check(f"送达计数 {outbox.delivered}", outbox.delivered == 121 and outbox.digests_sent == 1)
+
+        # 折叠的行和汇总中的行都已完成：租约过期后也不会被重新认领
+        later = int(time.time()) + 10 ** 6
+        check("没有遗留待发送的通知", await storage.claim_notifications(later, later + 120, 500) == [])
+    finally:
+        await storage.close()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
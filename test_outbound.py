@@ -0,0 +1,66 @@
+# test_outbound.py - 检查出站调度器：频道内按帖子轮转、编辑单独限速、频道排队深度
+
+import asyncio
+import sys
+import time
+
+from services.outbound import OutboundScheduler, Priority
+from testkit import check, report
+
+# 使用方法：python test_outbound.py
+# 不需要连接 Telegram；发送用记录调用顺序的协程代替，限速调快以便几秒内跑完
+
+CHANNEL_ID = "-1001"
+
+
+async def main() -> int:
+    sent = []
+
+    async def edit(message_id: int):
+        sent.append(("edit", message_id, time.monotonic()))
+
+    async def pin(message_id: int):
+        sent.append(("pin", message_id, time.monotonic()))
+
+    # 编辑 10 次/秒 (容量 5)，其他群组消息 60 次/分钟
+    scheduler = OutboundScheduler(1000, 1000, 60, 16, 0, group_edit_per_minute=600)
+    scheduler.start()
+    started = time.monotonic()
+
+    # 帖子 1 先积压 30 个编辑，之后帖子 2、3 各来一个：轮转后不必等帖子 1 的积压发完
+    backlog = [asyncio.create_task(scheduler.submit(CHANNEL_ID, Priority.EDIT, edit, 1, lane=1)) for _ in range(30)]
+    await asyncio.sleep(0.05)  # 令牌桶里的 5 个额度先发给帖子 1
+    check(f"频道排队深度 {scheduler.chat_depth(CHANNEL_ID)}", scheduler.chat_depth(CHANNEL_ID) == 25)
+    queued_at = len(sent)
+    others = [asyncio.create_task(scheduler.submit(CHANNEL_ID, Priority.EDIT, edit, message_id, lane=message_id))
+              for message_id in (2, 3)]
+    # 编辑额度用完时，置顶 (同一频道、另一个令牌桶) 不需要等编辑
+    await scheduler.submit(CHANNEL_ID, Priority.NOTIFICATION, pin, 1)
+    pin_delay = sent[[kind for kind, _, _ in sent].index("pin")][2] - started
+    check(f"编辑积压时置顶不占编辑额度 ({pin_delay * 1000:.0f}ms)", pin_delay < 0.5)
+
+    await asyncio.gather(*others)
+    edits = [message_id for kind, message_id, _ in sent if kind == "edit"]
+    position = max(edits.index(2), edits.index(3)) - queued_at
+    check(f"其他帖子入队后在第 {position + 1} 个编辑内发出 (帖子 1 积压 30 个)", position <= 3)
+    waited = max(at for kind, message_id, at in sent if message_id in (2, 3) and kind == "edit") - started
+    check(f"其他帖子等待 {waited:.2f}s，不随帖子 1 的积压增长", waited < 1.0)
+
+    await asyncio.gather(*backlog)
+    check("积压的编辑全部发出", len([kind for kind, _, _ in sent if kind == "edit"]) == 32)
+    check("发完后频道排队深度为 0", scheduler.chat_depth(CHANNEL_ID) == 0)
+    await scheduler.stop()
+
+    # 不指定 lane 时按入队顺序发送
+    sent.clear()
+    scheduler = OutboundScheduler(1000, 1000, 60, 16, 0, group_edit_per_minute=6000)
+    scheduler.start()
+    await asyncio.gather(*[scheduler.submit(CHANNEL_ID, Priority.EDIT, edit, message_id) for message_id in range(8)])
+    check("不指定 lane 时按入队顺序", [message_id for _, message_id, _ in sent] == list(range(8)))
+    await scheduler.stop()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
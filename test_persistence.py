@@ -0,0 +1,80 @@
+# test_persistence.py - 检查对话状态和 user_data 的 SQLite 持久化
+
+import asyncio
+import os
+import sys
+import tempfile
+
+from services.persistence import SqlitePersistence, dumps, loads
+from testkit import check, report
+
+# 使用方法：python test_persistence.py
+# 在临时目录中模拟 Application 对持久化的调用顺序 (启动加载 -> 处理前刷新 -> 定期更新 -> 关闭)
+
+
+async def main() -> int:
+    path = os.path.join(tempfile.mkdtemp(prefix="test_persistence_"), "bot_state.db")
+
+    # 第一次运行：用户 1 正在评论，用户 2 正在删除评论
+    persistence = SqlitePersistence(path, update_interval=5)
+    check("启动时不加载 user_data", await persistence.get_user_data() == {})
+    check("没有保存的对话", await persistence.get_conversations("main_conversation") == {})
+
+    user_data = {1: {}, 2: {}}
+    for user_id in user_data:
+        await persistence.refresh_user_data(user_id, user_data[user_id])
+    user_data[1]["commenting_on_message_id"] = 42
+    user_data[2]["delete_mode"] = {"message_id": 42, "comments": [(i, f"评论 {i}" * 20) for i in range(30)]}
+    await asyncio.gather(
+        persistence.update_user_data(1, dict(user_data[1])),
+        persistence.update_user_data(2, dict(user_data[2])),
+        persistence.update_user_data(3, {}),
+        persistence.update_conversation("main_conversation", (1, 1), 4),
+        persistence.update_conversation("main_conversation", (2, 2), 5),
+    )
+    await persistence.flush()
+    check(f"同一轮变更合并为一次写入 ({persistence.writes})", persistence.writes == 1)
+
+    # 重启
+    persistence = SqlitePersistence(path, update_interval=5)
+    check("重启后仍然不预先加载", await persistence.get_user_data() == {})
+    conversations = await persistence.get_conversations("main_conversation")
+    check(f"对话状态恢复 {conversations}", conversations == {(1, 1): 4, (2, 2): 5})
+
+    restored = {}
+    await asyncio.gather(*(persistence.refresh_user_data(1, restored) for _ in range(5)))
+    check("按用户懒加载 user_data", restored == {"commenting_on_message_id": 42})
+    check("并发刷新只读取一次", persistence.stats()["user_loads"] == 1)
+    await persistence.refresh_user_data(1, restored)
+    check("已加载的用户不再读取", persistence.stats()["user_loads"] == 1)
+
+    restored_2 = {}
+    await persistence.refresh_user_data(2, restored_2)
+    check("较大的数据压缩后可以还原", restored_2 == user_data[2])
+
+    # 每个更新都会调用 update_user_data，未变化时不写
+    await persistence.update_user_data(1, dict(restored))
+    await persistence.update_user_data(2, dict(restored_2))
+    check("未变化的 user_data 不写入", persistence.stats()["pending"] == 0 and persistence.skipped == 2)
+
+    # 评论完成：user_data 清空、对话结束
+    await persistence.update_user_data(1, {})
+    await persistence.update_conversation("main_conversation", (1, 1), None)
+    await persistence.flush()
+
+    persistence = SqlitePersistence(path, update_interval=5)
+    await persistence.get_user_data()
+    check("结束的对话被删除", await persistence.get_conversations("main_conversation") == {(2, 2): 5})
+    cleared = {}
+    await persistence.refresh_user_data(1, cleared)
+    check("清空的 user_data 被删除", cleared == {})
+    await persistence.flush()
+
+    check("序列化往返", loads(dumps({"a": (1, 2)})) == {"a": (1, 2)})
+    check("小数据不压缩", dumps({"k": 1})[:1] == b"p")
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,118 @@
+# test_post_cache.py - 热点帖子缓存与数据库切换结果一致性检查
+
+import asyncio
+import os
+import random
+import sys
+import tempfile
+
+from services.post_cache import PostCache
+from storage import ToggleIntent, storage
+from storage.sqlite import SqliteStorage
+from testkit import check, report
+
+# 使用方法：python test_post_cache.py
+# 在临时目录中建两个数据库：一个经由缓存 (只写不读)，一个直接用 storage.apply_toggles
+# (先读后写)，执行同一串随机切换，比较每一步的结果和最终的表内容。
+
+
+async def table(db: SqliteStorage, sql: str) -> list:
+    async with db.pool.read() as conn:
+        cursor = await conn.execute(sql)
+        return sorted(await cursor.fetchall())
+
+
+async def main() -> int:
+    tmp = tempfile.mkdtemp(prefix="test_post_cache_")
+    os.chdir(tmp)  # 全局 storage 的 DB_NAME 是相对路径
+    reference = SqliteStorage(os.path.join(tmp, "reference.db"), 1)
+
+    await storage.open()
+    await reference.open()
+    try:
+        for db in (storage, reference):
+            await db.migrate()
+            for message_id in range(1, 9):
+                await db.add_submission(1, "作者", message_id, f"帖子 {message_id}")
+
+        # 很小的内存上限：只预热一部分，切换过程中会不断淘汰和重新装载
+        cache = PostCache(max_bytes=4000, warm_posts=4)
+        await cache.warm()
+        check("预热后缓存了部分帖子", 0 < cache.stats()["posts"] <= 4)
+
+        rng = random.Random(16)
+        mismatches = 0
+        for _ in range(300):
+            batch = [
+                ToggleIntent(
+                    rng.choice(["react", "react", "collect"]), rng.randint(1, 8), rng.randint(2, 40),
+                    rng.choice([1, -1]), "测试"
+                )
+                for _ in range(rng.randint(1, 8))
+            ]
+            got = await cache.apply_toggles(batch)
+            expected = await reference.apply_toggles(batch)
+            mismatches += got != expected
+        check("每批切换的结果和计数与先读后写一致", mismatches == 0)
+
+        for name, sql in [
+            ("reactions", "SELECT channel_message_id, user_id, reaction_type FROM reactions"),
+            ("collections", "SELECT channel_message_id, user_id FROM collections"),
+            ("post_stats", "SELECT * FROM post_stats"),
+            ("notifications", "SELECT channel_message_id, user_id, notification_type, recipient_id FROM notifications"),
+        ]:
+            check(f"{name} 表内容一致", await table(storage, sql) == await table(reference, sql))
+        check("计数与原始表一致", await storage.reconcile_post_stats() == 0)
+
+        stats = cache.stats()
+        check(f"内存占用不超过上限: {stats}", stats["bytes"] <= 4000 and stats["evictions"] > 0)
+
+        # 命中的帖子不再装载
+        cache = PostCache(max_bytes=1 << 20, warm_posts=8)
+        await cache.warm()
+        await cache.apply_toggles([ToggleIntent("react", message_id, 99, 1) for message_id in range(1, 9)])
+        check("预热后的切换全部命中缓存", cache.stats()["misses"] == 0)
+        check("命中时直接返回元数据", (await cache.get_submission(3)).content_text == "帖子 3")
+
+        # 装载进行中提交评论：快照在评论提交前读出，note_comment 时缓存里还没有这个帖子
+        cache = PostCache(max_bytes=1 << 20, warm_posts=0)
+        load_post_states = storage.load_post_states
+        gate = asyncio.Event()
+
+        async def slow_load(message_ids):
+            states = await load_post_states(message_ids)
+            await gate.wait()
+            return states
+
+        storage.load_post_states = slow_load
+        try:
+            pending = asyncio.create_task(cache.apply_toggles([ToggleIntent("react", 5, 300, 1)]))
+            await asyncio.sleep(0.05)
+            await storage.add_comment(5, 301, "评论者", "装载期间的评论")
+            cache.note_comment(5)
+            gate.set()
+            await pending
+        finally:
+            del storage.load_post_states
+        comments = (await storage.get_post_stats(5))["comments"]
+        check(f"装载期间的评论不丢失 ({comments})", (await cache.get_post_stats(5))["comments"] == comments == 1)
+
+        # 快照已包含评论并放入缓存后才调用 note_comment：不重复计数
+        await storage.add_comment(6, 301, "评论者", "装载之后的评论")
+        await cache.apply_toggles([ToggleIntent("react", 6, 300, 1)])
+        cache.note_comment(6)
+        check("已计入快照的评论不重复计数", (await cache.get_post_stats(6))["comments"] == 1)
+
+        # 丢弃后的帖子在下次切换时重新装载，计数与数据库一致
+        got = await cache.apply_toggles([ToggleIntent("react", 5, 302, 1), ToggleIntent("react", 6, 302, 1)])
+        expected = {message_id: await storage.get_post_stats(message_id) for message_id in (5, 6)}
+        check("重新装载后切换结果正确", got[1] == expected)
+    finally:
+        await storage.close()
+        await reference.close()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,100 @@
+# test_slow_queries.py - 检查慢查询日志：阈值、参数形状、执行计划缓存、汇总表和管理群命令
+
+import asyncio
+import logging
+import os
+import sys
+import tempfile
+
+from telegram import Update
+from telegram.ext import filters
+
+from services.slow_queries import SlowQueryLog, param_shape, slow_queries
+from storage.sqlite import DatabasePool
+from testkit import check, report
+
+# 使用方法：python test_slow_queries.py
+# 不需要连接 Telegram；在临时目录中建库，阈值设为 0.001ms 让每条语句都算慢查询
+
+
+class Captured(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def command(chat_id: int, text: str) -> Update:
+    user = {"id": 7, "is_bot": False, "first_name": "u7"}
+    return Update.de_json({
+        "update_id": 1,
+        "message": {
+            "message_id": 1, "date": 0, "from": user, "text": text,
+            "chat": {"id": chat_id, "type": "supergroup", "title": "审核群"},
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}],
+        },
+    }, None)
+
+
+async def main() -> int:
+    check("参数形状只含类型和长度", param_shape((1, "秘密评论内容", None)) == "(int, str[6], null)")
+    check("executemany 的参数形状", param_shape([(1, "a"), (2, "bb")], many=True) == "2 × (int, str[1])")
+    check("阈值为 0 时关闭", not SlowQueryLog(0, 10).is_slow(3600))
+
+    slow_queries.threshold = 0.001 / 1000
+    captured = Captured()
+    logging.getLogger("services.slow_queries").addHandler(captured)
+
+    path = os.path.join(tempfile.mkdtemp(prefix="test_slow_queries_"), "s.db")
+    pool = DatabasePool(path, reader_count=1)
+    await pool.open()
+    async with pool.write() as db:
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+        await db.executemany("INSERT INTO t (v) VALUES (?)", [("秘密评论内容",), ("b",)])
+    for _ in range(3):
+        async with pool.read() as db:
+            cursor = await db.execute("SELECT v FROM t WHERE v = ?", ("秘密评论内容",))
+            await cursor.fetchall()
+    await pool.close()
+
+    table = {entry.sql: entry for entry in slow_queries.top(10)}
+    select = table.get("SELECT v FROM t WHERE v = ?")
+    check("慢语句按归一化文本汇总", select is not None and select.count == 3)
+    check("第一次变慢时捕获执行计划", select is not None and any("SCAN" in line for line in select.plan or []))
+    plan_logs = [m for m in captured.messages if "执行计划" in m and "SELECT v FROM t" in m]
+    check("执行计划只记录一次", len(plan_logs) == 1)
+    check("日志中不出现参数取值", not any("秘密评论内容" in m for m in captured.messages))
+    insert = table.get("INSERT INTO t (v) VALUES (?)")
+    check("executemany 记录行数和形状", insert is not None and insert.last_shape == "2 × (str[6])")
+
+    report = slow_queries.report(2)
+    check("汇总表按最大耗时截取前 N 条", report.count("最大 ") == 2 and "<pre>" in report)
+
+    # 容量：超出时淘汰最大耗时最小的语句
+    small = SlowQueryLog(0.001, 2)
+    await small.record("SELECT a FROM t", None, 0.5)
+    await small.record("SELECT b FROM t", None, 0.1)
+    await small.record("SELECT c FROM t", None, 0.3)
+    check("超出容量时淘汰最快的语句", [entry.sql for entry in small.top(5)] == ["SELECT a FROM t", "SELECT c FROM t"])
+
+    # 执行计划获取失败不影响记录
+    async def broken():
+        raise RuntimeError("no plan")
+    await small.record("SELECT x FROM y", (1,), 0.9, broken)
+    check("执行计划失败时记录原因", "no plan" in small.top(1)[0].plan[0])
+
+    slow_queries.reset()
+    check("reset 清空汇总表", "暂无慢查询" in slow_queries.report(5))
+
+    # 管理命令 (main.py 中注册) 只在管理群中响应
+    admin_only = filters.COMMAND & filters.Chat(-1002)
+    check("管理群中响应 /slowqueries", bool(admin_only.check_update(command(-1002, "/slowqueries 5"))))
+    check("其他群不响应", not admin_only.check_update(command(-1003, "/slowqueries")))
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,245 @@
+# test_storage.py - 存储层契约测试 (SQLite + PostgreSQL)
+
+import asyncio
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+from storage.base import PostCacheStorage, ToggleIntent, decide_toggle
+from storage.sqlite import SqliteStorage
+from testkit import check, report
+
+# 使用方法：
+# python test_storage.py
+#
+# SQLite 使用临时文件；PostgreSQL 按以下顺序选择：
+#   1. 环境变量 TEST_PG_DSN 指定的现有数据库 (会清空其中的表)
+#   2. 用 initdb/pg_ctl (PATH 或环境变量 PG_BIN 指定的目录) 启动一个临时实例，测试后删除
+# 两者都不可用时跳过 PostgreSQL。
+
+
+async def run_contract(storage) -> None:
+    """对一个存储实现跑完整的契约测试"""
+    print(f"\n=== {storage.name} ===")
+    await storage.open()
+    try:
+        version = await storage.migrate()
+        check(f"迁移完成 (v{version})", version >= 5)
+        check("重复迁移不报错", await storage.migrate() == version)
+        check("只有单进程后端提供热点帖子缓存接口", isinstance(storage, PostCacheStorage) == (storage.name == "sqlite"))
+
+        # 投稿
+        await storage.add_submission(1, "作者", 100, "第一条")
+        await storage.add_submission(1, "作者", 101, "第二条")
+        await storage.add_submission(1, "作者", 102, "第三条")
+        submission = await storage.get_submission(100)
+        check("读取投稿", submission is not None and submission.user_id == 1 and submission.content_text == "第一条")
+        check("不存在的投稿返回 None", await storage.get_submission(999) is None)
+        check("投稿计数", await storage.count_user_submissions(1) == 3)
+        check("新投稿计数为 0", await storage.get_post_stats(100) == {"likes": 0, "dislikes": 0, "collections": 0, "comments": 0})
+
+        # 游标分页 (同一秒内的投稿依靠 id 排序)
+        first = await storage.page_user_submissions(1, 253402300799, 2 ** 62, 2, False)
+        check("第一页按时间倒序", [row.channel_message_id for row in first] == [102, 101])
+        after = await storage.page_user_submissions(1, first[-1].cursor_ts, first[-1].cursor_id, 2, False)
+        check("下一页", [row.channel_message_id for row in after] == [100])
+        before = await storage.page_user_submissions(1, after[0].cursor_ts, after[0].cursor_id, 2, True)
+        check("上一页按时间正序", [row.channel_message_id for row in before] == [101, 102])
+        check("游标时间戳为整数秒", isinstance(first[0].cursor_ts, int) and abs(first[0].cursor_ts - time.time()) < 3600)
+
+        # 点赞/踩/收藏切换
+        outcomes, counts = await storage.apply_toggles([
+            ToggleIntent('react', 100, 2, 1),
+            ToggleIntent('react', 100, 3, -1),
+            ToggleIntent('collect', 101, 2),
+            ToggleIntent('react', 101, 3, 1),
+        ])
+        check("点赞触发通知与置顶检查", tuple(outcomes[0]) == ("like", True))
+        check("踩不触发通知", tuple(outcomes[1]) == (None, False))
+        check("收藏触发通知", tuple(outcomes[2]) == ("collect", False))
+        check("批次计数", counts[100]["likes"] == 1 and counts[100]["dislikes"] == 1 and counts[101]["collections"] == 1)
+
+        outcomes, counts = await storage.apply_toggles([
+            ToggleIntent('react', 100, 2, 1),     # 取消赞
+            ToggleIntent('react', 100, 3, 1),     # 踩 -> 赞
+            ToggleIntent('collect', 101, 2),      # 取消收藏
+        ])
+        check("取消赞不通知", tuple(outcomes[0]) == (None, False))
+        check("踩切换为赞", tuple(outcomes[1]) == ("like", True))
+        check("切换后的计数", counts[100] == {"likes": 1, "dislikes": 0, "collections": 0, "comments": 0})
+        check("取消收藏", counts[101]["collections"] == 0)
+
+        await storage.apply_toggles([ToggleIntent('collect', 102, 5), ToggleIntent('collect', 100, 5)])
+        check("收藏计数", await storage.count_user_collections(5) == 2)
+        collections = await storage.page_user_collections(5, 253402300799, 2 ** 62, 10, False)
+        check("收藏分页", [row.channel_message_id for row in collections] == [100, 102])
+
+        # 随机切换序列：结果和计数与只用 decide_toggle 推演的模型一致 (帖子 ID 超出 int4 范围)
+        rng = random.Random(9)
+        big = 2 ** 40
+        state, expected, same = {}, {big: {}, big + 1: {}}, True
+        for _ in range(8):
+            batch = [ToggleIntent(rng.choice(['react', 'collect']), rng.choice([big, big + 1]), rng.randint(1, 3),
+                                  rng.choice([1, -1])) for _ in range(rng.randint(1, 6))]
+            outcomes, _ = await storage.apply_toggles(batch)
+            for intent, outcome in zip(batch, outcomes):
+                key = (intent.action, intent.message_id, intent.user_id)
+                state[key], deltas, model = decide_toggle(intent, state.get(key, 0))
+                for name, delta in deltas.items():
+                    expected[intent.message_id][name] = expected[intent.message_id].get(name, 0) + delta
+                same = same and outcome == model
+        check("切换结果与 decide_toggle 一致", same)
+        stats = {mid: await storage.get_post_stats(mid) for mid in expected}
+        check("切换计数与 decide_toggle 一致", all(
+            stats[mid][name] == count for mid, deltas in expected.items() for name, count in deltas.items()))
+
+        # 评论
+        await storage.add_comment(100, 2, "评论者", "沙发")
+        await storage.add_comment(100, 3, "路人", "板凳")
+        await storage.add_comment(100, 2, "评论者", "再来一条")
+        preview = await storage.get_comment_preview(100, 2)
+        check("评论预览按时间正序", [c.comment_text for c in preview] == ["沙发", "板凳"])
+        check("评论总数", await storage.count_comments(100) == 3)
+        mine = await storage.list_user_comments(100, 2)
+        check("自己的评论按时间倒序", [c.comment_text for c in mine] == ["再来一条", "沙发"])
+        others = await storage.list_other_comments(100, 2)
+        check("其他人的评论", [c.user_name for c in others] == ["路人"])
+        info = await storage.get_comment_for_delete(mine[0].id)
+        check("删除前的权限信息", info is not None and info.user_id == 2 and info.post_author_id == 1 and info.channel_message_id == 100)
+        check("删除评论", await storage.delete_comment(mine[0].id))
+        check("重复删除返回 False", not await storage.delete_comment(mine[0].id))
+        check("评论计数同步", (await storage.get_post_stats(100))["comments"] == 2)
+
+        # 计数校准
+        check("计数无偏差", await storage.reconcile_post_stats() == 0)
+
+        # 通知发件箱 (互动/评论时在同一事务内写入)
+        await storage.apply_toggles([ToggleIntent('react', 100, 1, 1, "作者")])   # 给自己点赞不通知
+        await storage.apply_toggles([ToggleIntent('react', 100, 1, 1, "作者")])
+        now = int(time.time()) + 1
+        rows = await storage.claim_notifications(now, now + 60, 100)
+        keys = {(row.channel_message_id, row.actor_id, row.notification_type) for row in rows}
+        check("通知按 (帖子, 用户, 类型) 去重写入", keys == {
+            (100, 2, "like"), (100, 3, "like"), (101, 2, "collect"), (101, 3, "like"),
+            (102, 5, "collect"), (100, 5, "collect"), (100, 2, "comment"), (100, 3, "comment"),
+        })
+        check("通知发给帖子作者", {row.recipient_id for row in rows} == {1})
+        comment_row = next(row for row in rows if row.notification_type == "comment" and row.actor_id == 2)
+        check("评论通知取最新内容", comment_row.payload == {"actor_name": "评论者", "comment_text": "再来一条"})
+        check("租约期内不会被重复认领", await storage.claim_notifications(now, now + 60, 100) == [])
+
+        like_row = next(row for row in rows if row.notification_type == "like" and row.actor_id == 2)
+        check("标记已送达", await storage.complete_notification(like_row.id, like_row.lease_until, now))
+        check("重复标记返回 False", not await storage.complete_notification(like_row.id, like_row.lease_until, now))
+        retry_row = next(row for row in rows if row.notification_type == "collect" and row.actor_id == 2)
+        await storage.fail_notification(retry_row.id, retry_row.lease_until, "网络错误", now + 10)
+        give_up_row = next(row for row in rows if row.notification_type == "collect" and row.actor_id == 5 and row.channel_message_id == 102)
+        await storage.fail_notification(give_up_row.id, give_up_row.lease_until, "Forbidden", None)
+
+        await storage.apply_toggles([ToggleIntent('react', 100, 2, 1, "评论者")])  # 取消后再赞
+        await storage.apply_toggles([ToggleIntent('react', 100, 2, 1, "评论者")])
+        await storage.add_comment(100, 2, "评论者", "第三条")                       # 新评论重新置为待发送
+        check("新评论在租约期内重新可认领", [
+            (row.notification_type, row.payload.get("comment_text")) for row in await storage.claim_notifications(now, now + 61, 100)
+        ] == [("comment", "第三条")])
+        check("旧租约不能完成被重新置为待发送的通知", not await storage.complete_notification(comment_row.id, comment_row.lease_until, now))
+
+        later = now + 61
+        again = await storage.claim_notifications(later, later + 60, 100)
+        check("租约到期后重新认领 (已送达/已放弃的除外)", {(row.channel_message_id, row.actor_id, row.notification_type) for row in again} == {
+            (100, 3, "like"), (101, 2, "collect"), (101, 3, "like"), (100, 5, "collect"), (100, 2, "comment"), (100, 3, "comment"),
+        })
+        check("失败次数累计", next(row for row in again if row.id == retry_row.id).attempts == 1)
+
+        # 置顶去重
+        check("未置顶", not await storage.is_pinned(100))
+        check("记录置顶", await storage.record_pin(100, 100))
+        check("重复置顶被忽略", not await storage.record_pin(100, 120))
+        check("已置顶", await storage.is_pinned(100))
+
+        # 用户目录
+        await storage.upsert_users([(7, "old", "旧名字", "2024-01-01 00:00:00")])
+        await storage.upsert_users([(7, "new", "新名字", "2024-01-02 00:00:00"), (8, "", "", "2024-01-02 00:00:00")])
+        user = await storage.get_user(7)
+        check("用户目录 UPSERT", user is not None and tuple(user) == ("new", "新名字"))
+        check("未知用户返回 None", await storage.get_user(9) is None)
+
+        # 热点查询执行计划
+        problems = await storage.check_query_plans()
+        check("热点查询命中索引", not problems)
+    finally:
+        await storage.close()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_temp_postgres():
+    """启动一个临时 PostgreSQL 实例，返回 (dsn, 清理函数)；无法启动时返回 (None, None)"""
+    pg_bin = os.environ.get("PG_BIN")
+    initdb = os.path.join(pg_bin, "initdb") if pg_bin else shutil.which("initdb")
+    pg_ctl = os.path.join(pg_bin, "pg_ctl") if pg_bin else shutil.which("pg_ctl")
+    if not initdb or not os.path.exists(initdb):
+        return (None, None)
+
+    datadir = tempfile.mkdtemp(prefix="pyouq_pg_")
+    port = _free_port()
+    try:
+        subprocess.run([initdb, "-D", datadir, "-U", "postgres", "-A", "trust"], check=True, capture_output=True)
+        subprocess.run(
+            [pg_ctl, "-D", datadir, "-o", f"-p {port} -k {datadir} -h 127.0.0.1", "-l", os.path.join(datadir, "log"), "-w", "start"],
+            check=True, capture_output=True
+        )
+    except subprocess.CalledProcessError as e:
+        print(f"⚠️ 无法启动临时 PostgreSQL: {e.stderr.decode(errors='replace').strip()}")
+        shutil.rmtree(datadir, ignore_errors=True)
+        return (None, None)
+
+    def cleanup():
+        subprocess.run([pg_ctl, "-D", datadir, "-m", "immediate", "stop"], capture_output=True)
+        shutil.rmtree(datadir, ignore_errors=True)
+
+    return (f"postgresql://postgres@127.0.0.1:{port}/postgres", cleanup)
+
+
+async def reset_postgres(dsn: str) -> None:
+    """清空测试库中的所有表"""
+    import asyncpg
+    conn = await asyncpg.connect(dsn)
+    try:
+        await conn.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+    finally:
+        await conn.close()
+
+
+async def main() -> int:
+    with tempfile.TemporaryDirectory() as tmp:
+        await run_contract(SqliteStorage(os.path.join(tmp, "test.db"), 2))
+
+    dsn, cleanup = os.environ.get("TEST_PG_DSN"), None
+    if not dsn:
+        dsn, cleanup = start_temp_postgres()
+    if dsn:
+        from storage.postgres import PostgresStorage
+        try:
+            await reset_postgres(dsn)
+            await run_contract(PostgresStorage(dsn, 1, 4))
+        finally:
+            if cleanup:
+                cleanup()
+    else:
+        print("\n⚠️ 未找到 PostgreSQL (设置 TEST_PG_DSN 或 PG_BIN)，跳过。")
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
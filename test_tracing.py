@@ -0,0 +1,176 @@
+# test_tracing.py - 检查更新追踪：采样、contextvars 传播 (数据库、API、派生任务、发送调度)、JSON 行输出和 trace_view
+
+import asyncio
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+from telegram import Update
+from telegram.request import BaseRequest
+
+import trace_view
+from services.metrics import InstrumentedRequest
+from services.outbound import Priority, outbound
+from services.tracing import traced, tracer
+from services.update_processor import KeyedUpdateProcessor
+from storage.sqlite import DatabasePool
+from testkit import check, report
+
+# 使用方法：python test_tracing.py
+# 不需要连接 Telegram；trace 写入临时目录
+
+
+class SlowRequest(BaseRequest):
+    """每次调用等待 5ms，返回空结果"""
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        await asyncio.sleep(0.005)
+        return 200, b'{"ok": true, "result": true}'
+
+
+def click(update_id: int) -> Update:
+    user = {"id": 7, "is_bot": False, "first_name": "u7"}
+    return Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": "1", "from": user, "chat_instance": "1", "data": "x",
+            "message": {"message_id": 3, "date": 0, "chat": {"id": -1001, "type": "channel", "title": "c"}},
+        },
+    }, None)
+
+
+def read_events(path: str):
+    tracer.flush()
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+async def main() -> int:
+    directory = tempfile.mkdtemp(prefix="test_tracing_")
+    tracer.path = os.path.join(directory, "traces.jsonl")
+
+    # 关闭时：不产生任何 span，span() 返回空的上下文管理器
+    tracer.sample_rate = 0
+    with tracer.start_update(1, "update.test") as root:
+        with tracer.span("child") as child:
+            pass
+    check("采样率为 0 时不追踪", root is None and child is None and not os.path.exists(tracer.path))
+
+    tracer.sample_rate = 1.0
+    pool = DatabasePool(os.path.join(directory, "t.db"), reader_count=1)
+    await pool.open()
+    async with pool.write() as db:
+        await db.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, v TEXT)")
+    request = InstrumentedRequest(SlowRequest())
+
+    @traced("lookup")
+    async def lookup():
+        async with pool.read() as db:
+            cursor = await db.execute("SELECT v FROM t WHERE id = 5")
+            await cursor.fetchone()
+
+    async def side_task():
+        await request.do_request("https://api.telegram.org/bot1:x/pinChatMessage", "POST")
+
+    outbound.start()
+    processor = KeyedUpdateProcessor(8)
+
+    async def handler():
+        await lookup()
+        # 派生的任务复制上下文，结束在根 span 之后也归属这次更新
+        asyncio.get_running_loop().create_task(side_task())
+        # 发送调度在自己的任务中执行调用，span 随任务传递
+        await outbound.submit(-1001, Priority.EDIT, request.do_request,
+                              "https://api.telegram.org/bot1:x/editMessageCaption", "POST")
+
+    await processor.process_update(click(42), handler())
+    await asyncio.sleep(0.05)
+    await outbound.stop()
+    await pool.close()
+
+    events = read_events(tracer.path)
+    by_name = {event["name"]: event for event in events}
+    check("每行都是 Chrome 的完整事件 (ph=X, 微秒时间戳)", all(
+        event["ph"] == "X" and isinstance(event["ts"], int) and isinstance(event["dur"], int) for event in events))
+    root = by_name.get("update.callback_query")
+    check("根 span 以 update_id 为 pid，包含排队时间",
+          root is not None and root["pid"] == 42 and "parent" not in root["args"])
+    check("所有 span 都属于这次更新", {(event["pid"], event["args"]["trace"]) for event in events}
+          == {(42, root["args"]["trace"])})
+    sql = by_name.get("SELECT v FROM t WHERE id = ?")
+    check("数据库语句是 lookup 的子 span",
+          sql is not None and sql["cat"] == "sql" and sql["args"]["parent"] == by_name["lookup"]["args"]["span"])
+    pin = by_name.get("pinChatMessage")
+    check("派生任务中的 API 调用在另一个通道", pin is not None and pin["tid"] != 0 and pin["cat"] == "telegram")
+    outbound_span = by_name.get("outbound.do_request")
+    edit = by_name.get("editMessageCaption")
+    check("发送调度中的 API 调用是入队 span 的子 span",
+          edit is not None and outbound_span is not None
+          and edit["args"]["parent"] == outbound_span["args"]["span"] and edit["tid"] != outbound_span["tid"])
+    check("子 span 在父 span 的时间范围内",
+          outbound_span["ts"] <= edit["ts"] and edit["ts"] + edit["dur"] <= outbound_span["ts"] + outbound_span["dur"] + 1)
+
+    # 未采样的更新：数据库和 API 调用不产生 span
+    count = len(events)
+    tracer.sample_rate = 1e-9
+    await processor.process_update(click(43), side_task())
+    check("未采样的更新不写入", len(read_events(tracer.path)) == count)
+
+    # 采样率
+    tracer.sample_rate = 0.25
+    sampled = tracer.sampled
+    for update_id in range(1000, 5000):
+        with tracer.start_update(update_id, "update.test"):
+            pass
+    rate = (tracer.sampled - sampled) / 4000
+    check(f"按采样率采样 ({rate:.1%})", 0.2 < rate < 0.3)
+
+    # 开销：未采样的更新中 span() / record() 只读一次 ContextVar
+    count = 100_000
+    started = time.perf_counter()
+    for _ in range(count):
+        with tracer.span("noop"):
+            tracer.record("SELECT 1", "sql", started, 0.0)
+    per_call = (time.perf_counter() - started) / count * 1e6
+    check(f"未采样时每次 span + record 开销 {per_call:.2f} µs", per_call < 5)
+
+    # trace_view：时间线和 Perfetto 格式
+    traces = trace_view.load(tracer.path)
+    trace_id = trace_view.find(traces, 42)
+    output = io.StringIO()
+    with redirect_stdout(output):
+        trace_view.print_timeline(traces[trace_id])
+    lines = output.getvalue().splitlines()
+    lookup_line = next(line for line in lines if line.endswith(" lookup"))
+    sql_line = next(line for line in lines if "SELECT v FROM t" in line)
+    check("时间线按父子关系缩进", sql_line.index("SELECT") == lookup_line.index("lookup") + 2)
+    chrome_path = os.path.join(directory, "chrome.json")
+    with redirect_stdout(io.StringIO()):
+        trace_view.write_chrome({trace_id: traces[trace_id]}, chrome_path)
+    with open(chrome_path, encoding="utf-8") as f:
+        chrome = json.load(f)
+    check("Perfetto 格式包含进程名和全部 span",
+          any(event["ph"] == "M" and event["name"] == "process_name" for event in chrome["traceEvents"])
+          and sum(1 for event in chrome["traceEvents"] if event["ph"] == "X") == len(traces[trace_id]))
+    tracer.close()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,116 @@
+# test_update_processor.py - 检查按键排序的并发更新处理器
+
+import asyncio
+import sys
+import time
+
+from telegram import Update
+
+from services.update_processor import KeyedUpdateProcessor, update_key
+from testkit import check, report
+
+# 使用方法：python test_update_processor.py
+# 不需要连接 Telegram，也不读写数据库
+
+CHANNEL_ID = -1001
+
+
+def channel_click(update_id: int, message_id: int, user_id: int) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+    return Update.de_json({
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "1",
+            "data": "react:like",
+            "message": {
+                "message_id": message_id,
+                "date": 0,
+                "chat": {"id": CHANNEL_ID, "type": "channel", "title": "频道"},
+            },
+        },
+    }, None)
+
+
+def private_message(update_id: int, user_id: int, text: str) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": f"u{user_id}"}
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": text,
+        },
+    }, None)
+
+
+async def run(processor: KeyedUpdateProcessor, updates, delays) -> list:
+    """按顺序提交更新 (与 Application 一样每个更新一个任务)，返回完成顺序"""
+    finished = []
+
+    async def handle(update: Update, delay: float):
+        await asyncio.sleep(delay)
+        finished.append(update.update_id)
+
+    tasks = [
+        asyncio.create_task(processor.process_update(update, handle(update, delay)))
+        for update, delay in zip(updates, delays)
+    ]
+    await asyncio.gather(*tasks)
+    return finished
+
+
+async def main() -> int:
+    # 顺序键
+    check("同一用户在同一频道帖子上的点击使用同一个键",
+          update_key(channel_click(1, 42, 7)) == update_key(channel_click(2, 42, 7)))
+    check("不同用户在同一频道帖子上的点击使用不同的键",
+          update_key(channel_click(1, 42, 7)) != update_key(channel_click(2, 42, 8)))
+    check("不同频道帖子的点击使用不同的键",
+          update_key(channel_click(1, 42, 7)) != update_key(channel_click(2, 43, 7)))
+    check("同一用户的私聊消息使用同一个键",
+          update_key(private_message(1, 7, "a")) == update_key(private_message(2, 7, "b")))
+
+    # 同一用户连点同一帖子：先到的慢更新完成后才处理后到的快更新
+    processor = KeyedUpdateProcessor(8)
+    finished = await run(processor, [channel_click(1, 42, 7), channel_click(2, 42, 7)], [0.05, 0])
+    check(f"同一用户在同一帖子上的点击按到达顺序处理: {finished}", finished == [1, 2])
+
+    # 同一用户的私聊同样按顺序
+    finished = await run(processor, [private_message(3, 7, "a"), private_message(4, 7, "b")], [0.05, 0])
+    check(f"同一用户的私聊按到达顺序处理: {finished}", finished == [3, 4])
+
+    # 不同帖子并发：慢更新不阻塞其他帖子
+    finished = await run(processor, [channel_click(5, 42, 7), channel_click(6, 43, 7)], [0.05, 0])
+    check(f"不同帖子并发处理: {finished}", finished == [6, 5])
+
+    # 热门帖子：不同用户的点击 (处理中等待 API 调用) 并发，不在帖子上排成一队
+    processor = KeyedUpdateProcessor(32)
+    start = time.perf_counter()
+    await run(processor, [channel_click(40 + i, 42, 100 + i) for i in range(20)], [0.05] * 20)
+    elapsed = time.perf_counter() - start
+    check(f"同一帖子上 20 个用户的 50ms 点击用时 {elapsed * 1000:.0f}ms (串行需要 1000ms)", elapsed < 0.15)
+
+    # 并发上限：4 个名额处理 8 个互不相关的更新，至少需要两轮
+    processor = KeyedUpdateProcessor(4)
+    start = time.perf_counter()
+    await run(processor, [channel_click(10 + i, 100 + i, 7) for i in range(8)], [0.05] * 8)
+    elapsed = time.perf_counter() - start
+    check(f"并发上限生效: 8 个 50ms 更新用时 {elapsed * 1000:.0f}ms", 0.1 <= elapsed < 0.2)
+
+    # 同一键排队时不占用并发名额
+    processor = KeyedUpdateProcessor(2)
+    updates = [channel_click(20 + i, 42, 7) for i in range(5)] + [private_message(30, 7, "hi")]
+    finished = await run(processor, updates, [0.05] * 5 + [0])
+    check(f"同一用户的连续点击排队时其他更新不被阻塞: {finished}", finished.index(30) == 0)
+    stats = processor.stats()
+    check(f"队列已清空: {stats}", stats["active_keys"] == 0 and stats["max_key_depth"] == 5)
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
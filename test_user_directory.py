@@ -0,0 +1,73 @@
+# test_user_directory.py - 检查用户目录写缓冲：关闭时正在进行的刷新不丢数据、被取消的刷新放回缓冲
+
+import asyncio
+import os
+import sys
+import tempfile
+
+from telegram import User
+
+from services.user_directory import UserDirectory
+from storage import storage
+from testkit import check, report
+
+# 使用方法：python test_user_directory.py
+# 在临时目录中建库；upsert_users 包装成慢速版本，让关闭/取消发生在写入途中
+
+
+async def main() -> int:
+    os.chdir(tempfile.mkdtemp(prefix="test_user_directory_"))  # 全局 storage 的 DB_NAME 是相对路径
+    await storage.open()
+    await storage.migrate()
+
+    upsert = storage.upsert_users
+    started = asyncio.Event()
+
+    async def slow_upsert(rows):
+        started.set()
+        await asyncio.sleep(0.2)
+        await upsert(rows)
+
+    storage.upsert_users = slow_upsert
+    try:
+        # 关闭：刷新进行到一半时调用 stop()，这批和之后登记的都要写入
+        directory = UserDirectory(flush_interval=60, max_buffer=3)
+        directory.start()
+        for user_id in (1, 2, 3):
+            directory.record(User(user_id, f"用户{user_id}", False, username=f"u{user_id}"))
+        await asyncio.wait_for(started.wait(), 1)
+        directory.record(User(4, "用户4", False))
+        await directory.stop()
+        saved = [await storage.get_user(user_id) for user_id in (1, 2, 3, 4)]
+        check("关闭时进行中的刷新写完", all(row is not None for row in saved[:3]))
+        check("关闭前登记的用户也写入", saved[3] is not None)
+        check("关闭后缓冲为空", not directory._buffer)
+
+        # 取消：被取消的刷新把批次放回缓冲，下一次刷新写入
+        started.clear()
+        directory.record(User(5, "用户5", False))
+        flush = asyncio.create_task(directory.flush())
+        await asyncio.wait_for(started.wait(), 1)
+        flush.cancel()
+        try:
+            await flush
+        except asyncio.CancelledError:
+            pass
+        check("被取消的批次放回缓冲", 5 in directory._buffer)
+        await directory.flush()
+        check("下一次刷新写入", await storage.get_user(5) is not None)
+
+        # stop() 之后可以重新 start()
+        directory.start()
+        directory.record(User(6, "用户6", False))
+        await directory.stop()
+        check("重新启动后正常关闭", await storage.get_user(6) is not None)
+    finally:
+        storage.upsert_users = upsert
+        await storage.close()
+
+    return report()
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -0,0 +1,69 @@
+# test_webhook.py - 向本地 webhook 服务器发送录制的更新
+
+import asyncio
+import json
+import sys
+import time
+
+import aiohttp
+
+from config import WEBHOOK_PORT, WEBHOOK_PATH, WEBHOOK_SECRET, HEALTH_PATH
+from services.webhook_server import SECRET_HEADER
+
+# 使用方法：
+# 1. BOT_MODE=webhook WEBHOOK_SECRET=xxx (不设置 WEBHOOK_URL) 启动 python main.py
+# 2. python test_webhook.py [update1.json update2.json ...]
+#    不指定文件时发送一个内置的 /start 私聊消息。
+#    每个文件可以是单个 Update 对象，也可以是 Update 数组。
+
+
+def sample_update() -> dict:
+    now = int(time.time())
+    user = {"id": 10001, "is_bot": False, "first_name": "测试", "username": "webhook_test"}
+    return {
+        "update_id": now,
+        "message": {
+            "message_id": 1,
+            "date": now,
+            "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+            "from": user,
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def load_updates(paths) -> list:
+    updates = []
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        updates.extend(data if isinstance(data, list) else [data])
+    return updates
+
+
+async def main(paths) -> int:
+    base = f"http://127.0.0.1:{WEBHOOK_PORT}"
+    updates = load_updates(paths) if paths else [sample_update()]
+    failed = 0
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(base + HEALTH_PATH) as resp:
+            body = await resp.json()
+            print(f"{'✅' if resp.status == 200 else '❌'} 健康检查 {resp.status}: {body}")
+            failed += resp.status != 200
+
+        async with session.post(base + WEBHOOK_PATH, json=updates[0], headers={SECRET_HEADER: "wrong"}) as resp:
+            print(f"{'✅' if resp.status == 403 else '❌'} 错误的 secret 被拒绝: {resp.status}")
+            failed += resp.status != 403
+
+        for update in updates:
+            async with session.post(base + WEBHOOK_PATH, json=update, headers={SECRET_HEADER: WEBHOOK_SECRET}) as resp:
+                print(f"{'✅' if resp.status == 200 else '❌'} update_id={update.get('update_id')}: {resp.status}")
+                failed += resp.status != 200
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main(sys.argv[1:])))
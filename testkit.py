@@ -0,0 +1,18 @@
+# testkit.py - 测试脚本共用的检查与汇总
+
+from typing import List
+
+failures: List[str] = []
+
+
+def check(name: str, condition: bool) -> None:
+    """打印一项检查的结果，失败的记入 failures"""
+    print(f"{'✅' if condition else '❌'} {name}")
+    if not condition:
+        failures.append(name)
+
+
+def report() -> int:
+    """打印汇总并返回退出码 (有失败时为 1)"""
+    print(f"\n{'❌ 失败 ' + str(len(failures)) + ' 项' if failures else '✅ 全部通过'}")
+    return 1 if failures else 0
@@ -0,0 +1,154 @@
+# trace_view.py
+"""
+查看更新追踪 (TRACE_SAMPLE_RATE > 0 时写入的 traces.jsonl，每个 span 一行)
+
+- 默认列出最慢的被采样更新：总耗时、span 数、数据库语句数和 API 调用数
+  (同一 update_id 出现多次 (如机器人重启后) 时按 trace id 分开，--update 取最后一次)
+- --update ID 打印一个更新的时间线 (相对更新开始的偏移、耗时、按父子关系缩进)；
+  --slowest 打印最慢的那个。通道号 > 0 的 span 在派生的任务中执行 (编辑合并、后台任务、发送调度、写队列)
+- --chrome 输出 Chrome Trace Event 格式的 JSON，可以在 https://ui.perfetto.dev 或 chrome://tracing 中打开；
+  每个更新显示为一个进程，每个通道为一个线程
+
+用法: python trace_view.py [traces.jsonl] [--top 20] [--update ID | --slowest] [--chrome trace.json]
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+
+def load(path: str) -> Dict[str, List[dict]]:
+    """按 trace id 分组读取 span (按文件中的顺序)；写了一半的行跳过"""
+    traces: Dict[str, List[dict]] = defaultdict(list)
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            traces[event["args"]["trace"]].append(event)
+    return traces
+
+
+def find(traces: Dict[str, List[dict]], update_id: int) -> Optional[str]:
+    """update_id 对应的最后一个 trace"""
+    found = None
+    for trace_id, events in traces.items():
+        if events[0]["pid"] == update_id:
+            found = trace_id
+    return found
+
+
+def root_of(events: List[dict]) -> dict:
+    for event in events:
+        if "parent" not in event["args"]:
+            return event
+    # 根 span 还没写入 (更新仍在处理) 时用最早的 span 代替
+    return min(events, key=lambda event: event["ts"])
+
+
+def summarize(events: List[dict]) -> dict:
+    root = root_of(events)
+    end = max(event["ts"] + event["dur"] for event in events)
+    return {
+        "update_id": root["pid"],
+        "name": root["name"],
+        "total_ms": (end - root["ts"]) / 1000,
+        "root_ms": root["dur"] / 1000,
+        "spans": len(events),
+        "sql": sum(1 for event in events if event["cat"] == "sql"),
+        "api": sum(1 for event in events if event["cat"] == "telegram"),
+    }
+
+
+def print_top(traces: Dict[str, List[dict]], top: int) -> None:
+    rows = sorted((summarize(events) for events in traces.values()),
+                  key=lambda row: row["total_ms"], reverse=True)[:top]
+    print(f"{'update_id':>12}  {'更新':<24} {'处理(ms)':>9} {'含后续(ms)':>10} {'span':>5} {'SQL':>4} {'API':>4}")
+    for row in rows:
+        print(f"{row['update_id']:>12}  {row['name']:<24} {row['root_ms']:>9.1f} {row['total_ms']:>10.1f} "
+              f"{row['spans']:>5} {row['sql']:>4} {row['api']:>4}")
+
+
+def print_timeline(events: List[dict]) -> None:
+    root = root_of(events)
+    children: Dict[int, List[dict]] = defaultdict(list)
+    ids = {event["args"]["span"] for event in events}
+    orphans = []
+    for event in events:
+        parent = event["args"].get("parent")
+        if event is root:
+            continue
+        if parent in ids:
+            children[parent].append(event)
+        else:
+            orphans.append(event)
+
+    print(f"更新 {root['pid']}: {root['name']}  {root['dur'] / 1000:.1f}ms  (trace {root['args']['trace']})")
+    print(f"{'偏移(ms)':>9} {'耗时(ms)':>9} {'通道':>4}  span")
+
+    def walk(event: dict, depth: int) -> None:
+        args = {key: value for key, value in event["args"].items() if key not in ("trace", "span", "parent")}
+        extra = f"  {json.dumps(args, ensure_ascii=False)}" if args else ""
+        print(f"{(event['ts'] - root['ts']) / 1000:>9.1f} {event['dur'] / 1000:>9.1f} {event['tid']:>4}  "
+              f"{'  ' * depth}{event['name']}{extra}")
+        for child in sorted(children[event["args"]["span"]], key=lambda child: child["ts"]):
+            walk(child, depth + 1)
+
+    walk(root, 0)
+    for event in sorted(orphans, key=lambda event: event["ts"]):
+        walk(event, 1)
+
+
+def write_chrome(traces: Dict[str, List[dict]], path: str) -> None:
+    """每个 trace 一个进程 (pid 按顺序编号，避免重复的 update_id 混在一起)"""
+    events = []
+    for pid, spans in enumerate(traces.values(), 1):
+        root = root_of(spans)
+        events.append({"name": "process_name", "ph": "M", "pid": pid,
+                       "args": {"name": f"{root['name']} #{root['pid']}"}})
+        for lane in sorted({span["tid"] for span in spans}):
+            events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": lane,
+                           "args": {"name": "处理更新" if lane == 0 else f"派生任务 {lane}"}})
+        events.extend({**span, "pid": pid} for span in spans)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f, ensure_ascii=False)
+    print(f"已写入 {path}：{len(traces)} 个更新，可在 https://ui.perfetto.dev 中打开")
+
+
+def main(args: argparse.Namespace) -> int:
+    traces = load(args.file)
+    if not traces:
+        print(f"{args.file} 中没有 span")
+        return 1
+
+    trace_id = None
+    if args.slowest:
+        trace_id = max(traces, key=lambda key: summarize(traces[key])["total_ms"])
+    elif args.update is not None:
+        trace_id = find(traces, args.update)
+        if trace_id is None:
+            print(f"没有更新 {args.update} 的 span")
+            return 1
+    if trace_id is not None:
+        selected = {trace_id: traces[trace_id]}
+        print_timeline(traces[trace_id])
+    else:
+        selected = traces
+        print_top(traces, args.top)
+
+    if args.chrome:
+        write_chrome(selected, args.chrome)
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("file", nargs="?", default="traces.jsonl")
+    parser.add_argument("--top", type=int, default=20, help="列出的最慢更新数")
+    parser.add_argument("--update", type=int, help="打印该 update_id 的时间线")
+    parser.add_argument("--slowest", action="store_true", help="打印最慢的更新的时间线")
+    parser.add_argument("--chrome", help="输出可在 Perfetto / chrome://tracing 中打开的 JSON")
+    sys.exit(main(parser.parse_args()))